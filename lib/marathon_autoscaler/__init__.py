@@ -1,15 +1,29 @@
 from . import *
 
-__all__ = ["apiclientbase",
+__all__ = ["aggregation",
+           "apiclientbase",
            "application_definition",
+           "application_registry",
+           "capacity",
+           "collector",
            "constants",
            "datadog_metrics",
+           "deployment_tracker",
+           "flap_detector",
+           "forecasting",
+           "history_journal",
            "history_manager",
+           "json_decoding",
            "marathon",
+           "marathon_events",
+           "masterclientbase",
            "mesosagent",
            "mesosmaster",
            "poller",
            "rule_manager",
+           "rule_metrics",
+           "rules_evaluator",
+           "scale_dispatcher",
            "scaler",
            "settings",
            "utils"]
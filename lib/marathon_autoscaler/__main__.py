@@ -4,6 +4,7 @@ import logging
 import logging.config
 import os
 import pkg_resources
+import signal
 import sys
 from poller import Poller
 import settings
@@ -43,6 +44,15 @@ class EnvDefault(argparse.Action):
         setattr(namespace, self.dest, values)
 
 
+def exit_on_signal(signum, frame):
+    """
+    Turns a termination signal into a regular interpreter exit so atexit handlers
+    (such as the agent collector's worker pool shutdown) get to run.
+    """
+    logging.info("Received signal {0}, shutting down.".format(signum))
+    sys.exit(0)
+
+
 def parse_cli_args():
     """
     A method for organizing all commandline argument and environment variable parsing.
@@ -53,6 +63,9 @@ def parse_cli_args():
                    default=5, help="The time duration in seconds between polling events")
     p.add_argument("--mesos-uri", dest="mesos_uri", action=EnvDefault, envvar="MESOS_URI", type=str, required=True,
                    help="The Mesos Endpoint")
+    p.add_argument("--mesos-leader-ttl", dest="mesos_leader_ttl", action=EnvDefault, envvar="MESOS_LEADER_TTL",
+                   type=int, default=60, required=False,
+                   help="Seconds the leading Mesos master is cached before it is resolved again")
     p.add_argument("--agent-port", dest="agent_port", action=EnvDefault, envvar="AGENT_PORT", type=int,
                    required=True, default=5051, help="Mesos Agent Port")
     p.add_argument("--marathon-uri", dest="marathon_uri", action=EnvDefault, envvar="MARATHON_URI", type=str,
@@ -61,8 +74,44 @@ def parse_cli_args():
                    required=False, help="The Marathon Username", default=None)
     p.add_argument("--marathon-pass", dest="marathon_pass", action=EnvDefault, envvar="MARATHON_PASS", type=str,
                    required=False, help="The Marathon Password", default=None)
+    p.add_argument("--marathon-events", dest="marathon_events", action=EnvDefault, envvar="MARATHON_EVENTS",
+                   type=bool, default=False, required=False,
+                   help="If set, Marathon applications are cached and kept current from the /v2/events stream")
+    p.add_argument("--marathon-resync-interval", dest="marathon_resync_interval", action=EnvDefault,
+                   envvar="MARATHON_RESYNC_INTERVAL", type=int, default=300, required=False,
+                   help="Seconds between full application fetches while following the Marathon event stream")
     p.add_argument("--cpu-fan-out", dest="cpu_fan_out", action=EnvDefault, envvar="CPU_FAN_OUT", type=int,
-                   default=None, required=False, help="Number of subprocesses to use for gathering and sending stats to Datadog")
+                   default=None, required=False, help="Max number of concurrent Mesos agent statistics requests")
+    p.add_argument("--agent-timeout", dest="agent_timeout", action=EnvDefault, envvar="AGENT_TIMEOUT", type=float,
+                   default=5.0, required=False,
+                   help="Seconds a Mesos agent may take to return its statistics before it is skipped for the cycle")
+    p.add_argument("--single-scrape", dest="single_scrape", action=EnvDefault, envvar="SINGLE_SCRAPE", type=bool,
+                   default=False, required=False,
+                   help="If set, agents are queried once per cycle and differentials are taken against the previous cycle")
+    p.add_argument("--target-participating-agents", dest="target_participating_agents", action=EnvDefault,
+                   envvar="TARGET_PARTICIPATING_AGENTS", type=bool, default=False, required=False,
+                   help="If set, only agents running participating applications are queried "
+                        "(ignored while Datadog metrics are exported)")
+    p.add_argument("--numpy-aggregation", dest="numpy_aggregation", action=EnvDefault, envvar="NUMPY_AGGREGATION",
+                   type=bool, default=False, required=False,
+                   help="If set and NumPy is installed, executor statistics are aggregated in vectorized passes")
+    p.add_argument("--numpy-rules", dest="numpy_rules", action=EnvDefault, envvar="NUMPY_RULES", type=bool,
+                   default=False, required=False,
+                   help="If set and NumPy is installed, every application's rules are matched in vectorized passes")
+    p.add_argument("--http-pool-size", dest="http_pool_size", action=EnvDefault, envvar="HTTP_POOL_SIZE", type=int,
+                   default=10, required=False, help="Max number of keep-alive connections per host and client")
+    p.add_argument("--http-connect-timeout", dest="http_connect_timeout", action=EnvDefault,
+                   envvar="HTTP_CONNECT_TIMEOUT", type=float, default=3.05, required=False,
+                   help="Seconds to wait for a connection to Mesos or Marathon")
+    p.add_argument("--http-read-timeout", dest="http_read_timeout", action=EnvDefault, envvar="HTTP_READ_TIMEOUT",
+                   type=float, default=30, required=False,
+                   help="Seconds to wait for Mesos or Marathon to answer")
+    p.add_argument("--http-retries", dest="http_retries", action=EnvDefault, envvar="HTTP_RETRIES", type=int,
+                   default=2, required=False,
+                   help="Number of times a GET is retried after a connection error or timeout, or a PUT that could not connect")
+    p.add_argument("--http-retry-backoff", dest="http_retry_backoff", action=EnvDefault, envvar="HTTP_RETRY_BACKOFF",
+                   type=float, default=0.5, required=False,
+                   help="Seconds before the first retry; doubled for every further retry, with jitter")
     p.add_argument("--dd-api-key", dest="datadog_api_key", action=EnvDefault, envvar="DATADOG_API_KEY", type=str,
                    required=False, help="Datadog API key")
     p.add_argument("--dd-app-key", dest="datadog_app_key", action=EnvDefault, envvar="DATADOG_APP_KEY", type=str,
@@ -75,6 +124,55 @@ def parse_cli_args():
     p.add_argument("--enforce-version-match", dest="enforce_version_match", action=EnvDefault,
                    envvar="ENFORCE_VERSION_MATCH", type=bool, default=False,
                    required=False, help="If set, version matching will be required of applications to participate")
+    p.add_argument("--history-max-events", dest="history_max_events", action=EnvDefault,
+                   envvar="HISTORY_MAX_EVENTS", type=int, default=5000000, required=False,
+                   help="Max number of decision history events kept across all applications")
+    p.add_argument("--history-journal", dest="history_journal", action=EnvDefault, envvar="HISTORY_JOURNAL",
+                   type=str, default=None, required=False,
+                   help="Path of a journal the decision history is recorded to and recovered from on start")
+    p.add_argument("--history-journal-max-bytes", dest="history_journal_max_bytes", action=EnvDefault,
+                   envvar="HISTORY_JOURNAL_MAX_BYTES", type=int, default=64 * 1024 * 1024, required=False,
+                   help="Size at which the history journal is compacted")
+    p.add_argument("--flap-signatures", dest="flap_signatures", action=EnvDefault, envvar="FLAP_SIGNATURES",
+                   type=str, default=None, required=False,
+                   help="Decision sequences reported as flapping, separated by semicolons, e.g. 1,-1,1,-1;-1,1,-1,1")
+    p.add_argument("--flap-window", dest="flap_window", action=EnvDefault, envvar="FLAP_WINDOW", type=str,
+                   default=None, required=False,
+                   help="ISO8601 time duration a flapping sequence must happen within to be reported")
+    p.add_argument("--rules-cache-size", dest="rules_cache_size", action=EnvDefault, envvar="RULES_CACHE_SIZE",
+                   type=int, default=10000, required=False,
+                   help="Max number of application versions whose compiled rules are kept")
+    p.add_argument("--target-max-step", dest="target_max_step", action=EnvDefault, envvar="TARGET_MAX_STEP",
+                   type=int, default=10, required=False,
+                   help="Max number of instances a target tracking rule scales by at once, unless the rule sets one")
+    p.add_argument("--forecast-horizon", dest="forecast_horizon", action=EnvDefault, envvar="FORECAST_HORIZON",
+                   type=str, default="PT2M", required=False,
+                   help="ISO8601 time duration ahead that *_forecast rule metrics are forecast")
+    p.add_argument("--forecast-alpha", dest="forecast_alpha", action=EnvDefault, envvar="FORECAST_ALPHA",
+                   type=float, default=0.5, required=False, help="Smoothing of the forecast level (0-1)")
+    p.add_argument("--forecast-beta", dest="forecast_beta", action=EnvDefault, envvar="FORECAST_BETA",
+                   type=float, default=0.1, required=False, help="Smoothing of the forecast trend (0-1)")
+    p.add_argument("--forecast-gamma", dest="forecast_gamma", action=EnvDefault, envvar="FORECAST_GAMMA",
+                   type=float, default=0.1, required=False, help="Smoothing of the forecast seasonality (0-1)")
+    p.add_argument("--forecast-season", dest="forecast_season", action=EnvDefault, envvar="FORECAST_SEASON",
+                   type=str, default=None, required=False,
+                   help="ISO8601 time duration of the forecast seasonality, e.g. P1D (no seasonality by default)")
+    p.add_argument("--capacity-admission", dest="capacity_admission", action=EnvDefault, envvar="CAPACITY_ADMISSION",
+                   type=bool, default=False, required=False,
+                   help="If set, scale-ups are limited to the instances the Mesos agents have free resources for")
+    p.add_argument("--queue-max-count", dest="queue_max_count", action=EnvDefault, envvar="QUEUE_MAX_COUNT", type=int,
+                   default=None, required=False,
+                   help="Max number of instances waiting in the launch queue an application is scaled up with")
+    p.add_argument("--queue-max-delay", dest="queue_max_delay", action=EnvDefault, envvar="QUEUE_MAX_DELAY",
+                   type=float, default=None, required=False,
+                   help="Max seconds of launch delay an application is scaled up with")
+    p.add_argument("--scale-concurrency", dest="scale_concurrency", action=EnvDefault, envvar="SCALE_CONCURRENCY",
+                   type=int, default=8, required=False, help="Max number of concurrent Marathon scale requests")
+    p.add_argument("--scale-rate", dest="scale_rate", action=EnvDefault, envvar="SCALE_RATE", type=float,
+                   default=10, required=False, help="Max number of Marathon scale requests per second (0 for no limit)")
+    p.add_argument("--scale-burst", dest="scale_burst", action=EnvDefault, envvar="SCALE_BURST", type=int,
+                   default=20, required=False,
+                   help="Max number of Marathon scale requests sent at once before --scale-rate applies")
     p.add_argument("--rules-prefix", dest="rules_prefix", action=EnvDefault,
                    envvar="RULES_PREFIX", type=str, default="mas_rule",
                    required=False, help="The prefix for rule names")
@@ -90,6 +188,7 @@ if __name__ == "__main__":
     add_args_to_settings(args)
     setup_logging(args)
     logging.info(args)
+    signal.signal(signal.SIGTERM, exit_on_signal)
     poller = Poller(args)
     poller.start()
     sys.exit(0)
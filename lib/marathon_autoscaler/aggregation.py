@@ -0,0 +1,233 @@
+from collections import defaultdict
+import logging
+import math
+from operator import eq, itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STATISTICS_COUNTERS = ("cpus_user_time_secs", "cpus_system_time_secs", "timestamp",
+                       "mem_limit_bytes", "mem_rss_bytes")
+DEFAULT_PERCENTILES = (95,)
+
+
+class ExecutorStatsAggregator(object):
+    """
+    Turns two samples of executor statistics into the per application metric summary consumed by the
+    autoscaler and the Datadog client:
+    {
+        "{{ app }}": {
+            "cpu_avg_usage", "max_cpu": (usage, executor_id, host),
+            "memory_avg_usage", "max_memory": (usage, executor_id, host),
+            "cpu_p{{ q }}_usage", "memory_p{{ q }}_usage",
+            "executor_metrics": [ executor differentials ]
+        }
+    }
+    By default every executor is visited once in pure Python. With use_numpy (and NumPy installed) the
+    samples are loaded into columns and every application is summarized in a handful of vectorized
+    passes; the arithmetic is faster, but building the columns from, and the executor metrics back
+    into, Python objects dominates at the sizes we have measured (see tests/benchmarks).
+    """
+    def __init__(self, percentiles=DEFAULT_PERCENTILES, use_numpy=False, logger=None):
+        """
+        :param percentiles: Percentiles (0-100) of cpu and memory usage to add to each summary
+        :param use_numpy: Use the vectorized implementation when NumPy is available
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.percentiles = tuple(percentiles)
+        self.use_numpy = use_numpy and np is not None
+
+    def summarize(self, previous_stats, current_stats, app_key_for_executor, extended_counters=()):
+        """
+        Executors without a previous sample (new), without a current sample (gone), that moved hosts
+        or whose counters went backwards (restarted) are left out until a comparable sample exists.
+        :param previous_stats: dict of executor id to host and statistics from the earlier sample
+        :param current_stats: dict of executor id to host and statistics from the later sample
+        :param app_key_for_executor: function resolving an executor id to its application
+        :param extended_counters: Further statistics whose differentials are added to the executor metrics
+                                  (where both samples have them and they did not go backwards)
+        :return: dict of application to metric summary
+        """
+        executor_ids = [key for key in current_stats if key in previous_stats]
+        if not executor_ids:
+            return {}
+        if self.use_numpy:
+            return self._summarize_columns(executor_ids, previous_stats, current_stats, app_key_for_executor,
+                                           extended_counters)
+        return self._summarize_rows(executor_ids, previous_stats, current_stats, app_key_for_executor,
+                                    extended_counters)
+
+    def _summarize_rows(self, executor_ids, previous_stats, current_stats, app_key_for_executor, extended_counters):
+        app_metric_map = defaultdict(list)
+        for key in executor_ids:
+            previous, current = previous_stats[key], current_stats[key]
+            host = current.get("host")
+            first_stats = previous.get("stats")
+            second_stats = current.get("stats")
+
+            if "timestamp" not in second_stats or "timestamp" not in first_stats:
+                self.logger.error("Timestamps were not found in stats from host: {0}".format(host))
+                continue
+
+            sys_cpu_delta = second_stats["cpus_system_time_secs"] - first_stats["cpus_system_time_secs"]
+            user_cpu_delta = second_stats["cpus_user_time_secs"] - first_stats["cpus_user_time_secs"]
+            timestamp_delta = second_stats["timestamp"] - first_stats["timestamp"]
+
+            if host != previous.get("host") or timestamp_delta <= 0 or sys_cpu_delta < 0 or user_cpu_delta < 0:
+                self.logger.debug("{0}: counters reset on host {1}, skipping this sample".format(key, host))
+                continue
+
+            executor_metric = dict(
+                timestamp=timestamp_delta,
+                cpus_system_time_secs=sys_cpu_delta,
+                cpus_user_time_secs=user_cpu_delta,
+                cpu_total_usage=((sys_cpu_delta + user_cpu_delta) / timestamp_delta) * 100,
+                memory_total_usage=(float(second_stats["mem_rss_bytes"]) / second_stats["mem_limit_bytes"]) * 100,
+                host=host,
+                executor_id=key)
+            for counter in extended_counters:
+                if counter in first_stats and counter in second_stats and \
+                        second_stats[counter] >= first_stats[counter]:
+                    executor_metric[counter] = second_stats[counter] - first_stats[counter]
+            app_metric_map[app_key_for_executor(key)].append(executor_metric)
+
+        app_metric_summation = {}
+        for app, metrics in app_metric_map.items():
+            cpu_sum = memory_sum = 0.0
+            max_cpu = max_memory = None
+            for metric in metrics:
+                cpu = (metric["cpu_total_usage"], metric["executor_id"], metric["host"])
+                memory = (metric["memory_total_usage"], metric["executor_id"], metric["host"])
+                cpu_sum += cpu[0]
+                memory_sum += memory[0]
+                max_cpu = cpu if max_cpu is None or cpu > max_cpu else max_cpu
+                max_memory = memory if max_memory is None or memory > max_memory else max_memory
+
+            metric_sums = dict(cpu_avg_usage=cpu_sum / len(metrics),
+                               max_cpu=max_cpu,
+                               memory_avg_usage=memory_sum / len(metrics),
+                               max_memory=max_memory,
+                               executor_metrics=metrics)
+            if self.percentiles:
+                cpu_values = sorted(metric["cpu_total_usage"] for metric in metrics)
+                memory_values = sorted(metric["memory_total_usage"] for metric in metrics)
+                for q in self.percentiles:
+                    metric_sums["cpu_p{0}_usage".format(q)] = self._percentile(cpu_values, q)
+                    metric_sums["memory_p{0}_usage".format(q)] = self._percentile(memory_values, q)
+            app_metric_summation[app] = metric_sums
+        return app_metric_summation
+
+    @staticmethod
+    def _percentile(sorted_values, q):
+        """
+        Linear interpolation between closest ranks, as numpy.percentile does by default.
+        :param sorted_values: A sorted, non-empty list of numbers
+        :param q: Percentile (0-100)
+        :return: float
+        """
+        position = (len(sorted_values) - 1) * q / 100.0
+        low = int(math.floor(position))
+        high = min(low + 1, len(sorted_values) - 1)
+        return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+    def _summarize_columns(self, executor_ids, previous_stats, current_stats, app_key_for_executor,
+                           extended_counters):
+        first = self._load_columns(previous_stats, executor_ids, STATISTICS_COUNTERS[:3])
+        second = self._load_columns(current_stats, executor_ids, STATISTICS_COUNTERS)
+        hosts = [current_stats[key]["host"] for key in executor_ids]
+        same_host = np.array(list(map(eq, [previous_stats[key]["host"] for key in executor_ids], hosts)), dtype=bool)
+
+        missing_timestamps = np.isnan(first[:, 2]) | np.isnan(second[:, 2])
+        for index in np.flatnonzero(missing_timestamps):
+            self.logger.error("Timestamps were not found in stats from host: {0}".format(hosts[index]))
+
+        deltas = second[:, :3] - first
+        with np.errstate(invalid="ignore"):
+            valid = ~missing_timestamps & same_host & (deltas[:, 2] > 0) & (deltas >= 0).all(axis=1)
+        for index in np.flatnonzero(~valid & ~missing_timestamps):
+            self.logger.debug("{0}: counters reset on host {1}, skipping this sample".format(executor_ids[index],
+                                                                                             hosts[index]))
+
+        # one row per comparable executor, grouped by application; applications without any are left out
+        rows = np.flatnonzero(valid)
+        if rows.size == 0:
+            return {}
+        app_keys = [app_key_for_executor(executor_ids[row]) for row in rows.tolist()]
+        app_index = dict((app, code) for code, app in enumerate(dict.fromkeys(app_keys)))
+        app_codes = np.array(list(map(app_index.__getitem__, app_keys)), dtype=np.int64)
+        order = np.argsort(app_codes, kind="mergesort")
+        rows, app_codes = rows[order], app_codes[order]
+        executor_ids = list(map(executor_ids.__getitem__, rows.tolist()))
+        hosts = list(map(hosts.__getitem__, rows.tolist()))
+        user_cpu_delta, sys_cpu_delta, timestamp_delta = deltas[rows, 0], deltas[rows, 1], deltas[rows, 2]
+        cpu_usage = (sys_cpu_delta + user_cpu_delta) / timestamp_delta * 100
+        memory_usage = second[rows, 4] / second[rows, 3] * 100
+
+        counts = np.bincount(app_codes, minlength=len(app_index))
+        group_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        group_ends = group_starts + counts - 1
+
+        summaries = {}
+        for metric, usage in (("cpu", cpu_usage), ("memory", memory_usage)):
+            # ascending by usage within each application: the group's last row is its maximum
+            order = np.lexsort((usage, app_codes))
+            sorted_usage = usage[order]
+            summaries[metric + "_avg_usage"] = (np.bincount(app_codes, weights=usage) / counts).tolist()
+            summaries["max_" + metric] = order[group_ends].tolist()
+            for q in self.percentiles:
+                position = group_starts + (counts - 1) * q / 100.0
+                low = np.floor(position).astype(np.int64)
+                high = np.minimum(low + 1, group_ends)
+                summaries["{0}_p{1}_usage".format(metric, q)] = \
+                    (sorted_usage[low] + (sorted_usage[high] - sorted_usage[low]) * (position - low)).tolist()
+
+        cpu_usage, memory_usage = cpu_usage.tolist(), memory_usage.tolist()
+        executor_metrics = [{"timestamp": timestamp, "cpus_system_time_secs": sys_cpu, "cpus_user_time_secs": user_cpu,
+                             "cpu_total_usage": cpu, "memory_total_usage": memory, "host": host, "executor_id": key}
+                            for timestamp, sys_cpu, user_cpu, cpu, memory, host, key in
+                            zip(timestamp_delta.tolist(), sys_cpu_delta.tolist(), user_cpu_delta.tolist(),
+                                cpu_usage, memory_usage, hosts, executor_ids)]
+        if extended_counters:
+            extended_deltas = self._load_columns(current_stats, executor_ids, extended_counters) - \
+                self._load_columns(previous_stats, executor_ids, extended_counters)
+            for column, counter in enumerate(extended_counters):
+                for executor_metric, delta in zip(executor_metrics, extended_deltas[:, column].tolist()):
+                    if delta >= 0:
+                        executor_metric[counter] = delta
+
+        app_metric_summation = {}
+        percentile_keys = ["{0}_p{1}_usage".format(metric, q) for metric in ("cpu", "memory")
+                           for q in self.percentiles]
+        group_starts, group_ends = group_starts.tolist(), group_ends.tolist()
+        for app, code in app_index.items():
+            max_cpu, max_memory = summaries["max_cpu"][code], summaries["max_memory"][code]
+            metric_sums = dict(cpu_avg_usage=summaries["cpu_avg_usage"][code],
+                               max_cpu=(cpu_usage[max_cpu], executor_ids[max_cpu], hosts[max_cpu]),
+                               memory_avg_usage=summaries["memory_avg_usage"][code],
+                               max_memory=(memory_usage[max_memory], executor_ids[max_memory], hosts[max_memory]),
+                               executor_metrics=executor_metrics[group_starts[code]:group_ends[code] + 1])
+            for key in percentile_keys:
+                metric_sums[key] = summaries[key][code]
+            app_metric_summation[app] = metric_sums
+        return app_metric_summation
+
+    @staticmethod
+    def _load_columns(samples, executor_ids, counters):
+        """
+        :param samples: dict of executor id to host and statistics
+        :param executor_ids: The executors to load, one row each
+        :param counters: The statistics to load, one column each
+        :return: 2d float array, NaN where an executor lacks a statistic
+        """
+        getter = itemgetter(*counters)
+        try:
+            columns = np.array([getter(samples[key]["stats"]) for key in executor_ids], dtype=np.float64)
+        except KeyError:
+            nan = float("nan")
+            columns = np.array([[samples[key]["stats"].get(counter, nan) for counter in counters]
+                                for key in executor_ids], dtype=np.float64)
+        # itemgetter of a single counter returns the value itself rather than a 1-tuple
+        return columns.reshape(len(executor_ids), len(counters))
@@ -1,18 +1,88 @@
-import json
+import json_decoding
 import logging
+import random
 import requests
+from requests.adapters import HTTPAdapter
+import settings
+import time
+from urllib3.exceptions import NewConnectionError
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+# Retried whenever they fail to connect or time out
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Retried only when the connection could not be established: once the request is sent, the server may
+# have acted on it (a scale PUT may have started a deployment) even though no response came back
+IDEMPOTENT_METHODS = ("PUT", "DELETE")
 
 
 class ApiClientBase(object):
-    def __init__(self, uri, creds=None, logger=None):
+    """
+    Every client owns a keep-alive session, so its calls reuse pooled connections. Pool size, timeouts and
+    retries come from the http_* settings. Safe calls that fail to connect or time out, and idempotent calls
+    that fail to connect, are retried with an exponential, jittered backoff.
+    """
+    def __init__(self, uri, creds=None, logger=None, timeout=None, retries=None):
         """
         :param uri:
         :param creds:
+        :param timeout: Seconds to wait for the server before giving up (defaults to the connect and read
+                        timeout settings)
+        :param retries: Max number of times a failed call is retried (defaults to the retries setting)
         :return:
         """
         self.auth = creds
+        self.timeout = timeout if timeout is not None else (
+            getattr(settings, "http_connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            getattr(settings, "http_read_timeout", DEFAULT_READ_TIMEOUT))
+        self.retries = retries if retries is not None else getattr(settings, "http_retries", DEFAULT_RETRIES)
+        self.retry_backoff = getattr(settings, "http_retry_backoff", DEFAULT_RETRY_BACKOFF)
         self.uri = uri.rstrip('/')
         self.logger = logger or logging.getLogger(__name__)
+        pool_size = getattr(settings, "http_pool_size", DEFAULT_POOL_SIZE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.request_count = 0
+        self.retry_count = 0
+
+    def connection_stats(self):
+        """
+        :return: dict of the requests made, the retries among them and the connections opened to serve them
+        """
+        connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                connections += getattr(pool, "num_connections", 0) if pool is not None else 0
+        return dict(requests=self.request_count,
+                    retries=self.retry_count,
+                    connections=connections,
+                    reused=max(self.request_count - connections, 0))
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        :return: None
+        """
+        self.session.close()
+
+    @staticmethod
+    def _is_connect_error(error):
+        """
+        :param error: A requests exception
+        :return: (bool) whether the request failed before a connection was established, so was never sent
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            return isinstance(getattr(error.args[0], "reason", error.args[0]), NewConnectionError)
+        return False
 
     @staticmethod
     def _build_path(path_suffix, **kwargs):
@@ -30,6 +100,14 @@ class ApiClientBase(object):
         :param kwargs:
         :return:
         """
+        return self._call_endpoint_with_status(path, **kwargs)[1]
+
+    def _call_endpoint_with_status(self, path, **kwargs):
+        """
+        :param path:
+        :param kwargs:
+        :return: tuple of the HTTP status (None without a response) and the decoded response
+        """
         do_request_kwargs = {"params": None, "data": None}
         if "params" in kwargs.keys():
             do_request_kwargs["params"] = kwargs.pop("params")
@@ -41,13 +119,12 @@ class ApiClientBase(object):
         response = self._do_request(verb, self._build_path(path, **kwargs), **do_request_kwargs)
         result = None
         if response is not None:
-            contents = response.content.decode('utf-8')
             try:
-                result = json.loads(contents)
+                result = json_decoding.loads(response.content)
             except ValueError as _:
                 result = response
 
-        return result
+        return (response.status_code if response is not None else None), result
 
     def _do_request(self, method, path, params=None, data=None):
         """
@@ -60,11 +137,27 @@ class ApiClientBase(object):
         headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
         response = None
         url = "".join([self.uri, path])
-        try:
-            response = requests.request(method, url, params=params,
-                                        data=data,
-                                        headers=headers,
-                                        auth=self.auth)
-        except requests.exceptions.RequestException as e:
-            self.logger.error(e)
+        safe = method.upper() in SAFE_METHODS
+        attempts = 1 + (self.retries if safe or method.upper() in IDEMPOTENT_METHODS else 0)
+        for attempt in range(attempts):
+            if attempt:
+                self.retry_count += 1
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            try:
+                self.request_count += 1
+                response = self.session.request(method, url, params=params,
+                                                data=data,
+                                                headers=headers,
+                                                auth=self.auth,
+                                                timeout=self.timeout)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt + 1 < attempts and (safe or self._is_connect_error(e)):
+                    self.logger.debug("{0} {1}: attempt {2} failed, retrying: {3}".format(method, url, attempt + 1, e))
+                else:
+                    self.logger.error(e)
+                    break
+            except requests.exceptions.RequestException as e:
+                self.logger.error(e)
+                break
         return response
@@ -0,0 +1,83 @@
+from application_definition import ApplicationDefinition
+import logging
+
+
+class ApplicationRegistry(object):
+    """
+    A polling-cycle scoped index of the Marathon application definitions returned by /v2/apps.
+    Applications are keyed by their escaped application id, the form Marathon uses as the prefix
+    of its task (and executor) ids: the id without its leading slash and with the group separators
+    replaced by underscores, e.g. /team/svc/api -> team_svc_api.
+    """
+    def __init__(self, marathon_apps, logger=None):
+        """
+        :param marathon_apps: list of Marathon application definitions
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.apps = {}
+        self.executor_index = {}
+        for app_def in marathon_apps or []:
+            app_id = app_def.get("id")
+            if not app_id:
+                continue
+            app_key = self.escape_app_id(app_id)
+            self.apps[app_key] = app_def
+            for task in app_def.get("tasks") or []:
+                if task.get("id"):
+                    self.executor_index[task.get("id")] = app_key
+
+    @staticmethod
+    def escape_app_id(app_id):
+        """
+        :param app_id: A Marathon application id (/team/svc/api) or an already escaped one (team_svc_api)
+        :return: The escaped application id (team_svc_api)
+        """
+        return app_id.strip("/").replace("/", "_")
+
+    def __len__(self):
+        return len(self.apps)
+
+    def __contains__(self, app_key):
+        return self.escape_app_id(app_key) in self.apps
+
+    def get(self, app_id, default=None):
+        """
+        :param app_id: A Marathon application id, with or without its leading slash, or its escaped form
+        :param default: Returned when the application is unknown
+        :return: The application definition
+        """
+        return self.apps.get(self.escape_app_id(app_id), default)
+
+    def participating_hosts(self):
+        """
+        The agents running tasks of participating applications. Requires the application definitions
+        to have been retrieved with their tasks embedded (/v2/apps?embed=apps.tasks).
+        :return: set of agent hosts
+        """
+        return set(task.get("host")
+                   for app_def in self.apps.values()
+                   if ApplicationDefinition(app_def).is_app_participating
+                   for task in app_def.get("tasks") or []
+                   if task.get("host"))
+
+    def app_key_for_executor(self, executor_id):
+        """
+        Resolves the application an executor belongs to. Marathon task ids are the escaped application
+        id followed by one or more dot separated suffixes, and application ids may themselves contain
+        dots, so the longest dot delimited prefix naming a known application wins. Executors of other
+        frameworks fall back to the part before the first dot.
+        :param executor_id: A Mesos executor id
+        :return: The escaped application id
+        """
+        app_key = self.executor_index.get(executor_id)
+        if app_key is None:
+            app_key = executor_id.split(".")[0]
+            end = executor_id.rfind(".")
+            while end > 0:
+                if executor_id[:end] in self.apps:
+                    app_key = executor_id[:end]
+                    break
+                end = executor_id.rfind(".", 0, end)
+            self.executor_index[executor_id] = app_key
+        return app_key
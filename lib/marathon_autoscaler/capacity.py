@@ -0,0 +1,130 @@
+import logging
+import re
+
+RE_PORT_RANGE = re.compile(r"(\d+)\s*-\s*(\d+)")
+
+
+def port_count(ranges):
+    """
+    :param ranges: Mesos port ranges, e.g. "[31000-32000, 33000-33000]"
+    :return: Number of ports in the ranges
+    """
+    if not ranges:
+        return 0
+    return sum(int(end) - int(begin) + 1 for begin, end in RE_PORT_RANGE.findall(str(ranges)))
+
+
+def instance_ports(app_def):
+    """
+    :param app_def: ApplicationDefinition
+    :return: Number of host ports every instance of the application takes
+    """
+    return len(app_def.portDefinitions or app_def.ports or [])
+
+
+class ClusterCapacity(object):
+    """
+    A model of the unreserved resources (cpus, mem and ports) free on every Mesos agent, so scale-ups can
+    be admitted only as far as the cluster can place the new tasks, instead of piling unplaceable tasks
+    up in Marathon's launch queue. The model is fed the /master/slaves response the poller fetches every
+    cycle and only recomputes the agents whose resources changed; instances admitted are taken out of
+    the model until the next update. Placement constraints are not modeled.
+    """
+    def __init__(self, logger=None):
+        """
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.free = {}
+        self.sources = {}
+        self.agents = {}
+
+    @property
+    def known(self):
+        """
+        :return: (bool) whether the model has been fed any agents
+        """
+        return bool(self.agents)
+
+    @staticmethod
+    def _free(slave):
+        """
+        :param slave: An agent of the /master/slaves response
+        :return: list of the agent's free unreserved cpus, mem and ports
+        """
+        resources = slave.get("resources") or {}
+        used = slave.get("used_resources") or {}
+        unreserved = slave.get("unreserved_resources") or resources
+        free = []
+        for name, count in (("cpus", float), ("mem", float), ("ports", port_count)):
+            total = count(resources.get(name) or 0)
+            free.append(max(min(count(unreserved.get(name) or 0), total - count(used.get(name) or 0)), 0))
+        return free
+
+    def update(self, slaves):
+        """
+        Brings the model up to date with the agents' resources; only agents whose resources changed are
+        recomputed, and agents that are gone or inactive are dropped.
+        :param slaves: list of the agents of the /master/slaves response
+        :return: Number of agents recomputed
+        """
+        seen = set()
+        recomputed = 0
+        for slave in slaves or []:
+            agent_id = slave.get("id") or slave.get("hostname")
+            if not slave.get("active", True):
+                continue
+            seen.add(agent_id)
+            source = (slave.get("resources"), slave.get("used_resources"), slave.get("unreserved_resources"))
+            if self.sources.get(agent_id) != source:
+                self.sources[agent_id] = source
+                self.free[agent_id] = self._free(slave)
+                recomputed += 1
+        for agent_id in [key for key in self.free if key not in seen]:
+            del self.free[agent_id]
+            del self.sources[agent_id]
+        # what was admitted since the previous update is reflected in the agents' used resources by now
+        self.agents = dict((agent_id, list(free)) for agent_id, free in self.free.items())
+        return recomputed
+
+    def reset(self):
+        """
+        Forgets every agent, so the model is not known until the next update.
+        :return: None
+        """
+        self.free = {}
+        self.sources = {}
+        self.agents = {}
+
+    def admit(self, cpus, mem, ports, instances):
+        """
+        Places as many of the instances as fit on the agents (first fit) and takes their resources out of
+        the model.
+        :param cpus: cpus of one instance
+        :param mem: mem (MB) of one instance
+        :param ports: Number of ports of one instance
+        :param instances: Number of instances asked for
+        :return: Number of instances admitted
+        """
+        needs = (float(cpus or 0), float(mem or 0), int(ports or 0))
+        remaining = instances
+        for free in self.agents.values():
+            if remaining <= 0:
+                break
+            fits = min([remaining] + [int(free[index] // need) for index, need in enumerate(needs) if need > 0])
+            if fits > 0:
+                for index, need in enumerate(needs):
+                    free[index] -= fits * need
+                remaining -= fits
+        return instances - remaining
+
+    def totals(self):
+        """
+        :return: dict of the free unreserved cpus, mem and ports across all agents
+        """
+        totals = dict(cpus=0.0, mem=0.0, ports=0)
+        for cpus, mem, ports in self.agents.values():
+            totals["cpus"] += cpus
+            totals["mem"] += mem
+            totals["ports"] += ports
+        return totals
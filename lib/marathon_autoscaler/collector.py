@@ -0,0 +1,162 @@
+from multiprocessing.pool import ThreadPool
+import logging
+import time
+from mesosagent import MesosAgent
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+DEFAULT_AGENT_CONCURRENCY = 32
+DEFAULT_AGENT_TIMEOUT = 5.0
+EXPIRY_CHECK_INTERVAL = 0.1
+
+
+class AgentStatisticsCollector(object):
+    """
+    Scrapes the /monitor/statistics endpoint of many Mesos agents from within a single process.
+    Agent requests are I/O bound, so a long-lived, bounded set of threads multiplexes them without
+    the fork and pickling costs of a process pool. The pool, and one client (with its keep-alive
+    connection) per agent, are reused across polling cycles and must be released with close().
+    """
+    def __init__(self, agent_port, concurrency=None, agent_timeout=None, counters=None, logger=None):
+        """
+        :param agent_port: The port every Mesos agent listens on
+        :param concurrency: Max number of agent requests in flight at once
+        :param agent_timeout: Seconds an agent may take to answer once its request has started
+        :param counters: When given, only these executor statistics are kept from each agent's response
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.agent_port = agent_port
+        self.concurrency = concurrency or DEFAULT_AGENT_CONCURRENCY
+        self.agent_timeout = agent_timeout or DEFAULT_AGENT_TIMEOUT
+        self.counters = counters
+        self.pool = ThreadPool(processes=self.concurrency)
+        self.agents = {}
+
+    def get_agent(self, agent_host):
+        """
+        :param agent_host: A Mesos agent endpoint defined as an FQDN or IP Address
+        :return: The agent's client, created on first use. Its calls are not retried: a retry could only
+                 answer after the agent's deadline, when the statistics are no longer waited for.
+        """
+        agent = self.agents.get(agent_host)
+        if agent is None:
+            agent = MesosAgent("http://{0}:{1}/".format(agent_host, self.agent_port), timeout=self.agent_timeout,
+                               retries=0)
+            self.agents[agent_host] = agent
+        return agent
+
+    def connection_stats(self):
+        """
+        :return: dict of the requests made to, and the connections opened to, all agents
+        """
+        totals = dict(requests=0, retries=0, connections=0, reused=0)
+        for agent in list(self.agents.values()):
+            for name, value in agent.connection_stats().items():
+                totals[name] += value
+        return totals
+
+    def get_agent_statistics(self, agent_host):
+        """
+        :param agent_host: A Mesos agent endpoint defined as an FQDN or IP Address
+        :return: tuple of the agent host and its statistics (metrics) JSON
+        """
+        stats = None
+        try:
+            stats = self.get_agent(agent_host).get_statistics(counters=self.counters)
+        except Exception as ex:
+            self.logger.error("{0}: statistics could not be retrieved: {1}".format(agent_host, ex))
+        if stats is not None and not isinstance(stats, list):
+            self.logger.error("{0}: unexpected statistics response: {1}".format(agent_host, stats))
+            stats = None
+        return agent_host, stats
+
+    def _scrape_agent(self, agent_host, started, results):
+        """
+        The pool task: records when the request started and hands the statistics to the collecting cycle.
+        :param agent_host: A Mesos agent endpoint defined as an FQDN or IP Address
+        :param started: dict of agent host to the time its request started
+        :param results: Queue of (agent host, statistics) of the collecting cycle
+        :return: None
+        """
+        started[agent_host] = time.time()
+        results.put(self.get_agent_statistics(agent_host))
+
+    def collect(self, agent_hosts):
+        """
+        Retrieves the statistics of every agent, never running more than `concurrency` requests at once.
+        An agent that has not answered `agent_timeout` seconds after its request started is given up on,
+        so one slow agent cannot hold up the cycle. Nor can agents that keep threads busy past their deadline
+        (e.g. trickling their response) keep the requests queued behind them from ever starting: the whole
+        cycle is given up to `agent_timeout` seconds per round of `concurrency` requests, plus one, after
+        which every agent that has not answered is given up on. The clients of agents that were not asked
+        for are closed, so agents that left the cluster do not keep their connections open.
+        :param agent_hosts: list of Mesos agent hosts
+        :return: dict of agent host to statistics JSON (None when the agent could not be read in time)
+        """
+        agent_hosts_stats = {}
+        started = {}
+        results = Queue()
+        for agent_host in agent_hosts:
+            self.pool.apply_async(self._scrape_agent, (agent_host, started, results))
+
+        remaining = set(agent_hosts)
+        rounds = (len(remaining) + self.concurrency - 1) // self.concurrency
+        cycle_deadline = time.time() + self.agent_timeout * (rounds + 1)
+        next_deadline_check = time.time() + EXPIRY_CHECK_INTERVAL
+        while remaining:
+            try:
+                agent_host, stats = results.get(timeout=EXPIRY_CHECK_INTERVAL)
+                if agent_host in remaining:
+                    self.logger.debug((agent_host, stats))
+                    agent_hosts_stats[agent_host] = stats
+                    remaining.discard(agent_host)
+            except Empty:
+                pass
+
+            if time.time() < next_deadline_check:
+                continue
+            next_deadline_check = time.time() + EXPIRY_CHECK_INTERVAL
+            deadline = time.time() - self.agent_timeout
+            for agent_host in [host for host in remaining if started.get(host, deadline) < deadline]:
+                self.logger.warn("{0}: no statistics within {1}s, skipping".format(agent_host, self.agent_timeout))
+                agent_hosts_stats[agent_host] = None
+                remaining.discard(agent_host)
+
+            if remaining and time.time() >= cycle_deadline:
+                self.logger.warn("{0} agents gave no statistics within the cycle's {1:.1f}s, skipping: {2}".format(
+                    len(remaining), self.agent_timeout * (rounds + 1), ", ".join(sorted(remaining))))
+                for agent_host in remaining:
+                    agent_hosts_stats[agent_host] = None
+                remaining = set()
+
+        self.release_agents(agent_hosts)
+        return agent_hosts_stats
+
+    def release_agents(self, agent_hosts):
+        """
+        Closes and drops the clients of every agent but these.
+        :param agent_hosts: list of the Mesos agent hosts whose clients are kept
+        :return: Number of clients released
+        """
+        kept = set(agent_hosts)
+        released = [agent_host for agent_host in self.agents if agent_host not in kept]
+        for agent_host in released:
+            self.agents.pop(agent_host).close()
+        return len(released)
+
+    def close(self):
+        """
+        Stops the worker pool, waits for in-flight requests to finish and closes the agent connections.
+        :return: None
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for agent in self.agents.values():
+            agent.close()
+        self.agents = {}
@@ -1,14 +1,25 @@
+import operator
 import re
 
 __version__ = "0.0.3"
 
+# The operator module's functions, unlike lambdas, can be pickled along with the rules using them
 compare = {
-    ">=": lambda a, b: a >= b,
-    "<=": lambda a, b: a <= b,
-    "<": lambda a, b: a < b,
-    ">": lambda a, b: a > b,
-    "=": lambda a, b: a == b,
-    "==": lambda a, b: a == b
+    ">=": operator.ge,
+    "<=": operator.le,
+    "<": operator.lt,
+    ">": operator.gt,
+    "=": operator.eq,
+    "==": operator.eq
+}
+
+# Metric names rules may use for the metrics the autoscaler provides
+METRIC_ALIASES = {
+    "memory": "mem",
+    "memory_max": "mem_max",
+    "memory_p95": "mem_p95",
+    "max_cpu": "cpu_max",
+    "max_memory": "mem_max"
 }
 
 DOWN = -1
@@ -27,6 +38,7 @@ FLAP_SIGNATURES = [
 
 RE_VERSION_CHECK = re.compile(r"^\d+\.\d+\.\d+")
 RE_DELIMITERS = re.compile(r"[\s,|/]+")
+RE_TARGET = re.compile(r"^target=(?P<val>[+-]?\d+(:?\.\d*)?)$")
 RE_THRESHOLD = re.compile(r"(?P<op>[=><]{1,2})\s*(?P<val>[+-]?\d+(:?\.\d*)?(:?[eE][+-]?\d+)?)")
 #          capture group op ^     ^          ^
 #          any 1 or 2 variations   ^^^^^^^^^^ of =, >, <
@@ -106,6 +106,55 @@ class DatadogClient:
             except Exception as err:
                 self.logger.error(err)
 
+    def send_gauge(self, metric, points, tags=None):
+        """
+        marathon_autoscaler.history.* [tags- env:{env}]
+        :param metric: the metric name
+        :param points: the metric value(s)
+        :param tags: datadog tags for categorization
+        :return: None
+        """
+        if self.enabled:
+            all_tags = ["env:{}".format(self.dd_env)]
+
+            if tags:
+                all_tags = tags + all_tags
+
+            try:
+                api.Metric.send(metric=metric,
+                                points=points,
+                                tags=all_tags,
+                                type='gauge')
+            except Exception as err:
+                self.logger.error(err)
+
+    def send_app_gauges(self, metric, values, tags=None):
+        """
+        marathon_autoscaler.queue.depth [tags- app:{app_name} env:{env}]
+        Sends the gauge of every application in a single request.
+        :param metric: the metric name
+        :param values: dict of the metric value by application name
+        :param tags: datadog tags for categorization
+        :return: None
+        """
+        if self.enabled and values:
+            metrics = []
+            for app, value in values.items():
+                all_tags = ["env:{}".format(self.dd_env), "app:{}".format(app)]
+
+                if tags:
+                    all_tags = tags + all_tags
+
+                metrics.append(dict(metric=metric,
+                                    points=value,
+                                    tags=all_tags,
+                                    type='gauge'))
+
+            try:
+                api.Metric.send(metrics=metrics)
+            except Exception as err:
+                self.logger.error(err)
+
     def send_scale_event(self, app, factor, direction, tags=None):
         """
         marathon_autoscaler.events.scale_up [tags- app:{app_name} env:{env}]
@@ -0,0 +1,85 @@
+from collections import namedtuple
+import logging
+import time
+
+# A deployment started by a scale action: the application, the instances it was scaled to and when it was
+# decided on (seconds since the epoch)
+TrackedDeployment = namedtuple("TrackedDeployment", ["app_id", "app_name", "instances", "decided"])
+
+
+class DeploymentTracker(object):
+    """
+    Keeps track of Marathon's in-flight deployments, so an application is not scaled again while the
+    deployment of its previous scale (or any other deployment of it) is still running; Marathon would
+    queue or reject the new one. The deployment ids returned by scale actions are tracked until they
+    disappear from /v2/deployments, which is fetched once per cycle by refresh(); the time from the
+    decision to the completed deployment (the new instances are running, and healthy where the
+    application has health checks) is then reported per application.
+    """
+    def __init__(self, marathon_client, logger=None):
+        """
+        :param marathon_client: Marathon client
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.marathon_client = marathon_client
+        self.tracked = {}
+        self.tracked_apps = {}
+        self.outstanding = {}
+        self.completed = []
+
+    def track(self, action, outcome):
+        """
+        Tracks the deployment a scale action started.
+        :param action: ScaleAction
+        :param outcome: Its ScaleOutcome
+        :return: The deployment id (None when the action did not start a deployment)
+        """
+        deployment_id = outcome.response.get("deploymentId") if isinstance(outcome.response, dict) else None
+        if deployment_id is not None:
+            self.tracked[deployment_id] = TrackedDeployment(action.app_id, action.app_name, action.instances,
+                                                            action.decided)
+            self.tracked_apps[action.app_id] = deployment_id
+        return deployment_id
+
+    def refresh(self):
+        """
+        Fetches Marathon's deployments, forgets the tracked deployments that completed and records how long
+        each of them took since its decision. When the deployments cannot be fetched, the previous view is
+        kept, so tracked deployments keep holding their applications back.
+        :return: (bool) whether the deployments were fetched
+        """
+        try:
+            deployments = self.marathon_client.get_deployments()
+        except Exception as ex:
+            self.logger.error("Deployments could not be retrieved: {0}".format(ex))
+            return False
+        if not isinstance(deployments, list):
+            self.logger.error("Deployments could not be retrieved: {0}".format(deployments))
+            return False
+
+        outstanding = {}
+        for deployment in deployments:
+            for app_id in deployment.get("affectedApps") or []:
+                outstanding[app_id] = deployment.get("id")
+        deployment_ids = set(deployment.get("id") for deployment in deployments)
+
+        now = time.time()
+        self.completed = []
+        for deployment_id in [key for key in self.tracked if key not in deployment_ids]:
+            tracked = self.tracked.pop(deployment_id)
+            if self.tracked_apps.get(tracked.app_id) == deployment_id:
+                del self.tracked_apps[tracked.app_id]
+            ready = now - tracked.decided
+            self.completed.append((tracked.app_name, ready))
+            self.logger.info("{0}: {1} instances ready {2:.1f}s after the decision".format(
+                tracked.app_name, tracked.instances, ready))
+        self.outstanding = outstanding
+        return True
+
+    def is_deploying(self, app_id):
+        """
+        :param app_id: Marathon application id
+        :return: (bool) whether a deployment of the application is outstanding
+        """
+        return app_id in self.outstanding or app_id in self.tracked_apps
@@ -0,0 +1,101 @@
+from collections import deque
+from constants import FLAP_SIGNATURES
+import logging
+
+
+def parse_flap_signatures(signatures_string):
+    """
+    :param signatures_string: Signatures separated by semicolons, each a comma separated list of
+                              decisions, e.g. "1,-1,1,-1;-1,1,-1,1"
+    :return: list of signatures (lists of int decisions)
+    """
+    return [[int(decision) for decision in signature.split(",")]
+            for signature in signatures_string.split(";") if signature.strip()]
+
+
+class FlapDetector(object):
+    """
+    Recognizes decision flapping signatures as decisions are made, one decision at a time. The
+    signatures are compiled into a single automaton (Aho-Corasick): each application only keeps its
+    current automaton state, every new decision is one transition, and a signature is reported once,
+    on the decision that completes it, rather than on every cycle while the tail still ends with it.
+    With a time window, a signature only counts when it was completed within the window.
+    """
+    def __init__(self, signatures=None, time_window=None, logger=None):
+        """
+        :param signatures: list of decision sequences (defaults to FLAP_SIGNATURES)
+        :param time_window: datetime.timedelta a signature must be completed within (None for no limit)
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.signatures = [tuple(signature) for signature in (signatures or FLAP_SIGNATURES) if signature]
+        self.time_window = time_window
+        self.max_signature_length = max(len(signature) for signature in self.signatures)
+        self.transitions, self.matches = self._compile(self.signatures)
+        self.app_states = {}
+
+    @staticmethod
+    def _compile(signatures):
+        """
+        Builds the automaton's complete transition table from the trie of the signatures and its failure links.
+        :param signatures: list of decision tuples
+        :return: tuple of transitions (list of dicts of decision to state) and matches (list of the
+                 signatures recognized in each state)
+        """
+        alphabet = set(decision for signature in signatures for decision in signature)
+        transitions, matches = [{}], [[]]
+        for signature in signatures:
+            state = 0
+            for decision in signature:
+                if decision not in transitions[state]:
+                    transitions.append({})
+                    matches.append([])
+                    transitions[state][decision] = len(transitions) - 1
+                state = transitions[state][decision]
+            matches[state].append(signature)
+
+        failures = [0] * len(transitions)
+        queue = deque()
+        for decision in alphabet:
+            state = transitions[0].get(decision)
+            if state is None:
+                transitions[0][decision] = 0
+            else:
+                queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for decision in alphabet:
+                next_state = transitions[state].get(decision)
+                if next_state is None:
+                    transitions[state][decision] = transitions[failures[state]][decision]
+                else:
+                    failures[next_state] = transitions[failures[state]][decision]
+                    matches[next_state] = matches[next_state] + matches[failures[next_state]]
+                    queue.append(next_state)
+        return transitions, matches
+
+    def observe(self, app, decision, timestamp=None):
+        """
+        Advances the application's state by one decision.
+        :param app: Application's name
+        :param decision: A scaling decision
+        :param timestamp: When the decision was made (required with a time window)
+        :return: list of the signatures completed by this decision
+        """
+        state, timestamps = self.app_states.get(app) or (0, deque(maxlen=self.max_signature_length))
+        state = self.transitions[state].get(decision, 0)
+        timestamps.append(timestamp)
+        self.app_states[app] = (state, timestamps)
+
+        matched = self.matches[state]
+        if matched and self.time_window is not None:
+            matched = [signature for signature in matched
+                       if timestamps[-1] - timestamps[-len(signature)] <= self.time_window]
+        return matched
+
+    def forget(self, app):
+        """
+        :param app: Application's name
+        :return: None
+        """
+        self.app_states.pop(app, None)
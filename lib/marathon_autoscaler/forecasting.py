@@ -0,0 +1,162 @@
+from array import array
+from collections import deque
+import logging
+import time
+
+DEFAULT_ALPHA = 0.5
+DEFAULT_BETA = 0.1
+DEFAULT_GAMMA = 0.1
+DEFAULT_SEASON_BUCKETS = 288
+# Observations a series needs before it is forecast
+MIN_OBSERVATIONS = 3
+# Smoothing of the absolute forecast errors reported as the accuracy
+ERROR_SMOOTHING = 0.05
+
+
+class SeriesModel(object):
+    """
+    Holt's linear exponential smoothing of one series (a level and a trend per second, so irregular
+    intervals are fine), with additive seasonality over `season_buckets` slices of the season when a
+    season is given (Holt-Winters). Each observation is an O(1) update: rather than renormalizing every
+    seasonal component when one changes, the change of their mean is kept as an offset (and moved into
+    the level), so the seasonal components stay centered on zero.
+    """
+    __slots__ = ("level", "trend", "seasonal", "seasonal_offset", "timestamp", "observations", "pending", "error")
+
+    def __init__(self, season_buckets=None):
+        self.level = None
+        self.trend = 0.0
+        self.seasonal = array("d", [0.0]) * season_buckets if season_buckets else None
+        self.seasonal_offset = 0.0
+        self.timestamp = None
+        self.observations = 0
+        self.pending = deque()
+        self.error = None
+
+
+class Forecaster(object):
+    """
+    Forecasts each application's metrics a horizon ahead, so rules can scale on where a metric is
+    heading (e.g. "cpu_forecast | >80 | ...") rather than where it has been. Every forecast is kept
+    until it falls due and is then compared to the observed value; the absolute errors are smoothed
+    per series and overall and reported as the forecast accuracy.
+    """
+    def __init__(self, horizon, alpha=None, beta=None, gamma=None, season=None, season_buckets=None, logger=None):
+        """
+        :param horizon: datetime.timedelta to forecast ahead
+        :param alpha: Smoothing of the level (0-1)
+        :param beta: Smoothing of the trend (0-1)
+        :param gamma: Smoothing of the seasonal components (0-1)
+        :param season: datetime.timedelta of the seasonality, e.g. one day (None for no seasonality)
+        :param season_buckets: Number of slices of the season with their own seasonal component
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.horizon = horizon.total_seconds()
+        self.alpha = alpha if alpha is not None else DEFAULT_ALPHA
+        self.beta = beta if beta is not None else DEFAULT_BETA
+        self.gamma = gamma if gamma is not None else DEFAULT_GAMMA
+        self.season = season.total_seconds() if season else None
+        self.season_buckets = (season_buckets or DEFAULT_SEASON_BUCKETS) if self.season else None
+        self.models = {}
+        self.error = None
+        self.errors = 0
+
+    def _bucket(self, timestamp):
+        return int(timestamp % self.season / self.season * self.season_buckets)
+
+    def _predict(self, model, timestamp):
+        value = model.level + model.trend * (timestamp - model.timestamp)
+        if model.seasonal is not None:
+            value += model.seasonal[self._bucket(timestamp)] - model.seasonal_offset
+        return value
+
+    def observe(self, app, observations, timestamp=None):
+        """
+        Updates the application's series and forecasts them a horizon ahead.
+        :param app: Application's name
+        :param observations: dict of metric name to its observed value (None when it was not observed)
+        :param timestamp: Seconds since the epoch (defaults to now)
+        :return: dict of metric name to its forecast (None until the series has enough observations)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        forecasts = {}
+        for metric, value in observations.items():
+            model = self.models.get((app, metric))
+            if model is None:
+                model = self.models[(app, metric)] = SeriesModel(self.season_buckets)
+            if value is not None:
+                self._score(app, metric, model, value, timestamp)
+                self._update(model, float(value), timestamp)
+            else:
+                # forecasts that fell due while the metric is not observed cannot be scored
+                while model.pending and model.pending[0][0] <= timestamp:
+                    model.pending.popleft()
+            forecast = None
+            if model.observations >= MIN_OBSERVATIONS:
+                forecast = self._predict(model, timestamp + self.horizon)
+                # only forecasts from observed values are scored, so an unobserved series keeps none pending
+                if value is not None:
+                    model.pending.append((timestamp + self.horizon, forecast))
+            forecasts[metric] = forecast
+        return forecasts
+
+    def _update(self, model, value, timestamp):
+        seasonal = 0.0
+        if model.seasonal is not None:
+            bucket = self._bucket(timestamp)
+            seasonal = model.seasonal[bucket] - model.seasonal_offset
+        if model.level is None:
+            model.level = value - seasonal
+        elif timestamp > model.timestamp:
+            elapsed = timestamp - model.timestamp
+            if model.observations == 1 and model.seasonal is None:
+                # the first two observations give the initial trend (unless they are a slice of the season)
+                level = value - seasonal
+                model.trend = (level - model.level) / elapsed
+            else:
+                level = self.alpha * (value - seasonal) + (1 - self.alpha) * (model.level + model.trend * elapsed)
+                model.trend = self.beta * (level - model.level) / elapsed + (1 - self.beta) * model.trend
+            model.level = level
+        if model.seasonal is not None and model.observations > 0:
+            change = self.gamma * (value - model.level - seasonal)
+            model.seasonal[bucket] += change
+            model.seasonal_offset += change / self.season_buckets
+            model.level += change / self.season_buckets
+        model.timestamp = timestamp
+        model.observations += 1
+
+    def _score(self, app, metric, model, value, timestamp):
+        """
+        Compares the forecasts that fell due to the observed value.
+        """
+        while model.pending and model.pending[0][0] <= timestamp:
+            _, forecast = model.pending.popleft()
+            error = abs(float(value) - forecast)
+            model.error = error if model.error is None else \
+                ERROR_SMOOTHING * error + (1 - ERROR_SMOOTHING) * model.error
+            self.error = error if self.error is None else ERROR_SMOOTHING * error + (1 - ERROR_SMOOTHING) * self.error
+            self.errors += 1
+            self.logger.debug("{0}: {1} forecast {2:.2f}, observed {3:.2f}".format(app, metric, forecast, value))
+
+    def accuracy(self):
+        """
+        :return: dict of the smoothed absolute forecast error overall (None before any forecast fell due),
+                 the number of forecasts scored and the number of series
+        """
+        return dict(error=self.error, scored=self.errors, series=len(self.models))
+
+    def series_errors(self):
+        """
+        :return: dict of (application, metric) to the smoothed absolute forecast error of the series
+        """
+        return dict((key, model.error) for key, model in self.models.items() if model.error is not None)
+
+    def retain(self, apps):
+        """
+        Forgets the series of every other application.
+        :param apps: The applications whose series are kept
+        :return: None
+        """
+        for key in [key for key in self.models if key[0] not in apps]:
+            del self.models[key]
@@ -0,0 +1,222 @@
+from array import array
+import logging
+import os
+import struct
+import zlib
+
+JOURNAL_MAGIC = b"MASJ\x01"
+DEFAULT_JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+FRAME_HEADER = struct.Struct("<BH")
+FRAME_CHECKSUM = struct.Struct("<I")
+STRING_RECORD = 1
+EVENT_RECORD = 2
+RETENTION_RECORD = 3
+STRING = struct.Struct("<I")
+EVENT = struct.Struct("<IIdbb")
+EVENT_FRAME = struct.Struct("<BH" + EVENT.format[1:] + "I")
+RETENTION = struct.Struct("<Id")
+
+
+class ReplayedHistory(object):
+    """
+    The history of one application read back from the journal, in columns.
+    """
+    def __init__(self):
+        self.retention = None
+        self.timestamps = array("d")
+        self.votes = array("b")
+        self.decisions = array("b")
+        self.versions = []
+
+
+class HistoryJournal(object):
+    """
+    An append-only binary journal of decision history, replayed on start so tolerance windows
+    survive restarts. Every record is framed as a type byte, a payload length and a CRC32 of the
+    payload. Application ids and versions are written once as string records and referred to by id,
+    so an event record takes 25 bytes. Records are flushed (and fsynced) once per cycle; a record
+    torn by a crash fails its checksum and the journal is truncated back to the last intact record.
+    Once the journal outgrows `max_bytes` (and twice its size after the previous compaction), it is
+    compacted: rewritten from the retained history into a temporary file that atomically replaces it.
+    """
+    def __init__(self, path, max_bytes=None, logger=None):
+        """
+        :param path: Path of the journal file
+        :param max_bytes: Journal size that triggers a compaction
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.path = path
+        self.max_bytes = max_bytes or DEFAULT_JOURNAL_MAX_BYTES
+        self.string_ids = {}
+        self.compacted_size = 0
+        self.file = None
+
+    def replay(self):
+        """
+        Reads every intact record, truncates a torn tail and opens the journal for appending.
+        :return: dict of application to its ReplayedHistory
+        """
+        histories, strings, valid_size = {}, {}, 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+                self.logger.error("{0} is not a history journal; starting a new one".format(self.path))
+            else:
+                valid_size = self._read_records(data, histories, strings)
+                if valid_size < len(data):
+                    self.logger.warn("{0}: discarding {1} bytes of torn or corrupt records".format(
+                        self.path, len(data) - valid_size))
+        self.string_ids = dict((string, string_id) for string_id, string in strings.items())
+        self.file = open(self.path, "r+b" if valid_size else "wb")
+        if valid_size:
+            self.file.truncate(valid_size)
+            self.file.seek(valid_size)
+        else:
+            self.file.write(JOURNAL_MAGIC)
+        self.compacted_size = self.file.tell()
+        return dict((strings[app_id], history) for app_id, history in histories.items())
+
+    @staticmethod
+    def _read_records(data, histories, strings):
+        """
+        :param data: The journal's contents
+        :param histories: dict of application string id to ReplayedHistory, filled in
+        :param strings: dict of string id to string, filled in
+        :return: The offset after the last intact record
+        """
+        offset = len(JOURNAL_MAGIC)
+        size = len(data)
+        crc32 = zlib.crc32
+        event_frame = EVENT_FRAME.unpack_from
+        event_payload_size = EVENT.size
+        while offset + FRAME_HEADER.size <= size:
+            record_type, length = FRAME_HEADER.unpack_from(data, offset)
+            payload_start = offset + FRAME_HEADER.size
+            payload_end = payload_start + length
+            if payload_end + FRAME_CHECKSUM.size > size:
+                break
+            if record_type == EVENT_RECORD and length == event_payload_size:
+                _, _, app_id, version_id, timestamp, vote, decision, checksum = event_frame(data, offset)
+                if checksum != crc32(data[payload_start:payload_end]) & 0xffffffff:
+                    break
+                history = histories.get(app_id)
+                if history is None:
+                    history = histories[app_id] = ReplayedHistory()
+                history.timestamps.append(timestamp)
+                history.votes.append(vote)
+                history.decisions.append(decision)
+                history.versions.append(strings[version_id])
+            else:
+                payload = data[payload_start:payload_end]
+                if FRAME_CHECKSUM.unpack_from(data, payload_end)[0] != crc32(payload) & 0xffffffff:
+                    break
+                if record_type == STRING_RECORD:
+                    strings[STRING.unpack_from(payload)[0]] = payload[STRING.size:].decode("utf-8")
+                elif record_type == RETENTION_RECORD:
+                    app_id, seconds = RETENTION.unpack(payload)
+                    history = histories.get(app_id)
+                    if history is None:
+                        history = histories[app_id] = ReplayedHistory()
+                    history.retention = seconds
+            offset = payload_end + FRAME_CHECKSUM.size
+        return offset
+
+    @staticmethod
+    def _frame(record_type, payload):
+        return FRAME_HEADER.pack(record_type, len(payload)) + payload + \
+            FRAME_CHECKSUM.pack(zlib.crc32(payload) & 0xffffffff)
+
+    def _string_id(self, string, out, string_ids):
+        string = u"" if string is None else string
+        string_id = string_ids.get(string)
+        if string_id is None:
+            string_id = string_ids[string] = len(string_ids)
+            encoded = string.encode("utf-8") if not isinstance(string, bytes) else string
+            out.append(self._frame(STRING_RECORD, STRING.pack(string_id) + encoded))
+        return string_id
+
+    def record_event(self, app_name, timestamp, vote, decision, version):
+        """
+        :param app_name: Application's name
+        :param timestamp: float seconds since 1970-01-01
+        :param vote: A vote
+        :param decision: A decision (NO_DECISION when none was made)
+        :param version: The application's version
+        :return: None
+        """
+        out = []
+        app_id = self._string_id(app_name, out, self.string_ids)
+        version_id = self._string_id(version, out, self.string_ids)
+        out.append(self._frame(EVENT_RECORD, EVENT.pack(app_id, version_id, timestamp, vote, decision)))
+        self.file.write(b"".join(out))
+
+    def record_retention(self, app_name, seconds):
+        """
+        :param app_name: Application's name
+        :param seconds: The application's retention period in seconds
+        :return: None
+        """
+        out = []
+        app_id = self._string_id(app_name, out, self.string_ids)
+        out.append(self._frame(RETENTION_RECORD, RETENTION.pack(app_id, seconds)))
+        self.file.write(b"".join(out))
+
+    def flush(self):
+        """
+        Makes the records written so far durable.
+        :return: None
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def needs_compaction(self):
+        """
+        :return: (bool) whether the journal outgrew its size limit and its last compacted size
+        """
+        size = self.file.tell()
+        return size > self.max_bytes and size > 2 * self.compacted_size
+
+    def compact(self, app_histories):
+        """
+        Rewrites the journal from the retained history of every application.
+        :param app_histories: dict of application to its AppHistory
+        :return: None
+        """
+        temporary_path = self.path + ".compacting"
+        string_ids = {}
+        with open(temporary_path, "wb") as f:
+            f.write(JOURNAL_MAGIC)
+            for app, app_history in app_histories.items():
+                out = []
+                app_id = self._string_id(app, out, string_ids)
+                if app_history.retention is not None:
+                    out.append(self._frame(RETENTION_RECORD,
+                                           RETENTION.pack(app_id, app_history.retention.total_seconds())))
+                version_ids = [self._string_id(version, out, string_ids) for version in app_history.versions]
+                for index in range(app_history.start, len(app_history.timestamps)):
+                    out.append(self._frame(EVENT_RECORD, EVENT.pack(app_id,
+                                                                    version_ids[app_history.version_ids[index]],
+                                                                    app_history.timestamps[index],
+                                                                    app_history.votes[index],
+                                                                    app_history.decisions[index])))
+                f.write(b"".join(out))
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.rename(temporary_path, self.path)
+        self.file = open(self.path, "r+b")
+        self.file.seek(0, os.SEEK_END)
+        self.string_ids = string_ids
+        self.compacted_size = self.file.tell()
+        self.logger.info("History journal compacted to {0} bytes".format(self.compacted_size))
+
+    def close(self):
+        """
+        :return: None
+        """
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
@@ -1,52 +1,389 @@
 from aniso8601 import parse_duration
-from collections import defaultdict
-from constants import FLAP_SIGNATURES
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
+from flap_detector import FlapDetector
 import logging
+import sys
+import time
+
+DEFAULT_APP_HISTORY_SIZE = 300
+DEFAULT_MAX_HISTORY_EVENTS = 5000000
+NO_DECISION = -128
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_seconds(date_time):
+    """
+    :param date_time: A naive DateTime
+    :return: float seconds since 1970-01-01 on the same (local) clock
+    """
+    return (date_time - EPOCH).total_seconds()
+
+
+def from_seconds(seconds):
+    """
+    :param seconds: float seconds since 1970-01-01
+    :return: naive DateTime
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class AppHistory(object):
+    """
+    The performance tail of a single application: its votes, decisions, timestamps and application
+    versions (checksums) ordered by timestamp, in parallel typed arrays: float seconds timestamps, int8
+    votes and decisions (NO_DECISION when none was made) and int32 ids into the application's table of
+    versions. An event costs 14 bytes, and the rule that triggered it is not kept alive. Time window
+    queries are binary searches over the timestamps.
+    With a retention period, events older than the period (relative to the latest event) are evicted,
+    except the latest of them, which shows the period is filled. Without one, the last `capacity` events
+    are retained. Evicted events are cut off by moving a start offset; the arrays are compacted once the
+    evicted prefix outgrows the retained events, keeping appends amortized O(1).
+    """
+    def __init__(self, capacity=DEFAULT_APP_HISTORY_SIZE, retention=None):
+        """
+        :param capacity: Number of events retained when there is no retention period
+        :param retention: datetime.timedelta of history retained
+        """
+        self.capacity = capacity
+        self.retention = retention
+        self.timestamps = array("d")
+        self.votes = array("b")
+        self.decisions = array("b")
+        self.version_ids = array("i")
+        self.versions = []
+        self.version_index = {}
+        self.start = 0
+
+    def __len__(self):
+        return len(self.timestamps) - self.start
+
+    @property
+    def retention(self):
+        return self._retention
+
+    @retention.setter
+    def retention(self, retention):
+        self._retention = retention
+        self._retention_seconds = retention.total_seconds() if retention is not None else None
+
+    def _version_id(self, version):
+        version_id = self.version_index.get(version)
+        if version_id is None:
+            version_id = self.version_index[version] = len(self.versions)
+            self.versions.append(version)
+        return version_id
+
+    def append(self, event):
+        """
+        Events normally arrive in timestamp order; an out of order event is inserted in place.
+        :param event: dict of timestamp (DateTime), vote, checksum and, when one was made, decision
+        :return: None
+        """
+        self.add(to_seconds(event["timestamp"]), event.get("vote", 0), event.get("decision"), event.get("checksum"))
+
+    def add(self, timestamp, vote, decision, version):
+        """
+        :param timestamp: float seconds since 1970-01-01
+        :param vote: A vote
+        :param decision: A decision (None when none was made)
+        :param version: The application's version
+        :return: None
+        """
+        decision = NO_DECISION if decision is None else decision
+        version_id = self._version_id(version)
+        if len(self) and timestamp < self.timestamps[-1]:
+            position = bisect_right(self.timestamps, timestamp, self.start)
+            self.timestamps.insert(position, timestamp)
+            self.votes.insert(position, vote)
+            self.decisions.insert(position, decision)
+            self.version_ids.insert(position, version_id)
+        else:
+            self.timestamps.append(timestamp)
+            self.votes.append(vote)
+            self.decisions.append(decision)
+            self.version_ids.append(version_id)
+        self.evict()
+
+    def load(self, timestamps, votes, decisions, versions):
+        """
+        Appends many events at once, e.g. when recovering from a journal.
+        :param timestamps: array of float seconds since 1970-01-01
+        :param votes: array of votes
+        :param decisions: array of decisions (NO_DECISION where none was made)
+        :param versions: list of the application's version at each event
+        :return: None
+        """
+        latest = self.timestamps[-1] if len(self) else float("-inf")
+        if all(earlier <= later for earlier, later in zip([latest] + timestamps[:-1].tolist(), timestamps)):
+            self.timestamps.extend(timestamps)
+            self.votes.extend(votes)
+            self.decisions.extend(decisions)
+            self.version_ids.extend(array("i", [self._version_id(version) for version in versions]))
+            self.evict()
+        else:
+            for index in range(len(timestamps)):
+                self.add(timestamps[index], votes[index],
+                         None if decisions[index] == NO_DECISION else decisions[index], versions[index])
+
+    def evict(self):
+        """
+        Applies the retention period, or the capacity when there is none.
+        :return: None
+        """
+        if not len(self):
+            return
+        if self._retention_seconds is not None:
+            cutoff = self.timestamps[-1] - self._retention_seconds
+            self._cut(bisect_left(self.timestamps, cutoff, self.start) - 1)
+        else:
+            self._cut(len(self.timestamps) - self.capacity)
+
+    def truncate(self, count):
+        """
+        :param count: Number of the latest events to keep
+        :return: None
+        """
+        self._cut(len(self.timestamps) - count)
+
+    def _cut(self, start):
+        if start <= self.start:
+            return
+        self.start = start
+        if self.start >= len(self.timestamps) - self.start:
+            for column in (self.timestamps, self.votes, self.decisions, self.version_ids):
+                del column[:self.start]
+            self.start = 0
+            if len(self.versions) > 1:
+                self._compact_versions()
+
+    def _compact_versions(self):
+        """ Forgets the versions no retained event refers to """
+        live_ids = sorted(set(self.version_ids))
+        if len(live_ids) == len(self.versions):
+            return
+        remap = dict((version_id, new_id) for new_id, version_id in enumerate(live_ids))
+        self.versions = [self.versions[version_id] for version_id in live_ids]
+        self.version_index = dict((version, version_id) for version_id, version in enumerate(self.versions))
+        self.version_ids = array("i", [remap[version_id] for version_id in self.version_ids])
+
+    def oldest_timestamp(self):
+        """
+        :return: The timestamp (float seconds) of the oldest retained event (None when empty)
+        """
+        return self.timestamps[self.start] if len(self) else None
+
+    def latest_timestamp(self):
+        """
+        :return: The timestamp (float seconds) of the latest event (None when empty)
+        """
+        return self.timestamps[-1] if len(self) else None
+
+    def index_after(self, timestamp):
+        """
+        :param timestamp: float seconds since 1970-01-01
+        :return: The index of the first event strictly after timestamp
+        """
+        return bisect_right(self.timestamps, timestamp, self.start)
+
+    def votes_after(self, timestamp):
+        """
+        :param timestamp: float seconds since 1970-01-01
+        :return: tuple of the votes and the distinct versions of the events strictly after timestamp
+        """
+        index = self.index_after(timestamp)
+        return self.votes[index:], set(self.versions[version_id] for version_id in set(self.version_ids[index:]))
+
+    def decisions_after(self, timestamp):
+        """
+        :param timestamp: float seconds since 1970-01-01
+        :return: array of the decisions of the events strictly after timestamp (NO_DECISION where none was made)
+        """
+        return self.decisions[self.index_after(timestamp):]
+
+    def events(self, first=None, last=None):
+        """
+        Rebuilds event dicts, for inspection; the window queries above work on the columns directly.
+        :param first: Index of the first event (defaults to the oldest retained)
+        :param last: Index after the last event (defaults to after the latest)
+        :return: list of event dicts, oldest first
+        """
+        first = self.start if first is None else max(first, self.start)
+        last = len(self.timestamps) if last is None else last
+        events = []
+        for index in range(first, last):
+            event = dict(timestamp=from_seconds(self.timestamps[index]),
+                         vote=self.votes[index],
+                         checksum=self.versions[self.version_ids[index]])
+            if self.decisions[index] != NO_DECISION:
+                event["decision"] = self.decisions[index]
+            events.append(event)
+        return events
+
+    def after(self, date_time):
+        """
+        :param date_time: DateTime
+        :return: list of the events strictly after date_time, oldest first
+        """
+        return self.events(self.index_after(to_seconds(date_time)))
+
+    def before(self, date_time):
+        """
+        :param date_time: DateTime
+        :return: list of the events strictly before date_time, oldest first
+        """
+        return self.events(last=bisect_left(self.timestamps, to_seconds(date_time), self.start))
+
+    def tail(self, count):
+        """
+        :param count: Number of events
+        :return: list of the latest `count` events, oldest first
+        """
+        return self.events(len(self.timestamps) - count)
+
+    def memory_usage(self):
+        """
+        :return: Bytes held by the history
+        """
+        return sum(sys.getsizeof(column)
+                   for column in (self.timestamps, self.votes, self.decisions, self.version_ids)) + \
+            sum(sys.getsizeof(version) for version in self.versions)
 
 
 class HistoryManager(object):
     """
     A keeper of the recent history of scaling decisions.
     """
-    def __init__(self, logger=None, dd_client=None):
+    def __init__(self, logger=None, dd_client=None, app_history_size=DEFAULT_APP_HISTORY_SIZE,
+                 max_events=DEFAULT_MAX_HISTORY_EVENTS, flap_signatures=None, flap_window=None, journal=None):
+        """
+        :param logger: Logger
+        :param dd_client: Datadog client
+        :param app_history_size: Number of events retained per application without a retention period
+        :param max_events: Number of events retained across all applications
+        :param flap_signatures: list of decision sequences considered flapping (defaults to FLAP_SIGNATURES)
+        :param flap_window: ISO8601 time duration a flapping signature must happen within (None for no limit)
+        :param journal: HistoryJournal the history is recovered from and recorded to
+        """
         self.logger = logger or logging.getLogger(__name__)
         self.dd_client = dd_client
-        self.app_performance_tail = []
+        self.app_history_size = app_history_size
+        self.max_events = max_events or DEFAULT_MAX_HISTORY_EVENTS
+        self.app_histories = {}
+        self.flap_detector = FlapDetector(flap_signatures,
+                                          self.get_timedelta(flap_window) if flap_window else None,
+                                          logger=self.logger)
+        self.journal = journal
+        if self.journal is not None:
+            self.recover()
 
-    def add_to_perf_tail(self, app_scale_recommendations):
+    def recover(self):
         """
-        The app performance tail is the time series list of votes, decisions, timestamps and
-        checksums (app version) for all participating applications. Upon adding to this list,
-        it is truncated to hold the last 300 items.  It is truncated to keep memory usage
-        stable as this will be a long running application.
-        :param app_scale_recommendations: list of scaling recommendations per app
-        :return: tail of app_scale_recommendations list
+        Rebuilds the history (and the flap detector's state) from the journal.
+        :return: None
         """
-        self.app_performance_tail.append(app_scale_recommendations)
-        self.check_for_flapping()
-        del self.app_performance_tail[:(len(self.app_performance_tail) - 300)]
-        return self.app_performance_tail[::-1]
+        started = time.time()
+        events = 0
+        for app, replayed in self.journal.replay().items():
+            app_history = self._app_history(app)
+            if replayed.retention is not None:
+                app_history.retention = timedelta(seconds=replayed.retention)
+            app_history.load(replayed.timestamps, replayed.votes, replayed.decisions,
+                             [version or None for version in replayed.versions])
+            for index, decision in enumerate(replayed.decisions):
+                if decision != NO_DECISION:
+                    self.flap_detector.observe(app, decision, from_seconds(replayed.timestamps[index]))
+            events += len(replayed.timestamps)
+        self.logger.info("History recovered from {0}: {1} events of {2} applications in {3:.3f}s".format(
+            self.journal.path, events, len(self.app_histories), time.time() - started))
 
-    def check_for_flapping(self):
-        """ Searches through the app_performance_tail for decision flapping patterns
+    def _app_history(self, app_name):
+        app_history = self.app_histories.get(app_name)
+        if app_history is None:
+            app_history = self.app_histories[app_name] = AppHistory(self.app_history_size)
+        return app_history
+
+    def set_retention(self, app_name, retention):
+        """
+        Sets how much of an application's history is kept: its longest tolerance or backoff period.
+        :param app_name: Application's name
+        :param retention: datetime.timedelta
         :return: None
         """
-        decisions = defaultdict(list)
-        # gather all decisions by application
-        _ = [decisions[app].append(event)
-             for recommendations in self.app_performance_tail
-             for app, event in recommendations.items()
-             if "decision" in event.keys()]
-        # clean up the list of values by sorting them by datetime
-        decisions = {k: sorted(v, key=lambda x: x.get("timestamp")) for k, v in dict(decisions).items()}
+        app_history = self._app_history(app_name)
+        if app_history.retention != retention:
+            app_history.retention = retention
+            app_history.evict()
+            if self.journal is not None:
+                self.journal.record_retention(app_name, retention.total_seconds())
 
-        # loop over key, value to reduce value down to list of just decision values and pass to search_tail
-        search_results = {k: self.__search_tail([d.get("decision") for d in v], FLAP_SIGNATURES)
-                          for k, v in decisions.items()}
+    def add_to_perf_tail(self, app_scale_recommendations):
+        """
+        The app performance tail is the time series of votes, decisions, timestamps and checksums
+        (app version) of each participating application. Every application's tail is truncated to
+        its retention period (or to its last `app_history_size` events without one), the histories of
+        applications that stopped participating are dropped once their retention period has passed,
+        and all histories are truncated evenly when they hold more than `max_events` events, to keep
+        memory usage stable as this will be a long running application.
+        :param app_scale_recommendations: dict of scaling recommendation per app
+        :return: dict of application to its AppHistory
+        """
+        latest_timestamp = None
+        for app, event in app_scale_recommendations.items():
+            self._app_history(app).append(event)
+            if self.journal is not None:
+                decision = event.get("decision")
+                self.journal.record_event(app, to_seconds(event["timestamp"]), event.get("vote", 0),
+                                          NO_DECISION if decision is None else decision, event.get("checksum"))
+            if "decision" in event:
+                self.check_for_flapping(app, event)
+            latest_timestamp = max(latest_timestamp or event["timestamp"], event["timestamp"])
 
-        [self.dd_client.send_counter_event(k, 'marathon_autoscaler.events.flapping_detected')
-         for k, v in search_results.items() if len(v) > 0]
+        if latest_timestamp is not None:
+            latest_timestamp = to_seconds(latest_timestamp)
+            for app, app_history in list(self.app_histories.items()):
+                if app not in app_scale_recommendations and app_history.retention is not None and \
+                        (not len(app_history) or
+                         latest_timestamp - app_history.latest_timestamp() > app_history.retention.total_seconds()):
+                    del self.app_histories[app]
+                    self.flap_detector.forget(app)
+
+        total_events = sum(len(app_history) for app_history in self.app_histories.values())
+        if total_events > self.max_events:
+            fair_share = max(self.max_events // len(self.app_histories), 1)
+            self.logger.warn("History holds {0} events, over its limit of {1}; truncating applications to their "
+                             "last {2} events".format(total_events, self.max_events, fair_share))
+            for app_history in self.app_histories.values():
+                app_history.truncate(fair_share)
+
+        if self.journal is not None:
+            if self.journal.needs_compaction():
+                self.journal.compact(self.app_histories)
+            else:
+                self.journal.flush()
+        return self.app_histories
+
+    def memory_usage(self):
+        """
+        :return: dict of the number of applications and events held, and an estimate of their size in bytes
+        """
+        return dict(apps=len(self.app_histories),
+                    events=sum(len(app_history) for app_history in self.app_histories.values()),
+                    bytes=sum(app_history.memory_usage() for app_history in self.app_histories.values()))
+
+    def check_for_flapping(self, app_name, event):
+        """ Feeds an application's new decision to the flap detector, reporting signatures it completes
+        :param app_name: Application's name
+        :param event: The application's latest event, holding a decision
+        :return: list of the flapping signatures newly matched
+        """
+        signatures = self.flap_detector.observe(app_name, event.get("decision"), event.get("timestamp"))
+        if signatures:
+            self.logger.warn("{0}: flapping detected: {1}".format(app_name, signatures))
+            if self.dd_client is not None:
+                self.dd_client.send_counter_event(app_name, 'marathon_autoscaler.events.flapping_detected')
+        return signatures
 
     def get_performance_tail_slice(self, app_name, after_date_time):
         """
@@ -56,17 +393,18 @@ class HistoryManager(object):
         :param after_date_time: DateTime
         :return: A slice of the application's performance tail (votes, decisions, version checksums, timestamps)
         """
-        results = [event for recommendations in self.app_performance_tail
-                   for app, event in recommendations.items()
-                   if app_name in app and event["timestamp"] > after_date_time]
-        return results
+        app_history = self.app_histories.get(app_name)
+        return app_history.after(after_date_time) if app_history is not None else []
 
     def get_timedelta(self, iso8601_time_duration_string):
         """ A facade method for the iso8601.parse_duration method that reads a string,
         containing an iso8601 time duration value, and returns a datetime.timedelta object.
+        Durations already parsed (e.g. by compiled rules) are returned as they are.
         :param iso8601_time_duration_string: a string containing an iso8601 time duration.
         :return: datetime.timedelta
         """
+        if isinstance(iso8601_time_duration_string, timedelta):
+            return iso8601_time_duration_string
         time_delta = None
         try:
             time_delta = parse_duration(iso8601_time_duration_string)
@@ -84,22 +422,19 @@ class HistoryManager(object):
         :param before_date_time: Date/Time to validate if the tolerance window is filled.
         :return: (bool)
         """
-        result = False
-        past_events = [event for recommendations in self.app_performance_tail
-                       for app, event in recommendations.items()
-                       if app_name in app and event["timestamp"] < before_date_time]
-        if len(past_events) > 0:
-            result = True
+        app_history = self.app_histories.get(app_name)
+        oldest_timestamp = app_history.oldest_timestamp() if app_history is not None else None
+        result = oldest_timestamp is not None and oldest_timestamp < to_seconds(before_date_time)
 
         msg = "{app_name}: tolerance window filled: {result} / {before_date_time:%H:%M:%S.%f}"
         self.logger.info(msg.format(**locals()))
 
-        dmsg = "{app_name}: {past_events}"
+        dmsg = "{app_name}: oldest event: {oldest_timestamp}"
         self.logger.debug(dmsg.format(**locals()))
 
         return result
 
-    def tolerance_reached(self, app_name, tolerance, vote):
+    def tolerance_reached(self, app_name, tolerance, vote, right_now=None):
         """
         Has an application reached the point of needing to make a decision on a
         scaling event? It ensures 3 things:
@@ -107,21 +442,20 @@ class HistoryManager(object):
             - Do all time periods have the same application version (checksum)?
             - Are all votes in the tolerance window unanimous?
         :param app_name: Application's name
-        :param tolerance: ISO8601 time duration
+        :param tolerance: ISO8601 time duration (or datetime.timedelta)
         :param vote: A vote on an upcoming decision
+        :param right_now: DateTime the tolerance window ends at (defaults to now)
         :return: (bool)
         """
         result = False
         time_difference = self.get_timedelta(tolerance)
-        right_now = datetime.now()
+        right_now = right_now or datetime.now()
         go_back_this_far = right_now - time_difference
         vote_list = []
         if self.is_time_window_filled(app_name, go_back_this_far):
-            app_tolerated_tail = self.get_performance_tail_slice(app_name, go_back_this_far)
+            vote_list, checksums = self.app_histories[app_name].votes_after(to_seconds(go_back_this_far))
 
-            if len(app_tolerated_tail) != 0:
-                checksums = set([item.get("checksum") for item in app_tolerated_tail])
-                vote_list = [item.get("vote") for item in app_tolerated_tail]
+            if len(vote_list) != 0:
                 votes = set(vote_list)
                 if len(checksums) == 1 and len(votes) == 1 and votes == {vote}:
                     result = True
@@ -133,22 +467,24 @@ class HistoryManager(object):
         self.logger.debug(dmsg.format(**locals()))
         return result
 
-    def within_backoff(self, app_name, backoff, decision):
+    def within_backoff(self, app_name, backoff, decision, right_now=None):
         """
         Answers whether an application is still in its backoff period. Has a
         scaling event (of the same decision) occurred within the time duration?
         :param app_name: Application name
-        :param backoff: ISO8601 time duration
+        :param backoff: ISO8601 time duration (or datetime.timedelta)
         :param decision: A scaling decision
+        :param right_now: DateTime the backoff window ends at (defaults to now)
         :return: (bool)
         """
         result = False
         time_difference = self.get_timedelta(backoff)
-        right_now = datetime.now()
+        right_now = right_now or datetime.now()
         go_back_this_far = right_now - time_difference
-        app_tail = self.get_performance_tail_slice(app_name, go_back_this_far)
-        scale_events = [item for item in app_tail if item.get("decision") == decision]
-        if len(scale_events) > 0:
+        app_history = self.app_histories.get(app_name)
+        scale_events = app_history.decisions_after(to_seconds(go_back_this_far)).count(decision) \
+            if app_history is not None else 0
+        if scale_events > 0:
             result = True
         msg = "{app_name}: within backoff window: {result} / {go_back_this_far:%H:%M:%S.%f} - " \
               "{right_now:%H:%M:%S.%f}"
@@ -156,17 +492,3 @@ class HistoryManager(object):
         dmsg = "{app_name}: scale events: {scale_events}"
         self.logger.debug(dmsg.format(**locals()))
         return result
-
-    @staticmethod
-    def __search_tail(corpus, *signatures):
-        """ Searches the tail of corpus for matching signatures
-        :param corpus: a list of elements
-        :param signatures: 1 or more signatures to search for
-        :return: a list of search hits
-        """
-        search_hits = []
-        for signature in signatures:
-            search_size = len(signature)
-            if corpus[search_size * -1:] == signature:
-                search_hits.append(signature)
-        return search_hits
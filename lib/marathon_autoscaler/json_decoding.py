@@ -0,0 +1,67 @@
+"""
+Decoding of Mesos and Marathon response bodies. The fastest installed JSON library is used (orjson,
+then ujson, then simplejson, then the standard library), and bodies are parsed straight from the
+bytes received, without first decoding them to a str.
+"""
+import json
+
+try:
+    import orjson
+
+    JSON_BACKEND = "orjson"
+
+    def _loads(content):
+        return orjson.loads(content)
+except ImportError:
+    try:
+        import ujson
+
+        JSON_BACKEND = "ujson"
+
+        def _loads(content):
+            return ujson.loads(content)
+    except ImportError:
+        try:
+            import simplejson
+
+            JSON_BACKEND = "simplejson"
+
+            def _loads(content):
+                return simplejson.loads(content)
+        except ImportError:
+            JSON_BACKEND = "json"
+
+            def _loads(content):
+                # Python 3.5's json.loads only accepts str
+                if isinstance(content, bytes) and not isinstance(content, str):
+                    content = content.decode("utf-8")
+                return json.loads(content)
+
+
+def loads(content):
+    """
+    :param content: A JSON document as bytes or str
+    :return: The decoded document
+    :raise ValueError: When the content is not valid JSON
+    """
+    if not content:
+        raise ValueError("No JSON document to decode")
+    return _loads(content)
+
+
+def project_executor_statistics(executors, counters):
+    """
+    Keeps only what the autoscaler reads from an agent's /monitor/statistics payload, so the full
+    payload (framework ids, executor names, dozens of unused counters) can be released right away.
+    :param executors: list of executor statistics as returned by /monitor/statistics
+    :param counters: The statistics to keep
+    :return: list of dicts of executor_id and the kept statistics; non-list payloads are returned as is
+    """
+    if not isinstance(executors, list):
+        return executors
+    projected = []
+    for executor in executors:
+        statistics = executor.get("statistics") or {}
+        projected.append({"executor_id": executor.get("executor_id"),
+                          "statistics": {counter: statistics[counter] for counter in counters if counter in statistics}})
+    return projected
@@ -0,0 +1,98 @@
+from collections import namedtuple
+import logging
+
+# An application's entry in Marathon's launch queue: the instances waiting to be launched, the seconds left
+# of the launch delay (backoff after failed launches) and whether the delay is over but the instances are
+# still waiting (no offer fits them)
+QueuedApp = namedtuple("QueuedApp", ["app_id", "count", "delay", "overdue"])
+
+
+class LaunchQueue(object):
+    """
+    Marathon's launch queue (/v2/queue), fetched once per cycle by refresh() and indexed by application id.
+    While an application has more instances waiting to be launched, or a longer launch delay, than the
+    limits allow, its scale-ups are held back: the instances already queued are delayed or cannot be
+    placed, and more of them would only grow the backlog.
+    """
+    def __init__(self, marathon_client, max_count=None, max_delay=None, logger=None):
+        """
+        :param marathon_client: Marathon client
+        :param max_count: Max number of queued instances an application is scaled up with (None for no limit)
+        :param max_delay: Max seconds of launch delay an application is scaled up with (None for no limit)
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.marathon_client = marathon_client
+        self.max_count = max_count
+        self.max_delay = max_delay
+        self.queued = {}
+        self.suppressed = []
+
+    @staticmethod
+    def _queued_app(item):
+        """
+        :param item: An item of the /v2/queue response
+        :return: QueuedApp
+        """
+        delay = item.get("delay") or {}
+        return QueuedApp((item.get("app") or {}).get("id"),
+                         int(item.get("count") or 0),
+                         float(delay.get("timeLeftSeconds") or 0),
+                         bool(delay.get("overdue")))
+
+    def refresh(self):
+        """
+        Fetches Marathon's launch queue. When it cannot be fetched, the previous view is kept.
+        :return: (bool) whether the queue was fetched
+        """
+        self.suppressed = []
+        try:
+            queue = self.marathon_client.get_queue()
+        except Exception as ex:
+            self.logger.error("Launch queue could not be retrieved: {0}".format(ex))
+            return False
+        if not isinstance(queue, dict) or not isinstance(queue.get("queue"), list):
+            self.logger.error("Launch queue could not be retrieved: {0}".format(queue))
+            return False
+
+        queued = {}
+        for item in queue["queue"]:
+            queued_app = self._queued_app(item)
+            if queued_app.app_id is not None:
+                queued[queued_app.app_id] = queued_app
+        self.queued = queued
+        return True
+
+    def backlog(self, app_id):
+        """
+        :param app_id: Marathon application id
+        :return: The application's QueuedApp when it is over the limits, else None
+        """
+        queued_app = self.queued.get(app_id)
+        if queued_app is None:
+            return None
+        if (self.max_count is not None and queued_app.count > self.max_count) or \
+                (self.max_delay is not None and queued_app.delay > self.max_delay):
+            return queued_app
+        return None
+
+    def suppress(self, app_name, app_id):
+        """
+        Records a scale-up held back by the application's backlog, if it has one.
+        :param app_name: Application name
+        :param app_id: Marathon application id
+        :return: (bool) whether the scale-up is held back
+        """
+        queued_app = self.backlog(app_id)
+        if queued_app is None:
+            return False
+        self.suppressed.append(app_name)
+        self.logger.warning("{0}: scale up held back, {1} instances queued ({2:.0f}s launch delay{3})".format(
+            app_name, queued_app.count, queued_app.delay, ", overdue" if queued_app.overdue else ""))
+        return True
+
+    def depths(self):
+        """
+        :return: dict of the queued instances of every application in the queue, by application name
+        """
+        return dict((app_id.lstrip("/"), queued_app.count) for app_id, queued_app in self.queued.items())
@@ -43,10 +43,13 @@ class Marathon(ApiClientBase):
         self.paths = json.loads(self.load_paths())
         self.logger = logger or logging.getLogger(__name__)
 
-    def get_all_apps(self):
+    def get_all_apps(self, embed=None):
         """
+        :param embed: Optional embed parameter(s), e.g. "apps.tasks" to include each application's tasks
         :return:
         """
+        if embed:
+            return self._call_endpoint("/v2/apps", params={"embed": embed})
         return self._call_endpoint("/v2/apps")
 
     def get_all_app_names(self):
@@ -55,11 +58,14 @@ class Marathon(ApiClientBase):
         """
         return [app.get("id").lstrip("/") for app in self.get_all_apps().get("apps")]
 
-    def get_app_details(self, marathon_app):
+    def get_app_details(self, marathon_app, embed=None):
         """
         :param marathon_app:
+        :param embed: Optional embed parameter(s), e.g. "app.tasks" to include the application's tasks
         :return:
         """
+        if embed:
+            return self._call_endpoint("/v2/apps/{appId}", appId=marathon_app, params={"embed": embed})
         return self._call_endpoint("/v2/apps/{appId}", appId=marathon_app)
 
     def get_app_tasks(self, marathon_app):
@@ -141,16 +147,20 @@ class Marathon(ApiClientBase):
         self.logger.debug(response)
         return response
 
-    def scale_app(self, marathon_app, instances):
+    def scale_app(self, marathon_app, instances, with_status=False):
         """
         :param marathon_app: name of the application
         :param instances: number of instances to scale to.
-        :return:
+        :param with_status: Return the HTTP status along with the response
+        :return: response (tuple of the HTTP status and the response with_status)
         """
         data = {"instances": instances}
         json_data = json.dumps(data)
-        response = self._call_endpoint("/v2/apps/{appId}", appId=marathon_app, verb="PUT", data=json_data)
+        status, response = self._call_endpoint_with_status("/v2/apps/{appId}", appId=marathon_app, verb="PUT",
+                                                           data=json_data)
         self.logger.debug(response)
+        if with_status:
+            return status, response
         return response
 
     def create_app(self, marathon_app_definition):
@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+import requests
+
+DEFAULT_RESYNC_INTERVAL = 300
+RECONNECT_DELAY = 5
+DEPLOYMENT_EVENTS = ("deployment_info", "deployment_success", "deployment_failed",
+                     "deployment_step_success", "deployment_step_failure")
+
+
+class MarathonAppCache(object):
+    """
+    An in-memory copy of Marathon's /v2/apps kept current by the /v2/events server-sent event stream.
+    A full /v2/apps fetch only happens on start, every `resync_interval` seconds as a safety net and
+    whenever the event stream is (re)connected, since events may have been missed in between. Between
+    full fetches, only the applications named by deployment and status events are fetched again, on the
+    next get_all_apps() call. It answers get_all_apps() like the Marathon client it wraps.
+    """
+    def __init__(self, marathon_client, resync_interval=None, logger=None):
+        """
+        :param marathon_client: A Marathon client
+        :param resync_interval: Seconds between full /v2/apps fetches
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.marathon_client = marathon_client
+        self.resync_interval = resync_interval or DEFAULT_RESYNC_INTERVAL
+        self.apps = {}
+        self.embed = None
+        self.last_resync = None
+        self.connected = False
+        self._dirty_apps = set()
+        self._needs_resync = True
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts following the event stream in a background thread.
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._follow_events, name="marathon-events")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops following the event stream. The daemon thread leaves as soon as the stream yields its
+        next line or drops; closing the response from here could deadlock with the blocked reader.
+        :return: None
+        """
+        self._stopped.set()
+
+    def get_all_apps(self, embed=None):
+        """
+        :param embed: Optional embed parameter(s), e.g. "apps.tasks" to include each application's tasks
+        :return: dict with the list of application definitions under "apps", like /v2/apps, or None when
+                 Marathon could not be reached for a required full fetch
+        """
+        with self._lock:
+            resync = self._needs_resync or not self.connected or embed != self.embed or \
+                time.time() - self.last_resync >= self.resync_interval
+            self._needs_resync = False
+            dirty_apps, self._dirty_apps = self._dirty_apps, set()
+
+        if resync:
+            if not self.resync(embed):
+                return None
+        else:
+            for app_id in dirty_apps:
+                self._refresh_app(app_id)
+        return {"apps": list(self.apps.values())}
+
+    def resync(self, embed=None):
+        """
+        Replaces the cache with a full /v2/apps fetch.
+        :param embed: Optional embed parameter(s) for /v2/apps
+        :return: (bool) whether the fetch succeeded
+        """
+        response = self.marathon_client.get_all_apps(embed=embed)
+        if not isinstance(response, dict) or "apps" not in response:
+            self.logger.error("Marathon applications could not be retrieved for the event cache.")
+            with self._lock:
+                self._needs_resync = True
+            return False
+        self.apps = dict((app.get("id"), app) for app in response.get("apps"))
+        self.embed = embed
+        self.last_resync = time.time()
+        self.logger.info("Marathon event cache resynchronized: {0} applications.".format(len(self.apps)))
+        return True
+
+    def _refresh_app(self, app_id):
+        """
+        Fetches a single application again; applications Marathon no longer knows are removed.
+        :param app_id: Marathon application id
+        :return: None
+        """
+        app_embed = self.embed.replace("apps.", "app.") if self.embed else None
+        response = self.marathon_client.get_app_details(app_id.lstrip("/"), embed=app_embed)
+        if isinstance(response, dict) and "app" in response:
+            self.apps[app_id] = response.get("app")
+        elif isinstance(response, dict) and "does not exist" in str(response.get("message")):
+            self.logger.debug("{0}: no longer in Marathon, removed from the event cache".format(app_id))
+            self.apps.pop(app_id, None)
+        else:
+            self.logger.warn("{0}: could not be refreshed, scheduling a full resync".format(app_id))
+            with self._lock:
+                self._needs_resync = True
+
+    def handle_event(self, event_type, data):
+        """
+        Marks the applications an event refers to for a refresh.
+        :param event_type: The server-sent event name (Marathon's eventType)
+        :param data: The decoded event payload
+        :return: None
+        """
+        app_ids = set()
+        if data.get("appId"):
+            app_ids.add(data.get("appId"))
+        if (data.get("appDefinition") or {}).get("id"):
+            app_ids.add(data.get("appDefinition").get("id"))
+        if event_type in DEPLOYMENT_EVENTS:
+            plan = data.get("plan") or {}
+            steps = list(plan.get("steps") or []) + [data.get("currentStep") or {}]
+            for step in steps:
+                app_ids.update(action.get("app") for action in step.get("actions") or [] if action.get("app"))
+        if app_ids:
+            self.logger.debug("{0}: refreshing {1}".format(event_type, sorted(app_ids)))
+            with self._lock:
+                self._dirty_apps.update(app_ids)
+
+    def _follow_events(self):
+        """
+        Consumes the event stream until stopped, reconnecting (and resynchronizing) whenever it drops.
+        :return: None
+        """
+        url = "".join([self.marathon_client.uri, "/v2/events"])
+        while not self._stopped.is_set():
+            try:
+                response = requests.get(url, stream=True, auth=self.marathon_client.auth,
+                                        headers={"Accept": "text/event-stream"},
+                                        timeout=(RECONNECT_DELAY, None))
+                response.raise_for_status()
+                with self._lock:
+                    self.connected = True
+                    self._needs_resync = True
+                self.logger.info("Following the Marathon event stream.")
+                self._read_events(response)
+            except Exception as ex:
+                if not self._stopped.is_set():
+                    self.logger.error("Marathon event stream failed: {0}".format(ex))
+            finally:
+                with self._lock:
+                    self.connected = False
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def _read_events(self, response):
+        """
+        Parses a server-sent event stream: "event:" and "data:" fields terminated by a blank line.
+        :param response: A streaming requests response
+        :return: None
+        """
+        event_type, data_lines = None, []
+        for line in response.iter_lines(chunk_size=None):
+            if self._stopped.is_set():
+                return
+            line = line.decode("utf-8") if isinstance(line, bytes) else line
+            if not line:
+                if data_lines:
+                    try:
+                        data = json.loads("\n".join(data_lines))
+                        self.handle_event(event_type or data.get("eventType"), data)
+                    except ValueError as ex:
+                        self.logger.error("Unparseable Marathon event: {0}".format(ex))
+                event_type, data_lines = None, []
+            elif line.startswith("event:"):
+                event_type = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
@@ -0,0 +1,75 @@
+import time
+from apiclientbase import ApiClientBase
+
+DEFAULT_LEADER_TTL = 60
+NOT_LEADER_STATUS_CODES = (307, 503)
+
+
+class MasterClientBase(ApiClientBase):
+    """
+    Base for clients of a replicated master where only the elected leader answers. The leader is
+    resolved through the master's redirect endpoint and cached for `leader_ttl` seconds instead of
+    being looked up before every call. The cached leader is dropped as soon as a call to it fails to
+    connect, gets redirected or is answered by a master that is not (or no longer) the leader.
+    """
+    leader_path = "/master/redirect"
+
+    def __init__(self, uri, creds=None, logger=None, timeout=None, leader_ttl=None):
+        """
+        :param uri: Any master, or a load balancer in front of the masters
+        :param creds:
+        :param timeout: Seconds to wait for the server before giving up (defaults to the connect and read
+                        timeout settings)
+        :param leader_ttl: Seconds a resolved leader is trusted (0 resolves the leader before every call)
+        :return:
+        """
+        super(MasterClientBase, self).__init__(uri, creds=creds, logger=logger, timeout=timeout)
+        self.master_uri = self.uri
+        self.leader_ttl = DEFAULT_LEADER_TTL if leader_ttl is None else leader_ttl
+        self.leader_uri = None
+        self.leader_expires = 0
+
+    def find_master(self):
+        """
+        Points the client at the leading master, resolving it only when the cached one expired or was invalidated.
+        :return: The leading master's uri (the configured uri when it could not be resolved)
+        """
+        if self.leader_uri is None or time.time() >= self.leader_expires:
+            self.uri = self.master_uri
+            response = super(MasterClientBase, self)._do_request("GET", self.leader_path)
+            if response is None or not response.ok:
+                self.logger.error("The leading master could not be resolved through {0}".format(self.master_uri))
+                self.invalidate_leader()
+                return self.uri
+            self.leader_uri = response.url.rstrip("/")
+            self.leader_expires = time.time() + self.leader_ttl
+            self.logger.debug("Leading master resolved to {0}".format(self.leader_uri))
+        self.uri = self.leader_uri
+        return self.uri
+
+    def invalidate_leader(self):
+        """
+        Forgets the cached leader; the next call resolves it again.
+        :return: None
+        """
+        self.leader_uri = None
+        self.leader_expires = 0
+        self.uri = self.master_uri
+
+    def _do_request(self, method, path, params=None, data=None):
+        """
+        :param method:
+        :param path:
+        :param params:
+        :param data:
+        :return:
+        """
+        response = super(MasterClientBase, self)._do_request(method, path, params=params, data=data)
+        if self.leader_uri is not None:
+            if response is None:
+                self.logger.warn("{0}: the leading master did not answer, resolving it again".format(self.uri))
+                self.invalidate_leader()
+            elif response.history or response.status_code in NOT_LEADER_STATUS_CODES:
+                self.logger.warn("{0}: no longer the leading master, resolving it again".format(self.uri))
+                self.invalidate_leader()
+        return response
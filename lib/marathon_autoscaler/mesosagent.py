@@ -2,6 +2,7 @@ import json
 import logging
 
 from apiclientbase import ApiClientBase
+from json_decoding import project_executor_statistics
 
 
 class MesosAgent(ApiClientBase):
@@ -28,11 +29,15 @@ class MesosAgent(ApiClientBase):
         }
         """
 
-    def get_statistics(self):
+    def get_statistics(self, counters=None):
         """
+        :param counters: When given, only the executor ids and these statistics are kept
         :return:
         """
-        return self._call_endpoint("/monitor/statistics")
+        statistics = self._call_endpoint("/monitor/statistics")
+        if counters is not None:
+            statistics = project_executor_statistics(statistics, counters)
+        return statistics
 
     def get_metrics(self):
         """
@@ -98,12 +103,14 @@ class MesosAgent(ApiClientBase):
         """
         return self._call_endpoint("/system/stats")
 
-    def __init__(self, uri, creds=None, logger=None):
+    def __init__(self, uri, creds=None, logger=None, timeout=None, retries=None):
         """
         :param uri:
         :param creds:
+        :param timeout:
+        :param retries:
         :return:
         """
-        super(MesosAgent, self).__init__(uri, creds)
+        super(MesosAgent, self).__init__(uri, creds, timeout=timeout, retries=retries)
         self.paths = json.loads(self.load_paths())
         self.logger = logger or logging.getLogger(__name__)
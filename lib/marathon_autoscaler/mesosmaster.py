@@ -1,10 +1,10 @@
 import json
 import logging
 
-from apiclientbase import ApiClientBase
+from masterclientbase import MasterClientBase
 
 
-class MesosMaster(ApiClientBase):
+class MesosMaster(MasterClientBase):
     @staticmethod
     def load_paths():
         """
@@ -41,19 +41,17 @@ class MesosMaster(ApiClientBase):
         }
         """
 
-    def __init__(self, uri, creds=None, logger=None):
+    def __init__(self, uri, creds=None, logger=None, leader_ttl=None):
         """
         :param uri:
         :param creds:
+        :param leader_ttl: Seconds the resolved leading master is cached
         :return:
         """
-        super(MesosMaster, self).__init__(uri, creds)
+        super(MesosMaster, self).__init__(uri, creds, leader_ttl=leader_ttl)
         self.paths = json.loads(self.load_paths())
         self.logger = logger or logging.getLogger(__name__)
 
-    def find_master(self):
-        self.uri = self._call_endpoint("/master/redirect").url
-
     def get_health(self):
         """
         :return:
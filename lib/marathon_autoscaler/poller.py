@@ -1,23 +1,20 @@
 #!/usr/bin/env python
 
-from collections import defaultdict
+import atexit
+from aggregation import ExecutorStatsAggregator, STATISTICS_COUNTERS
 from application_definition import ApplicationDefinition
+from application_registry import ApplicationRegistry
 import logging
+from collector import AgentStatisticsCollector
 from datadog_metrics import DatadogClient
 from marathon import Marathon
-from mesosagent import MesosAgent
+from marathon_events import MarathonAppCache
 from mesosmaster import MesosMaster
+from scale_dispatcher import is_scaled
 from scaler import AutoScaler
-from multiprocessing import Pool
 from time import sleep
-import settings
 
-def get_mesos_agent_statistics(agent_host):
-    """
-    :param agent_host: A Mesos slave endpoint defined as an FQDN or IP Address
-    :return: Statistics (Metrics) JSON
-    """
-    return agent_host, MesosAgent("http://{0}:{1}/".format(agent_host, settings.agent_port)).get_statistics()
+SNAPSHOT_COUNTERS = ("cpus_user_time_secs", "cpus_system_time_secs", "timestamp")
 
 
 class Poller:
@@ -28,31 +25,54 @@ class Poller:
     def __init__(self, cli_args, logger=None):
         self.args = cli_args
         self.logger = logger or logging.getLogger(__name__)
-        self.mesos = MesosMaster(cli_args.mesos_uri)
+        self.mesos = MesosMaster(cli_args.mesos_uri, leader_ttl=cli_args.mesos_leader_ttl)
         self.marathon = Marathon(cli_args.marathon_uri,
             (cli_args.marathon_user, cli_args.marathon_pass)
             if cli_args.marathon_user and cli_args.marathon_pass
             else None
         )
-        self.auto_scaler = AutoScaler(self.marathon, cli_args=cli_args)
+        self.marathon_apps = self.marathon
+        if cli_args.marathon_events:
+            self.marathon_apps = MarathonAppCache(self.marathon, resync_interval=cli_args.marathon_resync_interval)
+            self.marathon_apps.start()
+            atexit.register(self.marathon_apps.stop)
         self.cpu_fan_out = cli_args.cpu_fan_out
         self.datadog_client = DatadogClient(cli_args)
+        self.auto_scaler = AutoScaler(self.marathon, dd_client=self.datadog_client, cli_args=cli_args)
+        atexit.register(self.auto_scaler.dispatcher.close)
+        if self.auto_scaler.hm.journal is not None:
+            atexit.register(self.auto_scaler.hm.journal.close)
         self.agent_port = cli_args.agent_port
-
-    def poll(self, mesos_master, marathon_client, poll_time_span=3, cpu_fan_out=None):
+        self.collector = AgentStatisticsCollector(self.agent_port,
+                                                  concurrency=self.cpu_fan_out,
+                                                  agent_timeout=cli_args.agent_timeout,
+                                                  counters=STATISTICS_COUNTERS)
+        atexit.register(self.collector.close)
+        self.single_scrape = cli_args.single_scrape
+        self.aggregator = ExecutorStatsAggregator(use_numpy=cli_args.numpy_aggregation)
+        self.target_participating_agents = cli_args.target_participating_agents
+        self.executor_snapshot = {}
+
+    def poll(self, mesos_master, marathon_client, poll_time_span=3):
         """ The main method for forming the applications metrics data object. A call to Marathon retrieves
-        all applications, a call to Mesos Master retrieves all slaves, each slave node is queried for its
+        all applications, a call to Mesos Master retrieves all slaves (narrowed down to the slaves running
+        participating applications when targeting is enabled), each slave node is queried for its
         statistics (metrics) twice (to acquire a differential), differentials are calculated, additional
         metrics are added (max_cpu, max_mem). All of this data is collected in a single dictionary object
-        and returned to caller.
+        and returned to caller. In single scrape mode each slave node is queried once and the differential
+        is taken against the counters kept from the previous cycle.
         :param mesos_master: A Mesos Master Client
         :param marathon_client: A Marathon Client
         :param poll_time_span: Time (in seconds) between polling events
-        :param cpu_fan_out: Max number of processes in MP Pools
         :return: A dictionary object containing all Application metric data for 2 consecutive polls
         """
+        # statistics some rule metrics need are only collected once participating applications' rules use them
+        extended_counters = self.auto_scaler.required_counters()
+        self.collector.counters = STATISTICS_COUNTERS + extended_counters
+        # Datadog exports every application's metrics, so only target agents when nothing else needs them
+        target_agents = self.target_participating_agents and not self.datadog_client.enabled
         try:
-            marathon_apps = marathon_client.get_all_apps().get("apps")
+            marathon_apps = marathon_client.get_all_apps(embed="apps.tasks" if target_agents else None).get("apps")
             slaves = mesos_master.get_slaves()
             agent_hosts = [slave.get("hostname") for slave in slaves.get("slaves")]
         except Exception as ex:
@@ -60,95 +80,60 @@ class Poller:
             self.logger.fatal("Marathon data could not be retrieved!")
             return
 
-        executor_stats = defaultdict(list)
-
-        for _ in range(2):
-            agent_hosts_stats = {}
-            if cpu_fan_out:
-                fan_out_procs = cpu_fan_out
-            else:
-                fan_out_procs = len(agent_hosts)
-
-            maxtasks = int(len(agent_hosts) / fan_out_procs) if int(len(agent_hosts) / fan_out_procs) else 1
-            pool = Pool(processes=fan_out_procs, maxtasksperchild=maxtasks)
-            for agent_host, stats in pool.imap_unordered(get_mesos_agent_statistics, agent_hosts):
-                self.logger.debug((agent_host, stats))
-                agent_hosts_stats[agent_host] = stats
-            pool.close()
-
-            for host in agent_hosts_stats:
-                if agent_hosts_stats[host] is not None:
-                    for executor in agent_hosts_stats[host]:
-                        data = {"host": host, "stats": executor["statistics"]}
-                        executor_stats[executor["executor_id"]].append(data)
+        if self.auto_scaler.capacity_admission:
+            try:
+                self.auto_scaler.capacity.update(slaves.get("slaves"))
+            except Exception as ex:
+                # scale-ups are not admitted against the cluster's capacity until it can be modeled again
+                self.auto_scaler.capacity.reset()
+                self.logger.error("Cluster capacity could not be modeled, admission disabled this cycle: {0}".format(ex))
+
+        app_registry = ApplicationRegistry(marathon_apps)
+        if target_agents:
+            participating_hosts = app_registry.participating_hosts()
+            self.logger.info("Targeting {0} of {1} agents running participating applications.".format(
+                len(participating_hosts), len(agent_hosts)))
+            agent_hosts = [host for host in agent_hosts if host in participating_hosts]
+
+        if self.single_scrape:
+            executor_stats = self._scrape_executor_stats(agent_hosts)
+            previous_stats, self.executor_snapshot = self.executor_snapshot, {
+                executor_id: dict(host=stat["host"],
+                                  stats={counter: stat["stats"][counter]
+                                         for counter in SNAPSHOT_COUNTERS + extended_counters
+                                         if counter in stat["stats"]})
+                for executor_id, stat in executor_stats.items()}
+            if not previous_stats:
+                self.logger.info("Stats baseline collected; differentials begin next cycle.")
+        else:
+            previous_stats = self._scrape_executor_stats(agent_hosts)
             sleep(poll_time_span)
+            executor_stats = self._scrape_executor_stats(agent_hosts)
 
+        app_metric_summation = self.aggregator.summarize(previous_stats, executor_stats,
+                                                         app_registry.app_key_for_executor,
+                                                         extended_counters=extended_counters)
         self.logger.info("Stats differentials collected.")
-        all_diffs = {}
-
-        for key, stat in executor_stats.items():
-
-            if len(stat) != 2:
-                continue
-
-            host = stat[0].get("host")
-            first_stats = stat[0].get("stats")
-            second_stats = stat[1].get("stats")
-
-            if "timestamp" in second_stats and "timestamp" in first_stats:
-                sys_cpu_delta = second_stats["cpus_system_time_secs"] - \
-                                first_stats["cpus_system_time_secs"]
-
-                user_cpu_delta = second_stats["cpus_user_time_secs"] - first_stats["cpus_user_time_secs"]
-                timestamp_delta = second_stats["timestamp"] - first_stats["timestamp"]
-                mem_total = first_stats["mem_limit_bytes"]
-                mem_used = second_stats["mem_rss_bytes"]
-                cpu_total_usage = ((sys_cpu_delta + user_cpu_delta) / timestamp_delta) * 100
-                memory_total_usage = (float(mem_used) / mem_total) * 100
-
-                diffs = dict(timestamp=timestamp_delta,
-                             cpus_system_time_secs=sys_cpu_delta,
-                             cpus_user_time_secs=user_cpu_delta,
-                             cpu_total_usage=cpu_total_usage,
-                             memory_total_usage=memory_total_usage,
-                             host=host,
-                             executor_id=key)
-                all_diffs[key] = diffs
-            else:
-                self.logger.error("Timestamps were not found in stats from host: {0}".format(host))
-
-        app_metric_map = defaultdict(list)
-
-        for key in all_diffs.keys():
-            app_metric_map[key.split(".")[0]].append(all_diffs[key])
-
-        app_metric_summation = {}
-
-        for app, metrics in app_metric_map.items():
-
-            metric_sums = {}
-
-            cpu_values = [metric["cpu_total_usage"] for metric in metrics]
-            metric_sums["cpu_avg_usage"] = sum(cpu_values) / len(cpu_values)
 
-            metric_sums["max_cpu"] = max([(metric["cpu_total_usage"],
-                                           metric["executor_id"],
-                                           metric["host"]) for metric in metrics])
-
-            memory_values = [metric["memory_total_usage"] for metric in metrics]
-            metric_sums["memory_avg_usage"] = sum(memory_values) / len(memory_values)
-
-            metric_sums["max_memory"] = max([(metric["memory_total_usage"],
-                                              metric["executor_id"],
-                                              metric["host"]) for metric in metrics])
-
-            metric_sums["executor_metrics"] = metrics
-            metric_sums["application_definition"] = next((appdef for appdef in marathon_apps
-                                                          if app.replace("_", "/") == appdef.get("id")), {})
-            app_metric_summation[app] = metric_sums
+        for app, metric_sums in app_metric_summation.items():
+            metric_sums["application_definition"] = app_registry.get(app, {})
 
         return app_metric_summation
 
+    def _scrape_executor_stats(self, agent_hosts):
+        """
+        Queries every agent once for its executor statistics.
+        :param agent_hosts: list of Mesos agent hosts
+        :return: dict of executor id to the host it runs on and its statistics
+        """
+        executor_stats = {}
+        agent_hosts_stats = self.collector.collect(agent_hosts)
+        for host, stats in agent_hosts_stats.items():
+            if stats is not None:
+                for executor in stats:
+                    executor_stats[executor["executor_id"]] = {"host": host, "stats": executor["statistics"]}
+        return executor_stats
+
     def start(self):
         """
         This is the entry method for the Poller class.
@@ -156,18 +141,34 @@ class Poller:
         """
         self.logger.info("Mesos and Marathon Connections Established.")
         while True:
-            polled_stats = self.poll(self.mesos, self.marathon, cpu_fan_out=self.cpu_fan_out)
+            polled_stats = self.poll(self.mesos, self.marathon_apps)
 
             if polled_stats is not None:
                 self.datadog_client.send_datadog_metrics(polled_stats)
+                self.auto_scaler.deployments.refresh()
+                self.auto_scaler.launch_queue.refresh()
                 self.auto_scaler.decide(polled_stats)
                 self.update_autoscaler_metrics(polled_stats)
                 self.logger.info("Decisions are completed.")
             else:
                 self.logger.fatal("Poller unable to reach Marathon/Mesos!")
 
+            self.log_connection_stats()
             sleep(self.args.sleep_interval)
 
+    def log_connection_stats(self):
+        """
+        Logs, at debug level, how many requests each client made and how many connections they took.
+        :return: None
+        """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        for name, stats in (("marathon", self.marathon.connection_stats()),
+                            ("mesos", self.mesos.connection_stats()),
+                            ("agents", self.collector.connection_stats())):
+            self.logger.debug("HTTP {0}: {requests} requests ({retries} retries) over {connections} connections, "
+                              "{reused} reused".format(name, **stats))
+
     def update_autoscaler_metrics(self, stats):
         """
         * Number of participating applications
@@ -178,9 +179,54 @@ class Poller:
         * Number of scale up events
         * Number of scale down events
         * Number of flap detection events
+        * Applications, events and (estimated) bytes held by the decision history
+        * Forecast accuracy (per forecast series at debug level)
+        * Scale actions sent, failed and the slowest of them
+        * Outstanding deployments and the slowest time from decision to ready instances
+        * Free cluster resources and the scale-up instances reduced for lack of them (with capacity admission)
+        * Instances in the launch queue, per application, and the scale-ups held back by the queue backlog
         :param stats: dict object containing all application metric information specific to this polling event
         :return:
         """
+        scale_outcomes = self.auto_scaler.scale_outcomes
+        if scale_outcomes:
+            self.datadog_client.send_gauge("marathon_autoscaler.scale.actions", len(scale_outcomes))
+            self.datadog_client.send_gauge("marathon_autoscaler.scale.failures",
+                                           len([outcome for outcome in scale_outcomes if not is_scaled(outcome)]))
+            self.datadog_client.send_gauge("marathon_autoscaler.scale.max_latency",
+                                           max(outcome.latency for outcome in scale_outcomes))
+        if self.auto_scaler.capacity_admission:
+            for name, value in self.auto_scaler.capacity.totals().items():
+                self.datadog_client.send_gauge("marathon_autoscaler.capacity.free_{0}".format(name), value)
+            self.datadog_client.send_gauge("marathon_autoscaler.capacity.reduced_instances",
+                                           sum(requested - granted
+                                               for _, requested, granted in self.auto_scaler.capacity_reductions))
+        deployments = self.auto_scaler.deployments
+        self.datadog_client.send_gauge("marathon_autoscaler.deployments.outstanding", len(deployments.outstanding))
+        if deployments.completed:
+            self.datadog_client.send_gauge("marathon_autoscaler.deployments.max_ready_seconds",
+                                           max(ready for _, ready in deployments.completed))
+        launch_queue = self.auto_scaler.launch_queue
+        queue_depths = launch_queue.depths()
+        self.datadog_client.send_gauge("marathon_autoscaler.queue.instances", sum(queue_depths.values()))
+        self.datadog_client.send_app_gauges("marathon_autoscaler.queue.depth", queue_depths)
+        self.datadog_client.send_gauge("marathon_autoscaler.queue.suppressed_scale_ups", len(launch_queue.suppressed))
+
+        forecast_accuracy = self.auto_scaler.forecaster.accuracy()
+        if forecast_accuracy["error"] is not None:
+            self.logger.info("Forecasts: {series} series, {scored} scored, smoothed absolute error {error:.2f}".format(
+                **forecast_accuracy))
+            self.datadog_client.send_gauge("marathon_autoscaler.forecast.error", forecast_accuracy["error"])
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for (app, metric), error in self.auto_scaler.forecaster.series_errors().items():
+                    self.logger.debug("{0}: {1} forecast smoothed absolute error {2:.2f}".format(app, metric, error))
+
+        history_usage = self.auto_scaler.hm.memory_usage()
+        self.logger.info("Decision history: {apps} applications, {events} events, ~{bytes} bytes".format(
+            **history_usage))
+        for name, value in history_usage.items():
+            self.datadog_client.send_gauge("marathon_autoscaler.history.{0}".format(name), value)
+
         participating_applications = [{"app": app,
                                        "current_instances": int(items["application_definition"]["instances"]),
                                        "min_instances": int(items["application_definition"]["labels"]["min_instances"]),
@@ -0,0 +1,113 @@
+from aggregation import DEFAULT_PERCENTILES, ExecutorStatsAggregator
+
+# Appended to a metric's name, rules use its forecast (see forecasting.Forecaster)
+FORECAST_SUFFIX = "_forecast"
+
+# Executor statistics, beyond aggregation.STATISTICS_COUNTERS, that only some metrics need
+METRIC_COUNTERS = {
+    "cpu_throttled": ("cpus_throttled_time_secs",),
+    "net_rx_rate": ("net_rx_bytes",)
+}
+
+
+def _summary_value(key):
+    def metric(metrics_summary, app_def):
+        return metrics_summary.get(key)
+    return metric
+
+
+def _summary_maximum(key):
+    def metric(metrics_summary, app_def):
+        maximum = metrics_summary.get(key)
+        return maximum[0] if maximum else None
+    return metric
+
+
+def _percentile(usage, q):
+    def metric(metrics_summary, app_def):
+        value = metrics_summary.get("{0}_p{1}_usage".format(usage, q))
+        if value is None:
+            values = sorted(executor["{0}_total_usage".format(usage)]
+                            for executor in metrics_summary.get("executor_metrics") or [])
+            value = ExecutorStatsAggregator._percentile(values, q) if values else None
+        return value
+    return metric
+
+
+def cpu_throttled(metrics_summary, app_def):
+    """
+    :return: Average percentage of time the application's executors were throttled (None without statistics)
+    """
+    throttled = [executor["cpus_throttled_time_secs"] / executor["timestamp"] * 100
+                 for executor in metrics_summary.get("executor_metrics") or []
+                 if "cpus_throttled_time_secs" in executor]
+    return sum(throttled) / len(throttled) if throttled else None
+
+
+def net_rx_rate(metrics_summary, app_def):
+    """
+    :return: Bytes per second received by all of the application's executors (None without statistics)
+    """
+    rates = [executor["net_rx_bytes"] / executor["timestamp"]
+             for executor in metrics_summary.get("executor_metrics") or []
+             if "net_rx_bytes" in executor]
+    return sum(rates) if rates else None
+
+
+def instances_running(metrics_summary, app_def):
+    """
+    :return: Number of the application's running tasks
+    """
+    return app_def.tasksRunning
+
+
+RULE_METRICS = {
+    "cpu": _summary_value("cpu_avg_usage"),
+    "mem": _summary_value("memory_avg_usage"),
+    "cpu_max": _summary_maximum("max_cpu"),
+    "mem_max": _summary_maximum("max_memory"),
+    "cpu_throttled": cpu_throttled,
+    "net_rx_rate": net_rx_rate,
+    "instances_running": instances_running
+}
+for q in DEFAULT_PERCENTILES:
+    RULE_METRICS["cpu_p{0}".format(q)] = _percentile("cpu", q)
+    RULE_METRICS["mem_p{0}".format(q)] = _percentile("memory", q)
+
+
+def forecast_base(name):
+    """
+    :param name: Metric name
+    :return: The name of the metric forecast by the named metric, or None when it is not a forecast
+    """
+    if name.endswith(FORECAST_SUFFIX) and name[:-len(FORECAST_SUFFIX)] in RULE_METRICS:
+        return name[:-len(FORECAST_SUFFIX)]
+    return None
+
+
+def is_rule_metric(name):
+    """
+    :param name: Metric name
+    :return: (bool) whether rules can use the metric
+    """
+    return name in RULE_METRICS or forecast_base(name) is not None
+
+
+def rule_metrics(metrics_summary, app_def, names):
+    """
+    Computes only the named metrics of an application, e.g. the ones its rules reference.
+    :param metrics_summary: The application's metric summary (see ExecutorStatsAggregator)
+    :param app_def: ApplicationDefinition
+    :param names: Metric names
+    :return: dict of metric name to value (None where it could not be computed)
+    """
+    return dict((name, RULE_METRICS[name](metrics_summary, app_def)) for name in names if name in RULE_METRICS)
+
+
+def required_counters(names):
+    """
+    :param names: Metric names
+    :return: tuple of the executor statistics the metrics need beyond aggregation.STATISTICS_COUNTERS
+    """
+    return tuple(sorted(set(counter for name in names
+                            for counter in METRIC_COUNTERS.get(forecast_base(name) or name, ()))))
@@ -0,0 +1,128 @@
+from constants import compare
+import logging
+from rules_manager import match_rule
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RulesEvaluator(object):
+    """
+    Matches the rules of every participating application to its metrics in one pass per cycle, with the
+    precedence of RulesManager (most rule criteria, then most weight, then rule name).
+    By default every application's rules are tried in order of precedence in pure Python. With use_numpy
+    (and NumPy installed) every rule part of every application is flattened into columns of metric,
+    operator, threshold and rule, compared against a matrix of the applications' metrics in one
+    vectorized pass per operator, and reduced to the first matched rule of each application. The
+    columns of each application's compiled rules are kept for as long as the application is evaluated,
+    and the whole batch of columns is reused for as long as the same rules are evaluated.
+    """
+    def __init__(self, use_numpy=False, logger=None):
+        """
+        :param use_numpy: Use the vectorized implementation when NumPy is available
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.use_numpy = use_numpy and np is not None
+        self.metric_ids = {}
+        self.operator_ids = {}
+        self.operators = []
+        self.flattened = {}
+        self.batch_key = None
+        self.batch = None
+        if self.use_numpy:
+            ufuncs = {">=": np.greater_equal, "<=": np.less_equal, "<": np.less, ">": np.greater,
+                      "=": np.equal, "==": np.equal}
+            for op, operator in compare.items():
+                self.operator_ids[operator] = len(self.operators)
+                self.operators.append(ufuncs[op])
+
+    def evaluate(self, compiled_rules, metrics):
+        """
+        :param compiled_rules: list of each application's CompiledRules
+        :param metrics: list of each application's dict of canonical metric names to values
+        :return: list of each application's matched rule (tuple of RuleParts), or None where none matched
+        """
+        if self.use_numpy and compiled_rules:
+            return self._evaluate_columns(compiled_rules, metrics)
+        return [match_rule(compiled, app_metrics) for compiled, app_metrics in zip(compiled_rules, metrics)]
+
+    def _flatten(self, compiled):
+        """
+        :param compiled: CompiledRules
+        :return: tuple of the metric ids, operator ids, thresholds and rule indexes (in order of
+                 precedence) of every rule part
+        """
+        metric_ids, operator_ids, thresholds, rule_indexes = [], [], [], []
+        for rule_index, rule in enumerate(compiled.precedence):
+            for rule_part in rule:
+                metric_ids.append(self.metric_ids.setdefault(rule_part.metric, len(self.metric_ids)))
+                operator_ids.append(self.operator_ids[rule_part.operator])
+                thresholds.append(rule_part.threshold)
+                rule_indexes.append(rule_index)
+        return metric_ids, operator_ids, thresholds, rule_indexes
+
+    def _evaluate_columns(self, compiled_rules, metrics):
+        batch_key = [id(compiled) for compiled in compiled_rules]
+        if batch_key != self.batch_key:
+            self.batch = self._flatten_batch(compiled_rules)
+            self.batch_key = batch_key
+        part_apps, part_metrics, operator_masks, thresholds, part_rules, rule_offsets, rule_apps = self.batch
+
+        apps = len(compiled_rules)
+        matrix = np.empty((apps, len(self.metric_ids)), dtype=np.float64)
+        for metric, column in self.metric_ids.items():
+            matrix[:, column] = np.array([app_metrics.get(metric) for app_metrics in metrics], dtype=np.float64)
+        values = matrix[part_apps, part_metrics]
+
+        hits = np.zeros(len(part_rules), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for operator_id, parts in operator_masks:
+                hits[parts] = self.operators[operator_id](values[parts], thresholds[parts])
+
+        # a rule is matched when none of its parts missed; an application's rules are in order of precedence
+        misses = np.bincount(part_rules, weights=~hits, minlength=len(rule_apps))
+        matched_rules = np.flatnonzero(misses == 0)
+        winning_apps, first = np.unique(rule_apps[matched_rules], return_index=True)
+        winning_rules = matched_rules[first] - rule_offsets[winning_apps]
+
+        matched = [None] * apps
+        for app, rule_index in zip(winning_apps.tolist(), winning_rules.tolist()):
+            matched[app] = compiled_rules[app].precedence[rule_index]
+        return matched
+
+    def _flatten_batch(self, compiled_rules):
+        """
+        :param compiled_rules: list of each application's CompiledRules
+        :return: tuple of the columns of every rule part (application, metric id, operator masks,
+                 threshold, rule) and of every rule (first rule of each application, application)
+        """
+        flattened = {}
+        part_metrics, part_operators, part_thresholds, part_rules = [], [], [], []
+        parts_per_app, rules_per_app = [], []
+        for compiled in compiled_rules:
+            key = id(compiled)
+            columns = flattened[key] = self.flattened.get(key) or (compiled, self._flatten(compiled))
+            metric_ids, operator_ids, thresholds, rule_indexes = columns[1]
+            part_metrics.extend(metric_ids)
+            part_operators.extend(operator_ids)
+            part_thresholds.extend(thresholds)
+            part_rules.extend(rule_indexes)
+            parts_per_app.append(len(metric_ids))
+            rules_per_app.append(len(compiled.precedence))
+        # the compiled rules are kept alongside their columns, so their ids are not reused while cached
+        self.flattened = flattened
+
+        apps = len(compiled_rules)
+        rules_per_app = np.array(rules_per_app, dtype=np.int64)
+        rule_offsets = np.concatenate(([0], np.cumsum(rules_per_app)[:-1]))
+        part_apps = np.repeat(np.arange(apps), parts_per_app)
+        part_rules = np.array(part_rules, dtype=np.int64) + rule_offsets[part_apps]
+        part_operators = np.array(part_operators, dtype=np.int64)
+        operator_masks = [(operator_id, part_operators == operator_id) for operator_id in range(len(self.operators))
+                          if (part_operators == operator_id).any()]
+        return (part_apps, np.array(part_metrics, dtype=np.int64), operator_masks,
+                np.array(part_thresholds, dtype=np.float64), part_rules, rule_offsets,
+                np.repeat(np.arange(apps), rules_per_app))
@@ -1,10 +1,290 @@
-from collections import defaultdict, Counter
-from constants import compare, RE_THRESHOLD, RE_DELIMITERS
-from utils import list_get
+from aniso8601 import parse_duration
+from collections import namedtuple, OrderedDict
+from constants import compare, METRIC_ALIASES, RE_TARGET, RE_THRESHOLD, RE_DELIMITERS
+from datetime import timedelta
+from rule_metrics import is_rule_metric
+from utils import clamp, list_get
 import logging
+import math
 import re
 import settings
 
+DEFAULT_RULES_CACHE_SIZE = 10000
+DEFAULT_TARGET_TOLERANCE = "PT1M"
+DEFAULT_TARGET_BACKOFF = "PT1M"
+# A target rule leaves the instances alone while its metric is within this share of the target
+TARGET_DEADBAND = 0.1
+
+RulePart = namedtuple("RulePart", ["rule_name", "rule_part", "metric", "operator", "threshold", "tolerance",
+                                   "scale_factor", "backoff", "weight", "definition"])
+RulePart.__doc__ = """
+A compiled part of a rule: the threshold is bound to its comparison operator, the tolerance and backoff
+are parsed into datetime.timedelta, and definition keeps the rule part as the dict documented in RulesManager.
+"""
+
+TargetRule = namedtuple("TargetRule", ["rule_name", "rule_part", "metric", "target", "tolerance", "max_step",
+                                       "backoff", "definition"])
+TargetRule.__doc__ = """
+A compiled target tracking rule: the instances are sized so that the metric comes back to the target.
+"""
+
+CompiledRules = namedtuple("CompiledRules", ["rules", "precedence", "targets", "metrics", "min_instances",
+                                             "max_instances", "retention"])
+CompiledRules.__doc__ = """
+Everything an application's labels say about scaling it: its rules (a dict of rule name to a tuple of
+RuleParts) and the same rules in order of precedence, its target tracking rules (a tuple of TargetRules),
+the metrics they all reference, its instance limits and the longest tolerance or backoff period among
+its rules.
+"""
+
+
+def canonical_metric(metric_name):
+    """
+    :param metric_name: A metric name, as used in rules or metrics
+    :return: The name of the metric the autoscaler provides under that name
+    """
+    return METRIC_ALIASES.get(metric_name, metric_name)
+
+
+def rule_precedence(rules):
+    """
+    This is the Highlander ordering; there can only be one...
+    Round 1 : Who has the most rule criteria?
+    Round 2 : Which rule has the most weight? Weight is multiplied against scale_factor
+    Equals are ordered by rule name.
+    :param rules: dict of rule name to tuple of RuleParts
+    :return: tuple of rules, the one that wins when several are matched first
+    """
+    return tuple(sorted(rules.values(),
+                        key=lambda rule: (-len(rule), -abs(rule[0].scale_factor * rule[0].weight), rule[0].rule_name)))
+
+
+def is_rule_matched(rule, metrics):
+    """
+    :param rule: tuple of RuleParts
+    :param metrics: dict of canonical metric names to values
+    :return: (bool) whether every part of the rule is beyond its threshold
+    """
+    for rule_part in rule:
+        metric = metrics.get(rule_part.metric)
+        if metric is None or not rule_part.operator(float(metric), rule_part.threshold):
+            return False
+    return True
+
+
+def match_rule(compiled, metrics):
+    """
+    :param compiled: CompiledRules
+    :param metrics: dict of canonical metric names to values
+    :return: The matched rule with the highest precedence (tuple of RuleParts), or None
+    """
+    return next((rule for rule in compiled.precedence if is_rule_matched(rule, metrics)), None)
+
+
+def track_targets(compiled, metrics, instances, max_step=None):
+    """
+    Sizes the application for its target tracking rules: each one asks for
+    ceil(instances * metric / target) instances (at most max_step away from the current instances and
+    within the application's instance limits), and the largest demand wins, so the application only
+    scales in when every target agrees.
+    :param compiled: CompiledRules
+    :param metrics: dict of canonical metric names to values
+    :param instances: The application's running instances
+    :param max_step: Max number of instances to scale by at once, for rules that do not set their own
+    :return: A rule (tuple of one RulePart) scaling by the difference to the desired instances, or None
+             when the instances should stay as they are
+    """
+    demand = None
+    for target_rule in compiled.targets:
+        metric = metrics.get(target_rule.metric)
+        if metric is None or not instances:
+            continue
+        desired = instances
+        if abs(float(metric) - target_rule.target) > target_rule.target * TARGET_DEADBAND:
+            desired = int(math.ceil(instances * float(metric) / target_rule.target))
+        step = target_rule.max_step or max_step
+        if step:
+            desired = clamp(desired, instances - step, instances + step)
+        if compiled.min_instances is not None and compiled.max_instances is not None:
+            desired = clamp(desired, compiled.min_instances, compiled.max_instances)
+        if demand is None or desired > demand[1]:
+            demand = (target_rule, desired)
+
+    if demand is None or demand[1] == instances:
+        return None
+    target_rule, desired = demand
+    return (RulePart(rule_name=target_rule.rule_name,
+                     rule_part=target_rule.rule_part,
+                     metric=target_rule.metric,
+                     operator=None,
+                     threshold=target_rule.target,
+                     tolerance=target_rule.tolerance,
+                     scale_factor=desired - instances,
+                     backoff=target_rule.backoff,
+                     weight=1.0,
+                     definition=target_rule.definition),)
+
+
+def compile_rules(app_def, prefix=None, logger=None):
+    """
+    Reads the application's scaling rules and instance limits from its labels.
+    :param app_def: ApplicationDefinition
+    :param prefix: The prefix for rule names (defaults to settings.rules_prefix)
+    :param logger: Logger
+    :return: CompiledRules
+    """
+    logger = logger or logging.getLogger(__name__)
+    label_pattern = re.compile(r"^{prefix}_(?P<ruleName>[A-Za-z0-9]+)_?(?P<rulePart>[A-Za-z0-9]+)*".format(
+        prefix=prefix or settings.rules_prefix))
+    rules, targets, min_instances, max_instances = {}, [], None, None
+    for k, v in (app_def.labels or {}).items():
+        rule_match = label_pattern.match(k)
+        if rule_match is not None:
+            rule_part = _compile_rule_part(k, v, rule_match.groupdict(), logger)
+            if isinstance(rule_part, TargetRule):
+                targets.append(rule_part)
+            elif rule_part is not None:
+                rules.setdefault(rule_part.rule_name, []).append(rule_part)
+        elif "max_instances" in k.lower():
+            max_instances = int(v)
+        elif "min_instances" in k.lower():
+            min_instances = int(v)
+    rule_parts = [rule_part for rule in rules.values() for rule_part in rule] + targets
+    retention = max([period
+                     for rule_part in rule_parts
+                     for period in (rule_part.tolerance, rule_part.backoff)] or [timedelta(0)])
+    rules = dict((rule_name, tuple(rule)) for rule_name, rule in rules.items())
+    return CompiledRules(rules=rules,
+                         precedence=rule_precedence(rules),
+                         targets=tuple(sorted(targets, key=lambda target_rule: (target_rule.rule_name,
+                                                                                target_rule.rule_part))),
+                         metrics=frozenset(rule_part.metric for rule_part in rule_parts),
+                         min_instances=min_instances,
+                         max_instances=max_instances,
+                         retention=retention)
+
+
+def _compile_rule_part(label, value, rule_info, logger):
+    """
+    :param label: The rule's label
+    :param value: The rule's label value, e.g. "cpu | >90 | PT2M | 3 | PT1M30S | 1.0"
+    :param rule_info: dict of ruleName and rulePart
+    :param logger: Logger
+    :return: RulePart (or TargetRule), or None when the rule is malformed
+    """
+    rule_values = re.split(RE_DELIMITERS, value)
+    if len(rule_values) >= 2 and RE_TARGET.match(rule_values[1]):
+        return _compile_target_rule(label, rule_values, rule_info, logger)
+    if len(rule_values) < 5:
+        logger.warn("Scaling rule identified, but wrong number of arguments. Disregarding "
+                    "{rule_name} = {rule_values}".format(rule_name=label, rule_values=rule_values))
+        return None
+    threshold = RE_THRESHOLD.search(rule_values[1])
+    try:
+        if threshold is None or threshold.group("op") not in compare:
+            raise ValueError("Unrecognized threshold {0}".format(rule_values[1]))
+        if not is_rule_metric(canonical_metric(rule_values[0])):
+            raise ValueError("Unknown metric {0}".format(rule_values[0]))
+        rule_part = RulePart(rule_name=rule_info.get("ruleName"),
+                             rule_part=rule_info.get("rulePart"),
+                             metric=canonical_metric(rule_values[0]),
+                             operator=compare[threshold.group("op")],
+                             threshold=float(threshold.group("val")),
+                             tolerance=parse_duration(rule_values[2]),
+                             scale_factor=int(rule_values[3]),
+                             backoff=parse_duration(rule_values[4]),
+                             weight=float(list_get(rule_values, 5, 1.0)),
+                             definition=dict(ruleValue=dict(metric=rule_values[0],
+                                                            threshold=threshold.groupdict(),
+                                                            tolerance=rule_values[2],
+                                                            scale_factor=rule_values[3],
+                                                            backoff=rule_values[4],
+                                                            weight=list_get(rule_values, 5, 1.0)),
+                                             ruleInfo=rule_info))
+    except Exception as ex:
+        logger.warn("Scaling rule identified, but unparseable ({error}). Disregarding "
+                    "{rule_name} = {rule_values}".format(error=ex, rule_name=label, rule_values=rule_values))
+        return None
+    return rule_part
+
+
+def _compile_target_rule(label, rule_values, rule_info, logger):
+    """
+    :param label: The rule's label
+    :param rule_values: The rule's label value split, e.g. ["cpu", "target=60", "PT2M", "3", "PT1M30S"],
+                        where the tolerance, max step and backoff are optional
+    :param rule_info: dict of ruleName and rulePart
+    :param logger: Logger
+    :return: TargetRule, or None when the rule is malformed
+    """
+    try:
+        target = float(RE_TARGET.match(rule_values[1]).group("val"))
+        if target <= 0:
+            raise ValueError("Target must be positive")
+        if not is_rule_metric(canonical_metric(rule_values[0])):
+            raise ValueError("Unknown metric {0}".format(rule_values[0]))
+        max_step = list_get(rule_values, 3)
+        target_rule = TargetRule(rule_name=rule_info.get("ruleName"),
+                                 rule_part=rule_info.get("rulePart"),
+                                 metric=canonical_metric(rule_values[0]),
+                                 target=target,
+                                 tolerance=parse_duration(list_get(rule_values, 2, DEFAULT_TARGET_TOLERANCE)),
+                                 max_step=int(max_step) if max_step else None,
+                                 backoff=parse_duration(list_get(rule_values, 4, DEFAULT_TARGET_BACKOFF)),
+                                 definition=dict(ruleValue=dict(metric=rule_values[0],
+                                                                target=rule_values[1],
+                                                                tolerance=list_get(rule_values, 2,
+                                                                                   DEFAULT_TARGET_TOLERANCE),
+                                                                max_step=max_step,
+                                                                backoff=list_get(rule_values, 4,
+                                                                                 DEFAULT_TARGET_BACKOFF)),
+                                                 ruleInfo=rule_info))
+        if target_rule.max_step is not None and target_rule.max_step <= 0:
+            raise ValueError("Max step must be positive")
+    except Exception as ex:
+        logger.warn("Target tracking rule identified, but unparseable ({error}). Disregarding "
+                    "{rule_name} = {rule_values}".format(error=ex, rule_name=label, rule_values=rule_values))
+        return None
+    return target_rule
+
+
+class RulesCache(object):
+    """
+    Compiled rules of each application, keyed by application id and version, so labels are only parsed
+    when an application is deployed or changed. The least recently used entries are evicted first, which
+    drops applications that are gone and versions that were replaced.
+    """
+    def __init__(self, size=None, logger=None):
+        """
+        :param size: Max number of compiled applications kept
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.size = size or DEFAULT_RULES_CACHE_SIZE
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, app_def):
+        """
+        :param app_def: ApplicationDefinition
+        :return: The application's CompiledRules
+        """
+        key = (app_def.id, app_def.version)
+        compiled = self.entries.pop(key, None)
+        if compiled is None:
+            self.misses += 1
+            compiled = compile_rules(app_def, logger=self.logger)
+            if len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self.entries[key] = compiled
+        return compiled
+
 
 class RulesManager(object):
     """
@@ -29,11 +309,16 @@ class RulesManager(object):
             }
         }
     }
+    Rules are compiled into RuleParts once per application version when a RulesCache is given.
     """
-    def __init__(self, app_def, logger=None):
+    def __init__(self, app_def, logger=None, rules_cache=None):
         self.logger = logger or logging.getLogger(__name__)
         self.app_def = app_def
-        self.rules = self._find_autoscaler_rules()
+        self.compiled = rules_cache.get(app_def) if rules_cache is not None else \
+            compile_rules(app_def, logger=self.logger)
+        self.rules = self.compiled.rules
+        self.min_instances = self.compiled.min_instances
+        self.max_instances = self.compiled.max_instances
         self._last_triggered_rule = None
 
     def trigger_rules(self, metrics):
@@ -43,74 +328,53 @@ class RulesManager(object):
         :return: The recently triggered rule
         """
 
-        triggered_rule = self._get_matched_rule(metrics)
+        triggered_rule = match_rule(self.compiled, dict((canonical_metric(metric_name), metric_value)
+                                                        for metric_name, metric_value in metrics.items()))
+        return self.set_triggered_rule(triggered_rule, metrics)
 
+    def set_triggered_rule(self, triggered_rule, metrics=None):
+        """
+        Records a rule matched to the application's metrics, e.g. by a RulesEvaluator.
+        :param triggered_rule: The matched rule (tuple of RuleParts), or None
+        :param metrics: dict of metric values the rule was matched to (the match is only logged when given)
+        :return: The recently triggered rule
+        """
         self._last_triggered_rule = triggered_rule
+        if metrics is None:
+            return self.last_triggered_rule
         info_msg = "{app_name}: metrics: {metrics}"
         self.logger.info(info_msg.format(app_name=self.app_def.app_name,
                                          metrics=metrics))
         info_msg = "{app_name}: last_triggered_rule set to: {triggered_rule}"
         self.logger.info(info_msg.format(app_name=self.app_def.app_name,
-                                         triggered_rule=triggered_rule))
-        return self._last_triggered_rule
+                                         triggered_rule=self.last_triggered_rule))
+        return self.last_triggered_rule
 
     @property
     def last_triggered_rule(self):
         """
         The last rule triggered by the RuleManager
-        :return:
+        :return: list of rule part dicts
         """
         triggered_rule = None
         if self._last_triggered_rule is not None:
-            triggered_rule = self._last_triggered_rule
+            triggered_rule = [rule_part.definition for rule_part in self._last_triggered_rule]
         return triggered_rule
 
     @property
     def last_triggered_criteria(self):
         """
         A helper property to aim at providing the core criteria of the last triggered rule.
-        :return: A dict of rule criteria
+        :return: A dict of rule criteria: scale_factor (int), tolerance and backoff (datetime.timedelta)
         """
         criteria = {}
         if self._last_triggered_rule is not None:
-            rule_value = self._last_triggered_rule[0].get("ruleValue")
-            criteria = dict(scale_factor=rule_value.get("scale_factor"),
-                            tolerance=rule_value.get("tolerance"),
-                            backoff=rule_value.get("backoff"))
+            rule_part = self._last_triggered_rule[0]
+            criteria = dict(scale_factor=rule_part.scale_factor,
+                            tolerance=rule_part.tolerance,
+                            backoff=rule_part.backoff)
         return criteria
 
-    def _find_autoscaler_rules(self):
-        rules_found = {}
-        if self.app_def.labels:
-            for k, v in self.app_def.labels.items():
-                rule_match = re.match(r"^{prefix}_(?P<ruleName>[A-Za-z0-9]+)_?(?P<rulePart>[A-Za-z0-9]+)*".format(
-                    prefix=settings.rules_prefix), k)
-                if rule_match is not None:
-                    rule_values = re.split(RE_DELIMITERS, v)
-                    if len(rule_values) < 5:
-                        self.logger.warn("Scaling rule identified, but wrong number of arguments. Disregarding "
-                                         "{rule_name} = {rule_values}".format(rule_name=k,
-                                                                              rule_values=rule_values))
-                        continue
-
-                    rule_values_dict = dict(metric=rule_values[0],
-                                            threshold=self._parse_threshold(rule_values[1]),
-                                            tolerance=rule_values[2],
-                                            scale_factor=rule_values[3],
-                                            backoff=rule_values[4],
-                                            weight=list_get(rule_values, 5, 1.0))
-                    rules_found[k] = dict(ruleValue=rule_values_dict, ruleInfo=rule_match.groupdict())
-                elif "max_instances" in k.lower():
-                    self.max_instances = int(v)
-                elif "min_instances" in k.lower():
-                    self.min_instances = int(v)
-        interpreted_rules = defaultdict(list)
-        if rules_found:
-            [interpreted_rules[v.get("ruleInfo").get("ruleName")].append(v)
-             for k, v in rules_found.items()]
-
-        return dict(interpreted_rules)
-
     def is_app_participating(self):
         """ Determine if the application is ready for scale actions
         :return: application's participation in auto_scaling
@@ -142,90 +406,3 @@ class RulesManager(object):
         self.logger.info("{0}: application ready: {1}".format(
             self.app_def.app_name, result))
         return result
-
-    def _get_matched_rule(self, metrics):
-        matched_rule = None
-        rules_found = []
-        for rule_name, rule in self.rules.items():
-            rule_criteria_count = len(rule)
-            matched_rule_criteria = [rule_item
-                                     for rule_item in rule
-                                     for metric_name, metric_value in metrics.items()
-                                     if rule_item.get("ruleValue").get("metric") in metric_name and
-                                     self._beyond_threshold(metric_value, rule_item.get("ruleValue").get("threshold"))]
-            if len(matched_rule_criteria) == rule_criteria_count:
-                rules_found.append(rule)
-
-        self.logger.debug("triggering rules by metrics: {rules_found}".format(rules_found=rules_found))
-
-        if len(rules_found) > 1:
-            matched_rule = self._find_best_matched_rule_by_criteria(rules_found)
-        elif len(rules_found) == 1:
-            matched_rule = rules_found[0]
-
-        return matched_rule
-
-    def _find_best_matched_rule_by_criteria(self, rules):
-        """
-        This is the Highlander method; there can only be one...
-        Round 1 : Who has the most rule criteria matched?
-        :param rules:
-        :return:
-        """
-        rule_criteria_counter = Counter()
-        for rule in rules:
-            rule_criteria_counter[rule[0].get("ruleInfo").get("ruleName")] = len(rule)
-
-        most_critical_rule_names = [k for k, v in rule_criteria_counter.items()
-                                    if v == rule_criteria_counter.most_common()[0][1]]
-
-        if len(most_critical_rule_names) > 1:
-            critical_rules = {name: next(rule
-                                         for rule_parts in rules
-                                         for rule in rule_parts
-                                         if name in rule.get("ruleInfo").get("ruleName"))
-                              for name in most_critical_rule_names}
-            winning_rule = self._find_best_matched_rule_by_weight(critical_rules)
-        else:
-            winning_rule = [rule
-                            for rule_parts in rules
-                            for rule in rule_parts
-                            if most_critical_rule_names[0] in
-                            rule.get("ruleInfo").get("ruleName")]
-        self.logger.debug("winning rule by criteria: {winning_rule}".format(winning_rule=winning_rule))
-        return winning_rule
-
-    def _find_best_matched_rule_by_weight(self, rules):
-        """
-        Round 2 : Which rule has the most weight? Weight is multiplied against scale_factor
-        :param rules: A dict of rules
-        :return: One rule with the maximum weight
-        """
-        self.logger.debug(rules)
-        rule_weights = {rule.get("ruleInfo").get("ruleName"): abs(rule.get("ruleValue").get("scale_factor") *
-                                                                  rule.get("ruleValue").get("weight"))
-                        for rule_name, rule in rules.items()}
-        self.logger.debug("winning rule by weight: {weighted_rule}".format(weighted_rule=rules.get(max(rule_weights))))
-
-        return rules.get(max(rule_weights))
-
-    def _parse_threshold(self, threshold):
-        """
-        Parses the string representing the threshold. A threshold is a comparison operator and number.
-        :param threshold: String
-        :return: Lambda expression matching the operator
-        """
-        m = re.search(RE_THRESHOLD, threshold)
-        return m.groupdict()
-
-    def _beyond_threshold(self, metric, threshold):
-        """
-        This will answer whether the metric has met or exceeded the threshold. It uses
-        the dictionary created above, compare, to look up the operation, th["op"] and
-        passes the metric and threshold value, th["val"] to the lambda expression that
-        corresponds with the operation.
-        :param metric: The performance metric (cpu, memory, etc...)
-        :param threshold: String representation of the threshold (>, <, =, ==, <=, >=)
-        :return: (bool)
-        """
-        return compare[threshold["op"]](float(metric), float(threshold["val"]))
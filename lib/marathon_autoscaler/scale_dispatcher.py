@@ -0,0 +1,124 @@
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+import logging
+import threading
+import time
+
+DEFAULT_SCALE_CONCURRENCY = 8
+DEFAULT_SCALE_RATE = 10.0
+
+# An application's scale action, queued while deciding (when, in seconds since the epoch)
+ScaleAction = namedtuple("ScaleAction", ["app_id", "app_name", "instances", "decided"])
+
+# The outcome of a dispatched scale action: HTTP status (None when Marathon could not be reached), seconds the
+# request took, seconds it waited for the rate limit and Marathon's response
+ScaleOutcome = namedtuple("ScaleOutcome", ["app_id", "app_name", "instances", "status", "latency", "throttled",
+                                           "response"])
+
+
+def is_scaled(outcome):
+    """
+    :param outcome: ScaleOutcome
+    :return: (bool) whether Marathon accepted the scale action
+    """
+    return outcome.status is not None and 200 <= outcome.status < 300
+
+
+class TokenBucket(object):
+    """
+    Lets `rate` actions through per second on average, and bursts of up to `burst` at once. Thread-safe.
+    """
+    def __init__(self, rate, burst=None, clock=None, sleep=None):
+        """
+        :param rate: Tokens added per second
+        :param burst: Max number of tokens held (defaults to the rate)
+        :param clock: Function returning the current time in seconds (defaults to time.time)
+        :param sleep: Function waiting a number of seconds (defaults to time.sleep)
+        """
+        self.rate = float(rate)
+        self.burst = max(float(burst or rate), 1.0)
+        self.clock = clock or time.time
+        self.sleep = sleep or time.sleep
+        self.tokens = self.burst
+        self.updated = self.clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+        :return: Seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class ScaleDispatcher(object):
+    """
+    Sends the scale actions of a decision cycle to Marathon concurrently, so one slow PUT does not hold up
+    the applications after it. At most `concurrency` requests are in flight at once, and a token bucket
+    shared by all of them keeps a cluster-wide surge from sending Marathon more than `rate` requests per
+    second (after an initial burst). The worker pool is started on the first dispatch and reused across
+    cycles; it must be released with close().
+    """
+    def __init__(self, marathon_client, concurrency=None, rate=None, burst=None, logger=None):
+        """
+        :param marathon_client: Marathon client
+        :param concurrency: Max number of scale requests in flight at once
+        :param rate: Max number of scale requests per second (0 for no limit)
+        :param burst: Max number of scale requests sent at once before the rate applies (defaults to the rate)
+        :param logger: Logger
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.marathon_client = marathon_client
+        self.concurrency = concurrency or DEFAULT_SCALE_CONCURRENCY
+        rate = DEFAULT_SCALE_RATE if rate is None else rate
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.pool = None
+
+    def _scale(self, action):
+        """
+        The pool task: waits for the rate limit and sends one scale action.
+        :param action: ScaleAction
+        :return: ScaleOutcome
+        """
+        throttled = self.bucket.acquire() if self.bucket is not None else 0.0
+        status = response = None
+        started = time.time()
+        try:
+            status, response = self.marathon_client.scale_app(action.app_id, action.instances, with_status=True)
+        except Exception as ex:
+            self.logger.error("{0}: scale to {1} failed: {2}".format(action.app_name, action.instances, ex))
+        return ScaleOutcome(action.app_id, action.app_name, action.instances, status, time.time() - started,
+                            throttled, response)
+
+    def dispatch(self, actions):
+        """
+        Sends the scale actions and waits for all of them to complete.
+        :param actions: list of ScaleActions
+        :return: list of the ScaleOutcome of each action, in the same order
+        """
+        if not actions:
+            return []
+        if self.pool is None:
+            self.pool = ThreadPool(processes=self.concurrency)
+        return self.pool.map(self._scale, actions, chunksize=1)
+
+    def close(self):
+        """
+        Stops the worker pool.
+        :return: None
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -1,11 +1,26 @@
+from capacity import ClusterCapacity, instance_ports
+from collections import namedtuple
 from datetime import datetime
+from deployment_tracker import DeploymentTracker
 from constants import IDLE
+from flap_detector import parse_flap_signatures
+from forecasting import Forecaster
 import logging
 from utils import clamp
-from rules_manager import RulesManager
+from rule_metrics import forecast_base, required_counters, rule_metrics
+from rules_evaluator import RulesEvaluator
+from rules_manager import RulesCache, RulesManager, track_targets
+from scale_dispatcher import ScaleAction, ScaleDispatcher, is_scaled
+from history_journal import HistoryJournal
 from history_manager import HistoryManager
+from launch_queue import LaunchQueue
+import time
 from application_definition import ApplicationDefinition
 
+# An application's evaluation: its vote, the scale factor asked for, the triggered rule (tuple of RuleParts, or None)
+# and the decision (None when no decision was made)
+AppEvaluation = namedtuple("AppEvaluation", ["vote", "scale_factor", "rule", "decision"])
+
 
 class AutoScaler(object):
     """
@@ -16,18 +31,63 @@ class AutoScaler(object):
         self.logger = logger or logging.getLogger(__name__)
         self.dd_client = dd_client
         self.enforce_version_match = False
-        self.hm = HistoryManager(dd_client=dd_client)
+        flap_signatures = flap_window = history_max_events = journal = rules_cache_size = None
+        numpy_rules = False
+        self.target_max_step = None
+        self.capacity_admission = False
+        forecast_horizon = "PT2M"
+        forecast_season = None
+        forecast_options = {}
+        dispatcher_options = {}
+        queue_options = {}
         if cli_args is not None:
             self.enforce_version_match = cli_args.enforce_version_match
+            if cli_args.flap_signatures:
+                flap_signatures = parse_flap_signatures(cli_args.flap_signatures)
+            flap_window = cli_args.flap_window
+            history_max_events = cli_args.history_max_events
+            rules_cache_size = cli_args.rules_cache_size
+            numpy_rules = cli_args.numpy_rules
+            self.target_max_step = cli_args.target_max_step
+            self.capacity_admission = cli_args.capacity_admission
+            forecast_horizon = cli_args.forecast_horizon
+            forecast_season = cli_args.forecast_season
+            forecast_options = dict(alpha=cli_args.forecast_alpha,
+                                    beta=cli_args.forecast_beta,
+                                    gamma=cli_args.forecast_gamma)
+            dispatcher_options = dict(concurrency=cli_args.scale_concurrency,
+                                      rate=cli_args.scale_rate,
+                                      burst=cli_args.scale_burst)
+            queue_options = dict(max_count=cli_args.queue_max_count,
+                                 max_delay=cli_args.queue_max_delay)
+            if cli_args.history_journal:
+                journal = HistoryJournal(cli_args.history_journal, max_bytes=cli_args.history_journal_max_bytes)
+        self.hm = HistoryManager(dd_client=dd_client, max_events=history_max_events,
+                                 flap_signatures=flap_signatures, flap_window=flap_window, journal=journal)
+        self.rules_cache = RulesCache(size=rules_cache_size)
+        self.rules_evaluator = RulesEvaluator(use_numpy=numpy_rules)
+        self.referenced_metrics = frozenset()
+        self.forecaster = Forecaster(self.hm.get_timedelta(forecast_horizon),
+                                     season=self.hm.get_timedelta(forecast_season) if forecast_season else None,
+                                     **forecast_options)
+        self.dispatcher = ScaleDispatcher(marathon_client, **dispatcher_options)
+        self.scale_actions = []
+        self.scale_outcomes = []
+        self.deployments = DeploymentTracker(marathon_client)
+        self.capacity = ClusterCapacity()
+        self.capacity_reductions = []
+        self.launch_queue = LaunchQueue(marathon_client, **queue_options)
 
     def scale(self, app_def, rule_manager):
-        """ Take scale action
+        """ Queue the scale action, sent once every application has been decided on. With capacity admission,
+        a scale-up is reduced to the instances the cluster has room for, and deferred when it has none. A scale-up
+        of an application whose launch queue backlog is over the limits is deferred as well.
         :param app_def: dict of marathon application settings
         :param rule_manager: object of scaling properties.
-        :return: marathon response
+        :return: (bool) whether the decision stands (False when the scale-up was deferred)
         """
         if not app_def.is_app_participating:
-            return
+            return True
 
         scale_factor = int(rule_manager.last_triggered_criteria.get("scale_factor"))
         min_instances = int(rule_manager.min_instances)
@@ -40,67 +100,178 @@ class AutoScaler(object):
             msg = "{app_name}: application already scaled to {size}"
             self.logger.info(msg.format(app_name=app_def.app_name,
                                         size=scale_to_size))
-            return
+            return True
+
+        if scale_to_size > app_def.instances and self.launch_queue.suppress(app_def.app_name, app_def.id):
+            return False
+
+        if scale_to_size > app_def.instances and self.capacity_admission and self.capacity.known:
+            requested = scale_to_size - app_def.instances
+            granted = self.capacity.admit(app_def.cpus, app_def.mem, instance_ports(app_def), requested)
+            if granted < requested:
+                self.capacity_reductions.append((app_def.app_name, requested, granted))
+                msg = "{app_name}: room for {granted} of {requested} more instances in the cluster"
+                self.logger.warn(msg.format(app_name=app_def.app_name, granted=granted, requested=requested))
+            if granted == 0:
+                self.logger.warn("{app_name}: scale up deferred".format(app_name=app_def.app_name))
+                return False
+            scale_to_size = app_def.instances + granted
+
+        self.scale_actions.append(ScaleAction(app_def.id, app_def.app_name, scale_to_size, time.time()))
+        return True
+
+    def dispatch_scale_actions(self):
+        """ Send the queued scale actions to Marathon and track the deployments they started
+        :return: list of the ScaleOutcome of each action
+        """
+        actions, self.scale_actions = self.scale_actions, []
+        self.scale_outcomes = self.dispatcher.dispatch(actions)
+        for action, outcome in zip(actions, self.scale_outcomes):
+            if is_scaled(outcome):
+                self.deployments.track(action, outcome)
+            msg = "{app_name}: {result} {size} (HTTP {status} in {latency:.3f}s, throttled {throttled:.3f}s)"
+            log = self.logger.info if is_scaled(outcome) else self.logger.error
+            log(msg.format(app_name=outcome.app_name,
+                           result="scaled to" if is_scaled(outcome) else "failed to scale to",
+                           size=outcome.instances,
+                           status=outcome.status,
+                           latency=outcome.latency,
+                           throttled=outcome.throttled))
+        return self.scale_outcomes
+
+    def history_retention(self, rule_manager):
+        """ How much decision history the application's rules look back on
+        :param rule_manager: object of scaling properties.
+        :return: datetime.timedelta of the longest tolerance or backoff among the rules
+        """
+        return rule_manager.compiled.retention
+
+    def required_counters(self):
+        """ The executor statistics needed by the metrics the participating applications' rules referenced
+        on the last decision
+        :return: tuple of executor statistics
+        """
+        return required_counters(self.referenced_metrics)
+
+    def evaluate(self, app, app_def, rule_manager, metrics, matched_rule, right_now):
+        """ Evaluate an application's votes and decision, without changing any state but the rule manager's
+        triggered rule, so applications can be evaluated in any order
+        :param app: Application's name
+        :param app_def: dict of marathon application settings
+        :param rule_manager: object of scaling properties.
+        :param metrics: dict of the metrics the application's rules reference
+        :param matched_rule: The application's matched threshold rule (tuple of RuleParts), or None
+        :param right_now: DateTime of the decision
+        :return: AppEvaluation
+        """
+        rm = rule_manager
+        vote = 0
+        scale_factor = 0
+        decision = None
+
+        # target tracking rules size the application when none of its threshold rules matched
+        if matched_rule is None and rm.compiled.targets:
+            matched_rule = track_targets(rm.compiled, metrics, app_def.tasksRunning, self.target_max_step)
+        rm.set_triggered_rule(matched_rule, metrics)
+
+        if rm.last_triggered_criteria:
+            scale_factor = int(rm.last_triggered_criteria.get("scale_factor"))
+            vote = 1 if scale_factor > 0 else -1
 
-        self.marathon_client.scale_app(app_def.id, scale_to_size)
-        msg = "{app_name}: scaled to {size}"
-        self.logger.info(msg.format(app_name=app_def.app_name,
-                                    size=scale_to_size))
+        info_msg = "{app_name}: vote: {vote} ; scale_factor requested: {scale_factor}"
+        self.logger.info(info_msg.format(app_name=app_def.app_name,
+                                         vote=vote,
+                                         scale_factor=scale_factor))
+        # Check if app is participating
+        # Check if app is ready
+        # Check if app instances is greater than or equal to min and less than max
+        # Check if a deployment of the app is outstanding
+
+        if (rm.is_app_ready() and
+                rm.is_app_within_min_or_max() and
+                rm.last_triggered_criteria):
+            if self.deployments.is_deploying(app_def.id):
+                self.logger.info("{app}: Deployment in progress, no decision.".format(app=app_def.app_name))
+                return AppEvaluation(vote, scale_factor, matched_rule, decision)
+            tolerance_reached = self.hm.tolerance_reached(app,
+                                                          rm.last_triggered_criteria.get("tolerance"),
+                                                          vote,
+                                                          right_now=right_now)
+            within_backoff = self.hm.within_backoff(app,
+                                                    rm.last_triggered_criteria.get("backoff"),
+                                                    vote,
+                                                    right_now=right_now)
+
+            if vote is not IDLE and tolerance_reached and not within_backoff:
+                self.logger.info("{app}: Decision made: Scale.".format(app=app_def.app_name))
+                decision = vote
+            elif vote == IDLE:
+                decision = IDLE
+                self.logger.info("{app}: Decision made: No Change.".format(app=app_def.app_name))
+        return AppEvaluation(vote, scale_factor, matched_rule, decision)
+
+    def evaluate_apps(self, participating_apps, matched_rules, right_now):
+        """ Evaluate every participating application
+        :param participating_apps: list of each application's name, definition, rule manager and metrics
+        :param matched_rules: list of each application's matched threshold rule
+        :param right_now: DateTime of the decision
+        :return: list of each application's AppEvaluation
+        """
+        return [self.evaluate(app, app_def, rm, metrics, matched_rule, right_now)
+                for (app, app_def, rm, metrics), matched_rule in zip(participating_apps, matched_rules)]
 
     def decide(self, app_metrics_summary):
         """
-        The decision-maker of the autoscaler.
+        The decision-maker of the autoscaler. Metrics and forecasts are gathered and every application's
+        rules are matched, then each application is evaluated, and finally the evaluations are committed in
+        order: the history is written and scale actions are queued and sent.
         :param app_metrics_summary: dict of app definitions and metrics
         :return: None
         """
         self.logger.info("Decision process beginning.")
 
-        app_scale_recommendations = {}
+        participating_apps = []
+        forecast_apps = set()
         for app, metrics_summary in app_metrics_summary.items():
             app_def = ApplicationDefinition(metrics_summary.get("application_definition"))
-            rm = RulesManager(app_def)
+            rm = RulesManager(app_def, rules_cache=self.rules_cache)
             if rm.is_app_participating():
-                vote = 0
-                scale_factor = 0
-                cpu = metrics_summary.get("cpu_avg_usage")
-                mem = metrics_summary.get("memory_avg_usage")
-                metrics = dict(cpu=cpu,
-                               mem=mem)
-
-                rm.trigger_rules(metrics)
-
-                if rm.last_triggered_criteria:
-                    scale_factor = int(rm.last_triggered_criteria.get("scale_factor"))
-                    vote = 1 if scale_factor > 0 else -1
-
-                app_scale_recommendations[app] = dict(vote=vote,
-                                                      checksum=app_def.version,
-                                                      timestamp=datetime.now(),
-                                                      rule=rm.last_triggered_rule)
-                info_msg = "{app_name}: vote: {vote} ; scale_factor requested: {scale_factor}"
-                self.logger.info(info_msg.format(app_name=app_def.app_name,
-                                                 vote=vote,
-                                                 scale_factor=scale_factor))
-                # Check if app is participating
-                # Check if app is ready
-                # Check if app instances is greater than or equal to min and less than max
-
-                if (rm.is_app_ready() and
-                        rm.is_app_within_min_or_max() and
-                        rm.last_triggered_criteria):
-                    tolerance_reached = self.hm.tolerance_reached(app,
-                                                                  rm.last_triggered_criteria.get("tolerance"),
-                                                                  vote)
-                    within_backoff = self.hm.within_backoff(app,
-                                                            rm.last_triggered_criteria.get("backoff"),
-                                                            vote)
-
-                    if vote is not IDLE and tolerance_reached and not within_backoff:
-                        self.logger.info("{app}: Decision made: Scale.".format(app=app_def.app_name))
-                        app_scale_recommendations[app]["decision"] = vote
-                        self.scale(app_def, rm)
-                    elif vote == IDLE:
-                        app_scale_recommendations[app]["decision"] = IDLE
-                        self.logger.info("{app}: Decision made: No Change.".format(app=app_def.app_name))
+                # only the metrics the application's rules reference are computed
+                metrics = rule_metrics(metrics_summary, app_def, rm.compiled.metrics)
+                forecast_metrics = [metric for metric in rm.compiled.metrics if forecast_base(metric)]
+                if forecast_metrics:
+                    forecasts = self.forecaster.observe(app, rule_metrics(
+                        metrics_summary, app_def, [forecast_base(metric) for metric in forecast_metrics]))
+                    metrics.update((metric, forecasts[forecast_base(metric)]) for metric in forecast_metrics)
+                    forecast_apps.add(app)
+                participating_apps.append((app, app_def, rm, metrics))
+        self.forecaster.retain(forecast_apps)
+        self.referenced_metrics = frozenset(metric for _, _, rm, _ in participating_apps
+                                            for metric in rm.compiled.metrics)
+
+        matched_rules = self.rules_evaluator.evaluate([rm.compiled for _, _, rm, _ in participating_apps],
+                                                      [metrics for _, _, _, metrics in participating_apps])
+
+        # every application is evaluated against the history as it was when the cycle began
+        right_now = datetime.now()
+        evaluations = self.evaluate_apps(participating_apps, matched_rules, right_now)
+
+        app_scale_recommendations = {}
+        self.capacity_reductions = []
+        for (app, app_def, rm, metrics), evaluation in zip(participating_apps, evaluations):
+            self.hm.set_retention(app, self.history_retention(rm))
+            rm.set_triggered_rule(evaluation.rule)
+            app_scale_recommendations[app] = dict(vote=evaluation.vote,
+                                                  checksum=app_def.version,
+                                                  timestamp=right_now,
+                                                  rule=rm.last_triggered_rule)
+            if evaluation.decision is not None:
+                app_scale_recommendations[app]["decision"] = evaluation.decision
+                # a deferred scale-up is not a decision, so it is retried without waiting for its backoff
+                if evaluation.decision is not IDLE and not self.scale(app_def, rm):
+                    del app_scale_recommendations[app]["decision"]
 
         self.hm.add_to_perf_tail(app_scale_recommendations)
+        self.dispatch_scale_actions()
+        self.logger.debug("Rules cache: {0} applications, {1} hits, {2} misses".format(
+            len(self.rules_cache), self.rules_cache.hits, self.rules_cache.misses))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compares the legacy per-pass multiprocessing Pool scrape with the AgentStatisticsCollector
+against a local fake agent fleet.
+
+    python tests/benchmarks/bench_agent_collector.py --agents 200 --latency 0.02
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+sys.path.append(BASE_PATH)
+
+from collector import AgentStatisticsCollector
+from fake_agents import FakeAgentFleet
+from mesosagent import MesosAgent
+
+AGENT_PORT = None
+
+
+def get_mesos_agent_statistics(agent_host):
+    """ The legacy Poller worker function. """
+    return agent_host, MesosAgent("http://{0}:{1}/".format(agent_host, AGENT_PORT)).get_statistics()
+
+
+def legacy_pool_collect(agent_hosts, cpu_fan_out=None):
+    """ A faithful copy of the per-pass Pool scrape previously found in Poller.poll """
+    agent_hosts_stats = {}
+    fan_out_procs = cpu_fan_out or len(agent_hosts)
+    maxtasks = int(len(agent_hosts) / fan_out_procs) if int(len(agent_hosts) / fan_out_procs) else 1
+    pool = Pool(processes=fan_out_procs, maxtasksperchild=maxtasks)
+    for agent_host, stats in pool.imap_unordered(get_mesos_agent_statistics, agent_hosts):
+        agent_hosts_stats[agent_host] = stats
+    pool.close()
+    pool.join()
+    return agent_hosts_stats
+
+
+def timed(label, func, rounds):
+    timings = []
+    result = None
+    for _ in range(rounds):
+        started = time.time()
+        result = func()
+        timings.append(time.time() - started)
+    scraped = len([stats for stats in result.values() if stats])
+    print("{0:<40} best {1:8.3f}s  mean {2:8.3f}s  agents scraped {3}".format(
+        label, min(timings), sum(timings) / len(timings), scraped))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Agent statistics collection benchmark")
+    p.add_argument("--agents", type=int, default=200, help="Number of fake agents")
+    p.add_argument("--executors", type=int, default=20, help="Executors per agent")
+    p.add_argument("--latency", type=float, default=0.02, help="Mean agent response latency in seconds")
+    p.add_argument("--cpu-fan-out", type=int, default=None, help="Pool size for the legacy path")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[16, 32, 64], help="Collector concurrency limits")
+    p.add_argument("--rounds", type=int, default=3)
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    fleet = FakeAgentFleet(executors_per_agent=args.executors, latency=args.latency).start()
+    global AGENT_PORT
+    AGENT_PORT = fleet.port
+    agent_hosts = FakeAgentFleet.agent_hosts(args.agents)
+    try:
+        print("{0} agents x {1} executors, ~{2}s latency".format(args.agents, args.executors, args.latency))
+        timed("legacy Pool (fan out {0})".format(args.cpu_fan_out or len(agent_hosts)),
+              lambda: legacy_pool_collect(agent_hosts, args.cpu_fan_out), args.rounds)
+        for concurrency in args.concurrency:
+            collector = AgentStatisticsCollector(fleet.port, concurrency=concurrency)
+            timed("collector (concurrency {0})".format(concurrency),
+                  lambda: collector.collect(agent_hosts), args.rounds)
+            collector.close()
+    finally:
+        fleet.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Compares the legacy per-executor dict aggregation of Poller.poll with the ExecutorStatsAggregator
+(pure Python and NumPy) at increasing executor counts.
+
+    python tests/benchmarks/bench_aggregation.py --executors 10000 100000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+
+from aggregation import ExecutorStatsAggregator, np
+
+
+def legacy_summarize(previous_stats, current_stats):
+    """ A faithful copy of the differential and summary code previously found in Poller.poll """
+    executor_stats = defaultdict(list)
+    for sample in (previous_stats, current_stats):
+        for key, data in sample.items():
+            executor_stats[key].append(data)
+
+    all_diffs = {}
+    for key, stat in executor_stats.items():
+        if len(stat) != 2:
+            continue
+        host = stat[0].get("host")
+        first_stats = stat[0].get("stats")
+        second_stats = stat[1].get("stats")
+        if "timestamp" in second_stats and "timestamp" in first_stats:
+            sys_cpu_delta = second_stats["cpus_system_time_secs"] - first_stats["cpus_system_time_secs"]
+            user_cpu_delta = second_stats["cpus_user_time_secs"] - first_stats["cpus_user_time_secs"]
+            timestamp_delta = second_stats["timestamp"] - first_stats["timestamp"]
+            mem_total = first_stats["mem_limit_bytes"]
+            mem_used = second_stats["mem_rss_bytes"]
+            cpu_total_usage = ((sys_cpu_delta + user_cpu_delta) / timestamp_delta) * 100
+            memory_total_usage = (float(mem_used) / mem_total) * 100
+            all_diffs[key] = dict(timestamp=timestamp_delta,
+                                  cpus_system_time_secs=sys_cpu_delta,
+                                  cpus_user_time_secs=user_cpu_delta,
+                                  cpu_total_usage=cpu_total_usage,
+                                  memory_total_usage=memory_total_usage,
+                                  host=host,
+                                  executor_id=key)
+
+    app_metric_map = defaultdict(list)
+    for key in all_diffs.keys():
+        app_metric_map[key.split(".")[0]].append(all_diffs[key])
+
+    app_metric_summation = {}
+    for app, metrics in app_metric_map.items():
+        metric_sums = {}
+        cpu_values = [metric["cpu_total_usage"] for metric in metrics]
+        metric_sums["cpu_avg_usage"] = sum(cpu_values) / len(cpu_values)
+        metric_sums["max_cpu"] = max([(metric["cpu_total_usage"], metric["executor_id"], metric["host"])
+                                      for metric in metrics])
+        memory_values = [metric["memory_total_usage"] for metric in metrics]
+        metric_sums["memory_avg_usage"] = sum(memory_values) / len(memory_values)
+        metric_sums["max_memory"] = max([(metric["memory_total_usage"], metric["executor_id"], metric["host"])
+                                         for metric in metrics])
+        metric_sums["executor_metrics"] = metrics
+        app_metric_summation[app] = metric_sums
+    return app_metric_summation
+
+
+def executor_samples(executors, executors_per_app):
+    rnd = random.Random(executors)
+    previous, current = {}, {}
+    for index in range(executors):
+        executor_id = "app-{0}.{1}".format(index // executors_per_app, index)
+        host = "10.0.{0}.{1}".format(index // 250 % 250, index % 250)
+        seconds = rnd.uniform(0, 10000)
+        previous[executor_id] = {"host": host, "stats": {"cpus_user_time_secs": seconds,
+                                                         "cpus_system_time_secs": seconds / 4,
+                                                         "timestamp": 1000.0,
+                                                         "mem_limit_bytes": 1073741824,
+                                                         "mem_rss_bytes": rnd.randint(1, 1073741824)}}
+        current[executor_id] = {"host": host, "stats": {"cpus_user_time_secs": seconds + rnd.uniform(0, 3),
+                                                        "cpus_system_time_secs": seconds / 4 + rnd.uniform(0, 1),
+                                                        "timestamp": 1000.0 + rnd.uniform(3, 4),
+                                                        "mem_limit_bytes": 1073741824,
+                                                        "mem_rss_bytes": rnd.randint(1, 1073741824)}}
+    return previous, current
+
+
+def timed(label, func, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.time()
+        func()
+        timings.append(time.time() - started)
+    print("  {0:<28} best {1:8.3f}s  mean {2:8.3f}s".format(label, min(timings), sum(timings) / len(timings)))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Executor statistics aggregation benchmark")
+    p.add_argument("--executors", type=int, nargs="+", default=[10000, 100000])
+    p.add_argument("--executors-per-app", type=int, default=10)
+    p.add_argument("--rounds", type=int, default=3)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    app_key_for_executor = lambda executor_id: executor_id.split(".")[0]
+    for executors in args.executors:
+        previous, current = executor_samples(executors, args.executors_per_app)
+        print("{0} executors, {1} per app".format(executors, args.executors_per_app))
+        timed("legacy", lambda: legacy_summarize(previous, current), args.rounds)
+        rows = ExecutorStatsAggregator(use_numpy=False)
+        timed("aggregator (pure Python)", lambda: rows.summarize(previous, current, app_key_for_executor),
+              args.rounds)
+        if np is not None:
+            columns = ExecutorStatsAggregator(use_numpy=True)
+            timed("aggregator (NumPy)", lambda: columns.summarize(previous, current, app_key_for_executor),
+                  args.rounds)
+
+
+if __name__ == "__main__":
+    main()
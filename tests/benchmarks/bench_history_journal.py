@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Measures the history journal: its size, how long a restart takes to recover the decision history
+from it, and how long a compaction takes.
+
+    python tests/benchmarks/bench_history_journal.py --apps 1000 5000 --minutes 60 --interval 5
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+
+from history_journal import HistoryJournal
+from history_manager import HistoryManager, NO_DECISION, to_seconds
+
+
+def write_journal(path, apps, cycles, interval):
+    """ Records the history of `apps` applications over `cycles` polling cycles, as HistoryManager would """
+    journal = HistoryJournal(path, max_bytes=1 << 62)
+    journal.replay()
+    started = to_seconds(datetime.now()) - cycles * interval
+    app_names = ["team-{0}_service-{1}".format(app // 20, app) for app in range(apps)]
+    for app_name in app_names:
+        journal.record_retention(app_name, float(cycles * interval))
+    for cycle in range(cycles):
+        for app, app_name in enumerate(app_names):
+            vote = 1 if (app + cycle) % 7 == 0 else 0
+            journal.record_event(app_name, started + cycle * interval, vote, vote if cycle % 12 == 0 else NO_DECISION,
+                                 "2017-01-{0:02d}T00:00:00.000Z".format(app % 28 + 1))
+        journal.flush()
+    journal.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Decision history journal benchmark")
+    p.add_argument("--apps", type=int, nargs="+", default=[1000, 5000])
+    p.add_argument("--minutes", type=int, default=60)
+    p.add_argument("--interval", type=int, default=5, help="Seconds between polling cycles")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.WARN)
+
+    cycles = args.minutes * 60 // args.interval
+    directory = tempfile.mkdtemp()
+    try:
+        for apps in args.apps:
+            path = os.path.join(directory, "history-{0}.journal".format(apps))
+            started = time.time()
+            write_journal(path, apps, cycles, args.interval)
+            written = time.time() - started
+            print("{0} apps x {1} minutes every {2}s: {3} events, {4:.1f} MiB journal (written in {5:.1f}s)".format(
+                apps, args.minutes, args.interval, apps * cycles, os.path.getsize(path) / 1048576.0, written))
+
+            started = time.time()
+            history_mgr = HistoryManager(max_events=apps * cycles, journal=HistoryJournal(path))
+            recovered = time.time() - started
+            print("  recovery     {0:8.2f}s  {1} events".format(recovered, history_mgr.memory_usage()["events"]))
+
+            started = time.time()
+            history_mgr.journal.compact(history_mgr.app_histories)
+            print("  compaction   {0:8.2f}s  {1:.1f} MiB".format(time.time() - started,
+                                                                   os.path.getsize(path) / 1048576.0))
+            history_mgr.journal.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
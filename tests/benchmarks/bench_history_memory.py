@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Measures the memory held by the decision history: the previous dict records (a DateTime, the app
+version string and the triggered rule structure per app per cycle) against the AppHistory columns.
+The dict records are measured on a sample of the applications and extrapolated, as the full history
+would not fit in memory on most machines.
+
+    python tests/benchmarks/bench_history_memory.py --apps 5000 --minutes 60 --interval 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+
+from history_manager import HistoryManager
+
+
+def rule_structure():
+    """ A freshly parsed two part rule, as RulesManager builds one for every app on every cycle """
+    rule = []
+    for part, (metric, threshold) in enumerate((("cpu", ">90"), ("mem", ">80"))):
+        match = re.match(r"(?P<op>[=><]{1,2})(?P<val>\d+)", threshold)
+        rule.append(dict(ruleValue=dict(metric=metric, threshold=match.groupdict(), tolerance="PT5M",
+                                        scale_factor="1", backoff="PT15M", weight=1.0),
+                         ruleInfo=dict(ruleName="upscale", rulePart=str(part))))
+    return rule
+
+
+def recommendations(apps, cycle, started, interval, rule=True):
+    timestamp = started + timedelta(seconds=cycle * interval)
+    return dict(("app-{0}".format(app), dict(vote=1 if (app + cycle) % 7 == 0 else 0,
+                                             checksum="2017-01-{0:02d}T00:00:00.000Z".format(app % 28 + 1),
+                                             timestamp=timestamp,
+                                             rule=rule_structure() if rule else None))
+                for app in range(apps))
+
+
+def measure(apps, cycles, interval, build):
+    tracemalloc.start()
+    started = time.time()
+    history = build(apps, cycles, interval)
+    elapsed = time.time() - started
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+    return retained, elapsed
+
+
+def build_dicts(apps, cycles, interval):
+    started = datetime.now()
+    return [recommendations(apps, cycle, started, interval) for cycle in range(cycles)]
+
+
+def build_columns(apps, cycles, interval):
+    history_mgr = HistoryManager(max_events=apps * cycles)
+    started = datetime.now()
+    for app in range(apps):
+        history_mgr.set_retention("app-{0}".format(app), timedelta(seconds=cycles * interval))
+    for cycle in range(cycles):
+        # the rule is not kept by AppHistory; leaving it out only saves benchmark time
+        history_mgr.add_to_perf_tail(recommendations(apps, cycle, started, interval, rule=False))
+    return history_mgr
+
+
+def main():
+    p = argparse.ArgumentParser(description="Decision history memory benchmark")
+    p.add_argument("--apps", type=int, default=5000)
+    p.add_argument("--minutes", type=int, default=60)
+    p.add_argument("--interval", type=int, default=5, help="Seconds between polling cycles")
+    p.add_argument("--dict-sample-apps", type=int, default=250,
+                   help="Applications the dict records are measured on before extrapolating")
+    args = p.parse_args()
+
+    cycles = args.minutes * 60 // args.interval
+    events = args.apps * cycles
+    print("{0} apps x {1} minutes every {2}s: {3} events".format(args.apps, args.minutes, args.interval, events))
+
+    sample_apps = min(args.dict_sample_apps, args.apps)
+    retained, elapsed = measure(sample_apps, cycles, args.interval, build_dicts)
+    scale = float(args.apps) / sample_apps
+    print("  dict records        {0:10.1f} MiB  {1:6.1f} bytes/event  (extrapolated from {2} apps)".format(
+        retained * scale / 1048576.0, retained / float(sample_apps * cycles), sample_apps))
+
+    retained, elapsed = measure(args.apps, cycles, args.interval, build_columns)
+    print("  AppHistory columns  {0:10.1f} MiB  {1:6.1f} bytes/event  (built in {2:.1f}s)".format(
+        retained / 1048576.0, retained / float(events), elapsed))
+
+
+if __name__ == "__main__":
+    main()
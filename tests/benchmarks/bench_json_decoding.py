@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Compares the previous response decoding of ApiClientBase (decode to str, then json.loads) with
+json_decoding (bytes straight into the fastest installed backend, optionally projected down to the
+statistics the autoscaler reads) on agent /monitor/statistics and Marathon /v2/apps payloads.
+
+Payloads are synthesized from the fake agent fleet and tests/simulation_data unless recorded ones
+are given, e.g. captured with `curl http://agent:5051/monitor/statistics > statistics.json`:
+
+    python tests/benchmarks/bench_json_decoding.py --executors 100 1000
+    python tests/benchmarks/bench_json_decoding.py --statistics statistics.json --recorded-apps apps.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+
+from aggregation import STATISTICS_COUNTERS
+from fake_agents import executor_statistics
+import json_decoding
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def statistics_payload(executors):
+    return json.dumps([executor_statistics("app-{0}.{1}".format(index // 10, index), index)
+                       for index in range(executors)]).encode("utf-8")
+
+
+def apps_payload(apps):
+    with open(os.path.join(BASE_PATH, "..", "simulation_data", "app_definition.json")) as f:
+        app_def = json.load(f)
+    app_defs = []
+    for index in range(apps):
+        app_def = dict(app_def, id="/team-{0}/service-{1}".format(index // 20, index))
+        app_defs.append(app_def)
+    return json.dumps({"apps": app_defs}).encode("utf-8")
+
+
+def legacy_loads(content):
+    """ The decoding previously found in ApiClientBase._call_endpoint """
+    return json.loads(content.decode("utf-8"))
+
+
+def retained_bytes(func):
+    """
+    :return: Bytes still allocated by the result of func, when tracemalloc is available
+    """
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    result = func()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def timed(label, func, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.time()
+        func()
+        timings.append(time.time() - started)
+    retained = retained_bytes(func)
+    print("  {0:<32} best {1:8.4f}s  mean {2:8.4f}s  retained {3}".format(
+        label, min(timings), sum(timings) / len(timings),
+        "{0:.1f} MiB".format(retained / 1048576.0) if retained is not None else "n/a"))
+
+
+def bench(name, content, rounds, project=False):
+    print("{0}: {1:.1f} MiB".format(name, len(content) / 1048576.0))
+    timed("json.loads(content.decode())", lambda: legacy_loads(content), rounds)
+    timed("json_decoding.loads ({0})".format(json_decoding.JSON_BACKEND),
+          lambda: json_decoding.loads(content), rounds)
+    if project:
+        timed("json_decoding.loads + projection",
+              lambda: json_decoding.project_executor_statistics(json_decoding.loads(content), STATISTICS_COUNTERS),
+              rounds)
+
+
+def main():
+    p = argparse.ArgumentParser(description="JSON response decoding benchmark")
+    p.add_argument("--executors", type=int, nargs="+", default=[100, 1000, 10000],
+                   help="Executors per synthesized agent statistics payload")
+    p.add_argument("--apps", type=int, nargs="+", default=[1000],
+                   help="Applications per synthesized /v2/apps payload")
+    p.add_argument("--statistics", nargs="*", default=[], help="Recorded /monitor/statistics payloads")
+    p.add_argument("--recorded-apps", nargs="*", default=[], help="Recorded /v2/apps payloads")
+    p.add_argument("--rounds", type=int, default=5)
+    args = p.parse_args()
+
+    for path in args.statistics:
+        with open(path, "rb") as f:
+            bench(path, f.read(), args.rounds, project=True)
+    for path in args.recorded_apps:
+        with open(path, "rb") as f:
+            bench(path, f.read(), args.rounds)
+    if not args.statistics and not args.recorded_apps:
+        for executors in args.executors:
+            bench("/monitor/statistics, {0} executors".format(executors), statistics_payload(executors),
+                  args.rounds, project=True)
+        for apps in args.apps:
+            bench("/v2/apps, {0} apps".format(apps), apps_payload(apps), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
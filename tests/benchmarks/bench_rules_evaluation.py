@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Compares matching every application's rules to its metrics one application at a time, as
+RulesManager._get_matched_rule previously did, with the RulesEvaluator (pure Python and NumPy).
+
+    python tests/benchmarks/bench_rules_evaluation.py --apps 1000 10000 --rules 6
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_PATH, "..", "..", "lib", "marathon_autoscaler"))
+
+from application_definition import ApplicationDefinition
+from constants import compare
+from rules_evaluator import RulesEvaluator, np
+from rules_manager import RulesCache
+import settings
+
+
+def legacy_match(rules, metrics):
+    """ The nested loop previously found in RulesManager._get_matched_rule, without the tie-breaks """
+    rules_found = []
+    for rule_name, rule in rules.items():
+        matched_rule_criteria = [rule_item
+                                 for rule_item in rule
+                                 for metric_name, metric_value in metrics.items()
+                                 if rule_item.get("ruleValue").get("metric") in metric_name and
+                                 compare[rule_item.get("ruleValue").get("threshold")["op"]](
+                                     float(metric_value), float(rule_item.get("ruleValue").get("threshold")["val"]))]
+        if len(matched_rule_criteria) == len(rule):
+            rules_found.append(rule)
+    return rules_found
+
+
+def applications(apps, rules, rnd):
+    app_defs = []
+    for index in range(apps):
+        labels = dict(min_instances="1", max_instances="50")
+        for rule in range(rules):
+            direction = 1 if rule % 2 == 0 else -1
+            labels["mas_rule_rule{0}_1".format(rule)] = "cpu | {0}{1} | PT2M | {2} | PT5M".format(
+                ">" if direction > 0 else "<", rnd.randint(10, 90), direction * (rule // 2 + 1))
+            labels["mas_rule_rule{0}_2".format(rule)] = "mem | {0}{1} | PT2M | {2} | PT5M".format(
+                ">" if direction > 0 else "<", rnd.randint(10, 90), direction * (rule // 2 + 1))
+        app_defs.append(ApplicationDefinition(id="/team-{0}/service-{1}".format(index // 20, index),
+                                              version="2017-01-01T00:00:00.000Z", labels=labels))
+    return app_defs
+
+
+def timed(label, func, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.time()
+        func()
+        timings.append(time.time() - started)
+    print("  {0:<32} best {1:8.4f}s  mean {2:8.4f}s".format(label, min(timings), sum(timings) / len(timings)))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Rule evaluation benchmark")
+    p.add_argument("--apps", type=int, nargs="+", default=[1000, 10000])
+    p.add_argument("--rules", type=int, default=6, help="Rules (of two parts each) per application")
+    p.add_argument("--rounds", type=int, default=5)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    settings.rules_prefix = "mas_rule"
+
+    rnd = random.Random(42)
+    for apps in args.apps:
+        cache = RulesCache(size=apps)
+        compiled_rules = [cache.get(app_def) for app_def in applications(apps, args.rules, rnd)]
+        metrics = [dict(cpu=rnd.uniform(0, 100), mem=rnd.uniform(0, 100)) for _ in compiled_rules]
+        legacy_rules = [dict((rule_name, [rule_part.definition for rule_part in rule])
+                             for rule_name, rule in compiled.rules.items())
+                        for compiled in compiled_rules]
+        print("{0} apps x {1} rules".format(apps, args.rules))
+        timed("per application (legacy)", lambda: [legacy_match(rules, app_metrics)
+                                                   for rules, app_metrics in zip(legacy_rules, metrics)],
+              args.rounds)
+        rows = RulesEvaluator(use_numpy=False)
+        timed("evaluator (pure Python)", lambda: rows.evaluate(compiled_rules, metrics), args.rounds)
+        if np is not None:
+            columns = RulesEvaluator(use_numpy=True)
+            assert columns.evaluate(compiled_rules, metrics) == rows.evaluate(compiled_rules, metrics)
+            columns.flattened = {}
+            timed("evaluator (NumPy, first cycle)", lambda: RulesEvaluator(use_numpy=True).evaluate(compiled_rules,
+                                                                                                  metrics),
+                  args.rounds)
+            timed("evaluator (NumPy)", lambda: columns.evaluate(compiled_rules, metrics), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+A local stand-in for a fleet of Mesos agents. A single threaded HTTP server listens on every
+interface; each fake agent is a distinct loopback address (127.0.x.y), which Linux routes to `lo`
+without any extra configuration.
+"""
+import json
+import random
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+def executor_statistics(executor_id, seconds=0.0):
+    """
+    :param executor_id: The executor id to report
+    :param seconds: Seconds of cpu time the executor has accumulated
+    :return: One entry of the /monitor/statistics payload
+    """
+    return {
+        "executor_id": executor_id,
+        "executor_name": "Command Executor (Task: {0})".format(executor_id),
+        "framework_id": "20160101-000000-0000000000-5050-0000-0000",
+        "source": executor_id,
+        "statistics": {
+            "cpus_limit": 1.1,
+            "cpus_nr_periods": 1000,
+            "cpus_nr_throttled": 10,
+            "cpus_system_time_secs": seconds / 4,
+            "cpus_throttled_time_secs": seconds / 100,
+            "cpus_user_time_secs": seconds,
+            "mem_anon_bytes": 1024 * 1024 * 100,
+            "mem_file_bytes": 1024 * 1024 * 10,
+            "mem_limit_bytes": 1024 * 1024 * 1024,
+            "mem_mapped_file_bytes": 0,
+            "mem_rss_bytes": 1024 * 1024 * 110,
+            "net_rx_bytes": int(seconds * 1000),
+            "net_tx_bytes": int(seconds * 800),
+            "timestamp": time.time()
+        }
+    }
+
+
+class FakeAgentFleet(ThreadingMixIn, HTTPServer):
+    """
+    Serves a /monitor/statistics payload with `executors_per_agent` executors for any agent address.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, executors_per_agent=20, latency=0.0, slow_hosts=None, slow_latency=30.0):
+        HTTPServer.__init__(self, ("", port), FakeAgentHandler)
+        self.executors_per_agent = executors_per_agent
+        self.latency = latency
+        self.slow_hosts = set(slow_hosts or [])
+        self.slow_latency = slow_latency
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @staticmethod
+    def agent_hosts(count):
+        """
+        :param count: Number of agents in the fleet
+        :return: list of loopback addresses, one per agent
+        """
+        return ["127.0.{0}.{1}".format(1 + i // 250, 1 + i % 250) for i in range(count)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        host = self.headers.get("Host", "agent").split(":")[0]
+        if host in self.server.slow_hosts:
+            time.sleep(self.server.slow_latency)
+        elif self.server.latency:
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+        seconds = time.time() % 100000
+        payload = json.dumps([executor_statistics("app-{0}-{1}.{2}".format(host.replace(".", "-"), i, i), seconds)
+                              for i in range(self.server.executors_per_agent)]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
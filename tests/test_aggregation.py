@@ -0,0 +1,140 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from aggregation import ExecutorStatsAggregator, np
+
+
+def app_key_for_executor(executor_id):
+    return executor_id.split(".")[0]
+
+
+def sample(host, cpu_secs, timestamp, rss=512, limit=1024):
+    return {"host": host, "stats": {"cpus_user_time_secs": cpu_secs,
+                                    "cpus_system_time_secs": cpu_secs / 4,
+                                    "timestamp": timestamp,
+                                    "mem_limit_bytes": limit,
+                                    "mem_rss_bytes": rss}}
+
+
+@pytest.fixture(scope="module")
+def executor_samples():
+    rnd = random.Random(42)
+    previous, current = {}, {}
+    for app in range(25):
+        for executor in range(rnd.randint(1, 12)):
+            executor_id = "app-{0}.{1}".format(app, executor)
+            host = "10.0.0.{0}".format(rnd.randint(1, 20))
+            seconds = rnd.uniform(0, 1000)
+            previous[executor_id] = sample(host, seconds, 100.0)
+            current[executor_id] = sample(host, seconds + rnd.uniform(0, 8), 100.0 + rnd.uniform(5, 10),
+                                          rss=rnd.randint(1, 1024))
+    # new, gone, moved and restarted executors
+    current["app-0.new"] = sample("10.0.0.1", 1.0, 110.0)
+    previous["app-0.gone"] = sample("10.0.0.1", 1.0, 100.0)
+    previous["app-1.moved"], current["app-1.moved"] = sample("10.0.0.1", 1.0, 100.0), sample("10.0.0.2", 2.0, 110.0)
+    previous["app-2.reset"], current["app-2.reset"] = sample("10.0.0.1", 9.0, 100.0), sample("10.0.0.1", 1.0, 110.0)
+    return previous, current
+
+
+def test_summary_shape(executor_samples):
+    previous, current = executor_samples
+    summaries = ExecutorStatsAggregator(use_numpy=False).summarize(previous, current, app_key_for_executor)
+    assert len(summaries) == 25
+    executor_ids = [metric["executor_id"] for summary in summaries.values() for metric in summary["executor_metrics"]]
+    assert not set(executor_ids) & {"app-0.new", "app-0.gone", "app-1.moved", "app-2.reset"}
+    for summary in summaries.values():
+        assert set(summary.keys()) == {"cpu_avg_usage", "max_cpu", "memory_avg_usage", "max_memory",
+                                       "cpu_p95_usage", "memory_p95_usage", "executor_metrics"}
+        cpu_values = [metric["cpu_total_usage"] for metric in summary["executor_metrics"]]
+        assert summary["cpu_avg_usage"] == pytest.approx(sum(cpu_values) / len(cpu_values))
+        assert summary["max_cpu"] == max((metric["cpu_total_usage"], metric["executor_id"], metric["host"])
+                                         for metric in summary["executor_metrics"])
+        assert min(cpu_values) <= summary["cpu_p95_usage"] <= max(cpu_values)
+
+
+@pytest.mark.skipif(np is None, reason="NumPy is not installed")
+def test_vectorized_matches_rows(executor_samples):
+    previous, current = executor_samples
+    rows = ExecutorStatsAggregator(use_numpy=False).summarize(previous, current, app_key_for_executor)
+    columns = ExecutorStatsAggregator(use_numpy=True).summarize(previous, current, app_key_for_executor)
+    assert sorted(rows.keys()) == sorted(columns.keys())
+    for app, summary in rows.items():
+        for key in ("cpu_avg_usage", "memory_avg_usage", "cpu_p95_usage", "memory_p95_usage"):
+            assert columns[app][key] == pytest.approx(summary[key])
+        cpu_values = [metric["cpu_total_usage"] for metric in summary["executor_metrics"]]
+        assert columns[app]["cpu_p95_usage"] == pytest.approx(np.percentile(cpu_values, 95))
+        for key in ("max_cpu", "max_memory"):
+            assert columns[app][key][0] == pytest.approx(summary[key][0])
+            assert columns[app][key][1:] == summary[key][1:]
+        expected = dict((metric["executor_id"], metric) for metric in summary["executor_metrics"])
+        for metric in columns[app]["executor_metrics"]:
+            assert metric["host"] == expected[metric["executor_id"]]["host"]
+            assert metric["cpu_total_usage"] == pytest.approx(expected[metric["executor_id"]]["cpu_total_usage"])
+            assert metric["memory_total_usage"] == \
+                pytest.approx(expected[metric["executor_id"]]["memory_total_usage"])
+        assert len(columns[app]["executor_metrics"]) == len(expected)
+
+
+def test_no_comparable_samples():
+    aggregator = ExecutorStatsAggregator()
+    assert aggregator.summarize({}, {"app.1": sample("h", 1.0, 1.0)}, app_key_for_executor) == {}
+    assert aggregator.summarize({"app.1": sample("h", 2.0, 1.0)}, {"app.1": sample("h", 1.0, 2.0)},
+                                app_key_for_executor) == {}
+
+
+@pytest.mark.skipif(np is None, reason="NumPy is not installed")
+def test_app_without_comparable_samples_is_left_out():
+    # every executor of "reset" restarted, "ok" has a comparable sample
+    previous = {"reset.1": sample("h", 9.0, 100.0), "reset.2": sample("h", 9.0, 100.0), "ok.1": sample("h", 1.0, 100.0),
+                "last.1": sample("h", 9.0, 100.0)}
+    current = {"reset.1": sample("h", 1.0, 110.0), "reset.2": sample("h", 1.0, 110.0), "ok.1": sample("h", 2.0, 110.0),
+               "last.1": sample("h", 1.0, 110.0)}
+    rows = ExecutorStatsAggregator(use_numpy=False).summarize(previous, current, app_key_for_executor)
+    with np.errstate(all="raise"):
+        columns = ExecutorStatsAggregator(use_numpy=True).summarize(previous, current, app_key_for_executor)
+    assert sorted(columns.keys()) == sorted(rows.keys()) == ["ok"]
+    assert columns["ok"]["cpu_avg_usage"] == pytest.approx(rows["ok"]["cpu_avg_usage"])
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_extended_counters(use_numpy):
+    if use_numpy and np is None:
+        pytest.skip("NumPy is not installed")
+    previous = {"app.1": sample("h", 1.0, 100.0), "app.2": sample("h", 1.0, 100.0), "app.3": sample("h", 1.0, 100.0)}
+    current = {"app.1": sample("h", 2.0, 110.0), "app.2": sample("h", 2.0, 110.0), "app.3": sample("h", 2.0, 110.0)}
+    previous["app.1"]["stats"].update(cpus_throttled_time_secs=1.0, net_rx_bytes=1000)
+    current["app.1"]["stats"].update(cpus_throttled_time_secs=3.0, net_rx_bytes=6000)
+    previous["app.2"]["stats"].update(cpus_throttled_time_secs=5.0)
+    current["app.2"]["stats"].update(cpus_throttled_time_secs=1.0)
+    aggregator = ExecutorStatsAggregator(use_numpy=use_numpy)
+
+    summary = aggregator.summarize(previous, current, app_key_for_executor,
+                                   extended_counters=("cpus_throttled_time_secs", "net_rx_bytes"))
+    executor_metrics = dict((metric["executor_id"], metric) for metric in summary["app"]["executor_metrics"])
+    assert executor_metrics["app.1"]["cpus_throttled_time_secs"] == pytest.approx(2.0)
+    assert executor_metrics["app.1"]["net_rx_bytes"] == pytest.approx(5000)
+    assert "cpus_throttled_time_secs" not in executor_metrics["app.2"]
+    assert "net_rx_bytes" not in executor_metrics["app.3"]
+
+    summary = aggregator.summarize(previous, current, app_key_for_executor)
+    assert all("net_rx_bytes" not in metric for metric in summary["app"]["executor_metrics"])
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_single_extended_counter(use_numpy):
+    if use_numpy and np is None:
+        pytest.skip("NumPy is not installed")
+    previous = {"app.1": sample("h", 1.0, 100.0), "app.2": sample("h", 1.0, 100.0)}
+    current = {"app.1": sample("h", 2.0, 110.0), "app.2": sample("h", 2.0, 110.0)}
+    for stats, throttled in ((previous, 1.0), (current, 4.0)):
+        for executor_id in stats:
+            stats[executor_id]["stats"]["cpus_throttled_time_secs"] = throttled
+
+    summary = ExecutorStatsAggregator(use_numpy=use_numpy).summarize(
+        previous, current, app_key_for_executor, extended_counters=("cpus_throttled_time_secs",))
+    assert [metric["cpus_throttled_time_secs"] for metric in summary["app"]["executor_metrics"]] == \
+        [pytest.approx(3.0), pytest.approx(3.0)]
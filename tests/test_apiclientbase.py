@@ -0,0 +1,54 @@
+import os
+import socket
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from mesosagent import MesosAgent
+
+
+def unreachable_agent():
+    agent = MesosAgent("http://127.0.0.1:1/")
+    agent.retry_backoff = 0
+    return agent
+
+
+def test_idempotent_requests_are_retried():
+    agent = unreachable_agent()
+    assert agent.get_statistics() is None
+    assert agent.connection_stats()["requests"] == 1 + agent.retries
+    assert agent.connection_stats()["retries"] == agent.retries
+
+
+def test_other_requests_are_not_retried():
+    agent = unreachable_agent()
+    assert agent._do_request("POST", "/api/v1/executor") is None
+    assert agent.connection_stats()["requests"] == 1
+    assert agent.connection_stats()["retries"] == 0
+
+
+def test_unsent_idempotent_requests_are_retried():
+    agent = unreachable_agent()
+    assert agent._do_request("PUT", "/v2/apps/app") is None
+    assert agent.connection_stats()["retries"] == agent.retries
+
+
+def test_idempotent_requests_are_not_retried_after_a_read_timeout():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    try:
+        # the connection is accepted, but no response ever comes
+        agent = MesosAgent("http://127.0.0.1:{0}/".format(listener.getsockname()[1]), timeout=0.2)
+        agent.retry_backoff = 0
+        assert agent._do_request("PUT", "/v2/apps/app") is None
+        assert agent.connection_stats()["retries"] == 0
+        assert agent.get_statistics() is None
+        assert agent.connection_stats()["retries"] == agent.retries
+    finally:
+        listener.close()
+
+
+def test_retries_can_be_disabled():
+    agent = MesosAgent("http://127.0.0.1:1/", retries=0)
+    assert agent.get_statistics() is None
+    assert agent.connection_stats()["requests"] == 1
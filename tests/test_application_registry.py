@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from application_registry import ApplicationRegistry
+
+
+@pytest.fixture(scope="session")
+def app_registry():
+    marathon_apps = [{"id": "/test-service"},
+                     {"id": "/team/svc/api"},
+                     {"id": "/team/svc"},
+                     {"id": "/web.frontend"},
+                     {"id": "/team/worker", "tasks": [{"id": "team_worker.instance-1234._app.1"}]}]
+    return ApplicationRegistry(marathon_apps)
+
+
+def test_lookup_by_app_id(app_registry):
+    assert len(app_registry) == 5
+    assert app_registry.get("/team/svc/api")["id"] == "/team/svc/api"
+    assert app_registry.get("team/svc/api")["id"] == "/team/svc/api"
+    assert app_registry.get("team_svc_api")["id"] == "/team/svc/api"
+    assert "/team/svc" in app_registry
+    assert app_registry.get("/missing", {}) == {}
+
+
+def test_executor_resolution(app_registry):
+    assert app_registry.app_key_for_executor("test-service.7396b026-961a-11e6") == "test-service"
+    assert app_registry.app_key_for_executor("team_svc_api.7396b026-961a-11e6") == "team_svc_api"
+    assert app_registry.app_key_for_executor("team_svc.7396b026-961a-11e6") == "team_svc"
+    assert app_registry.app_key_for_executor("web.frontend.7396b026-961a-11e6") == "web.frontend"
+    assert app_registry.app_key_for_executor("team_worker.instance-1234._app.1") == "team_worker"
+
+
+def test_unknown_executor_falls_back(app_registry):
+    assert app_registry.app_key_for_executor("chronos-job.1234") == "chronos-job"
+    assert app_registry.get(app_registry.app_key_for_executor("chronos-job.1234")) is None
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import time
 
 import pytest
 
@@ -14,6 +15,21 @@ class fake_marathon_client():
         return
 
 
+class RecordingMarathonClient(object):
+    def __init__(self):
+        self.scaled = []
+        self.deployments = []
+
+    def scale_app(self, app_id, scale_size, with_status=False):
+        self.scaled.append((app_id, scale_size))
+        deployment_id = "deployment-{0}".format(len(self.scaled))
+        self.deployments.append({"id": deployment_id, "affectedApps": [app_id]})
+        return 200, {"version": "2017-01-01T00:00:00.000Z", "deploymentId": deployment_id}
+
+    def get_deployments(self):
+        return self.deployments
+
+
 @pytest.fixture(scope="session")
 def testsettings():
     fake_settings = dict(sleep_interval=5,
@@ -71,3 +87,52 @@ def test_autoscale_decisions(testsettings, auto_scaler, app_def, metric_summarie
         summary["test-service"]["application_definition"] = app_def
         auto_scaler.decide(summary)
     assert(type(auto_scaler) is AutoScaler)
+
+
+@pytest.mark.parametrize("target_rule, scaled_to", [
+    ("cpu | target=60 | PT0.1S | 5 | PT1M", 2),
+    ("memory | target=15 | PT0.1S | 5 | PT1M", 4),
+    ("memory | target=10 | PT0.1S | 1 | PT1M", 4),
+    ("memory | target=10 | PT0.1S | 5 | PT1M", 5),
+    ("memory | target=20 | PT0.1S | 5 | PT1M", None)
+])
+def test_target_tracking_decisions(testsettings, app_def, metric_summaries, target_rule, scaled_to):
+    """ The recorded application runs 3 instances (2 to 5) at 0.4% cpu and 19% memory """
+    marathon_client = RecordingMarathonClient()
+    auto_scaler = AutoScaler(marathon_client)
+    labels = dict((k, v) for k, v in app_def["labels"].items() if not k.startswith("mas_rule"))
+    labels["mas_rule_target"] = target_rule
+    for summary in metric_summaries:
+        summary["test-service"]["application_definition"] = dict(app_def, labels=labels)
+        auto_scaler.decide(summary)
+        time.sleep(0.06)
+    assert marathon_client.scaled == ([(app_def["id"], scaled_to)] if scaled_to else [])
+
+    if scaled_to is not None and 2 < scaled_to < 5 and "| 5 |" in target_rule:
+        # sized in a single step: the recorded load spread over the new instances is back within the target
+        executor_metrics = metric_summaries[-1]["test-service"]["executor_metrics"]
+        memory_load = sum(metric["memory_total_usage"] for metric in executor_metrics)
+        assert memory_load / scaled_to <= 15
+
+
+def test_no_scaling_while_deploying(testsettings, app_def, metric_summaries):
+    """ The recorded application runs 3 instances (2 to 5) at 19% memory """
+    marathon_client = RecordingMarathonClient()
+    auto_scaler = AutoScaler(marathon_client)
+    labels = dict((k, v) for k, v in app_def["labels"].items() if not k.startswith("mas_rule"))
+    labels["mas_rule_memory"] = "memory | >10 | PT0.1S | 1 | PT0.1S"
+
+    def decide_cycles():
+        for summary in metric_summaries * 3:
+            summary["test-service"]["application_definition"] = dict(app_def, labels=labels)
+            auto_scaler.deployments.refresh()
+            auto_scaler.decide(summary)
+            time.sleep(0.06)
+
+    decide_cycles()
+    assert marathon_client.scaled == [(app_def["id"], 4)]
+    marathon_client.deployments = []
+    decide_cycles()
+    assert marathon_client.scaled == [(app_def["id"], 4), (app_def["id"], 4)]
+    assert auto_scaler.deployments.is_deploying(app_def["id"])
+
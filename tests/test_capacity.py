@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from capacity import ClusterCapacity, port_count
+from scaler import AutoScaler
+import settings
+
+
+def slave(agent_id, cpus, mem, used_cpus=0, used_mem=0, ports="[31000-31009]", used_ports=None, **kwargs):
+    agent = dict(id=agent_id, hostname=agent_id, active=True,
+                 resources=dict(cpus=cpus, mem=mem, ports=ports),
+                 used_resources=dict(cpus=used_cpus, mem=used_mem, ports=used_ports),
+                 unreserved_resources=dict(cpus=cpus, mem=mem, ports=ports))
+    agent.update(kwargs)
+    return agent
+
+
+class RecordingMarathonClient(object):
+    def __init__(self):
+        self.scaled = []
+
+    def scale_app(self, app_id, instances, with_status=False):
+        self.scaled.append((app_id, instances))
+        return 200, {}
+
+
+@pytest.mark.parametrize("ranges, count", [
+    ("[31000-32000]", 1001),
+    ("[31000-31000, 31005-31009]", 6),
+    (None, 0)
+])
+def test_port_count(ranges, count):
+    assert port_count(ranges) == count
+
+
+def test_only_changed_agents_are_recomputed():
+    capacity = ClusterCapacity()
+    assert not capacity.known
+    assert capacity.update([slave("a", 4, 4096), slave("b", 2, 2048, used_cpus=1)]) == 2
+    assert capacity.totals() == dict(cpus=5.0, mem=6144.0, ports=20)
+    assert capacity.update([slave("a", 4, 4096), slave("b", 2, 2048, used_cpus=2)]) == 1
+    assert capacity.update([slave("a", 4, 4096), slave("c", 1, 512, active=False)]) == 0
+    assert sorted(capacity.agents) == ["a"]
+
+
+def test_unreserved_resources_only():
+    capacity = ClusterCapacity()
+    # half of the agent is reserved for another role; the used resources come out of the rest
+    capacity.update([slave("a", 8, 8192, used_cpus=2, used_mem=1024,
+                           unreserved_resources=dict(cpus=4, mem=4096, ports="[31000-31009]"))])
+    assert capacity.totals() == dict(cpus=4.0, mem=4096.0, ports=10)
+    capacity.update([slave("a", 8, 8192, used_cpus=6, used_mem=1024, used_ports="[31000-31004]",
+                           unreserved_resources=dict(cpus=4, mem=4096, ports="[31000-31009]"))])
+    assert capacity.totals() == dict(cpus=2.0, mem=4096.0, ports=5)
+
+
+def test_partial_admission_until_the_next_update():
+    capacity = ClusterCapacity()
+    agents = [slave("a", 2, 4096), slave("b", 1.5, 1024)]
+    capacity.update(agents)
+    # 2 instances fit on "a" and 1 on "b" by cpus, but only 2 on "b" by mem
+    assert capacity.admit(0.5, 1024, 1, 10) == 5
+    assert capacity.admit(0.5, 1024, 1, 1) == 0
+    capacity.update(agents)
+    assert capacity.admit(0.5, 1024, 1, 2) == 2
+    # ports run out first
+    capacity.update(agents)
+    assert capacity.admit(0.1, 10, 4, 10) == 4
+
+
+def test_scale_ups_are_reduced_and_deferred():
+    settings.rules_prefix = "mas_rule"
+    settings.enforce_version_match = False
+    marathon_client = RecordingMarathonClient()
+    auto_scaler = AutoScaler(marathon_client)
+    auto_scaler.capacity_admission = True
+    auto_scaler.capacity.update([slave("a", 2, 4096)])
+
+    labels = dict(use_marathon_autoscaler="True", min_instances="1", max_instances="20",
+                  mas_rule_up="cpu | >50 | PT10S | 3 | PT1M")
+    summary = OrderedDict()
+    for app in ("big", "small"):
+        app_def = dict(id="/" + app, version="1", instances=2, tasksRunning=2, labels=labels,
+                       cpus=1.0 if app == "big" else 0.5, mem=128, portDefinitions=[{"port": 0}])
+        summary[app] = dict(application_definition=app_def, cpu_avg_usage=90.0)
+    started = datetime.now() - timedelta(seconds=30)
+    for cycle in range(6):
+        auto_scaler.hm.add_to_perf_tail(dict((app, dict(vote=1, checksum="1", rule=None,
+                                                        timestamp=started + timedelta(seconds=cycle * 5)))
+                                             for app in summary))
+
+    # both ask for 3 more instances: "big" gets the 2 the cluster has room for, "small" is deferred
+    auto_scaler.decide(summary)
+    assert marathon_client.scaled == [("/big", 4)]
+    assert auto_scaler.capacity_reductions == [("big", 3, 2), ("small", 3, 0)]
+    # the deferred scale-up is not recorded as a decision, so its backoff does not hold it back
+    assert list(auto_scaler.hm.app_histories["big"].decisions_after(0))[-1] == 1
+    assert list(auto_scaler.hm.app_histories["small"].decisions_after(0))[-1] != 1
+
+    auto_scaler.capacity.update([slave("a", 4, 4096, used_cpus=2)])
+    auto_scaler.decide(summary)
+    assert marathon_client.scaled == [("/big", 4), ("/small", 5)]
+    assert auto_scaler.capacity_reductions == []
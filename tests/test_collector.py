@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+from collector import AgentStatisticsCollector
+from fake_agents import FakeAgentFleet
+
+
+@pytest.fixture(scope="module")
+def agent_fleet():
+    fleet = FakeAgentFleet(executors_per_agent=3).start()
+    yield fleet
+    fleet.stop()
+
+
+def test_collect_all_agents(agent_fleet):
+    agent_hosts = FakeAgentFleet.agent_hosts(10)
+    collector = AgentStatisticsCollector(agent_fleet.port, concurrency=4)
+    agent_hosts_stats = collector.collect(agent_hosts)
+    collector.close()
+    assert sorted(agent_hosts_stats.keys()) == sorted(agent_hosts)
+    for host, stats in agent_hosts_stats.items():
+        assert len(stats) == 3
+        assert "cpus_user_time_secs" in stats[0]["statistics"]
+
+
+def test_unreachable_agent_is_none(agent_fleet):
+    collector = AgentStatisticsCollector(1, concurrency=2)
+    assert collector.collect(["127.0.0.1"]) == {"127.0.0.1": None}
+    collector.close()
+
+
+def test_agent_scrapes_are_not_retried():
+    collector = AgentStatisticsCollector(5051)
+    assert collector.get_agent("10.0.0.1").retries == 0
+    collector.close()
+
+
+def test_clients_of_departed_agents_are_released(agent_fleet):
+    agent_hosts = FakeAgentFleet.agent_hosts(4)
+    collector = AgentStatisticsCollector(agent_fleet.port, concurrency=2)
+    try:
+        collector.collect(agent_hosts)
+        departed = collector.agents[agent_hosts[0]]
+        collector.collect(agent_hosts[1:])
+        assert sorted(collector.agents) == sorted(agent_hosts[1:])
+        assert departed.connection_stats()["connections"] == 0
+    finally:
+        collector.close()
+
+
+def test_collect_no_agents():
+    collector = AgentStatisticsCollector(5051)
+    assert collector.collect([]) == {}
+    collector.close()
+
+
+def test_slow_agent_is_skipped():
+    agent_hosts = FakeAgentFleet.agent_hosts(6)
+    fleet = FakeAgentFleet(executors_per_agent=1, slow_hosts=agent_hosts[:1], slow_latency=2.0).start()
+    collector = AgentStatisticsCollector(fleet.port, concurrency=2, agent_timeout=0.5)
+    try:
+        started = time.time()
+        agent_hosts_stats = collector.collect(agent_hosts)
+        assert time.time() - started < 2.0
+        assert agent_hosts_stats[agent_hosts[0]] is None
+        assert all(agent_hosts_stats[host] for host in agent_hosts[1:])
+        # the pool is reused by the next cycle
+        assert len(collector.collect(agent_hosts[1:])) == 5
+    finally:
+        collector.close()
+        fleet.stop()
+
+
+def test_stuck_agents_do_not_hold_up_the_cycle():
+    release = threading.Event()
+    collector = AgentStatisticsCollector(5051, concurrency=1, agent_timeout=0.2)
+
+    def stuck_agent(agent_host):
+        # the response trickles in, so the agent's own timeout never fires
+        release.wait(10)
+        return agent_host, None
+
+    collector.get_agent_statistics = stuck_agent
+    try:
+        started = time.time()
+        agent_hosts = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        assert collector.collect(agent_hosts) == dict((host, None) for host in agent_hosts)
+        # 3 rounds of one request each, plus one
+        assert time.time() - started < 1.5
+    finally:
+        release.set()
+        collector.close()
+
+
+def test_agent_connections_are_reused(agent_fleet):
+    agent_hosts = FakeAgentFleet.agent_hosts(3)
+    collector = AgentStatisticsCollector(agent_fleet.port, concurrency=3)
+    collector.collect(agent_hosts)
+    collector.collect(agent_hosts)
+    stats = collector.connection_stats()
+    collector.close()
+    assert stats["requests"] == 6
+    assert stats["connections"] == 3
+    assert stats["reused"] == 3
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from deployment_tracker import DeploymentTracker
+from scale_dispatcher import ScaleAction, ScaleOutcome
+
+
+class FakeMarathonClient(object):
+    def __init__(self):
+        self.deployments = []
+
+    def get_deployments(self):
+        if isinstance(self.deployments, Exception):
+            raise self.deployments
+        return self.deployments
+
+
+def scaled(app_id, deployment_id, decided):
+    action = ScaleAction(app_id, app_id.lstrip("/"), 3, decided)
+    outcome = ScaleOutcome(app_id, action.app_name, 3, 200, 0.01, 0.0,
+                           {"version": "2017-01-01T00:00:00.000Z", "deploymentId": deployment_id})
+    return action, outcome
+
+
+def test_tracks_deployments_until_completed():
+    client = FakeMarathonClient()
+    tracker = DeploymentTracker(client)
+    assert tracker.track(*scaled("/web", "d-1", time.time() - 30)) == "d-1"
+    assert tracker.is_deploying("/web") and not tracker.is_deploying("/api")
+
+    client.deployments = [{"id": "d-1", "affectedApps": ["/web"]}, {"id": "d-2", "affectedApps": ["/api"]}]
+    assert tracker.refresh()
+    # deployments the autoscaler did not start hold their applications back as well
+    assert tracker.is_deploying("/web") and tracker.is_deploying("/api")
+    assert tracker.completed == []
+
+    client.deployments = [{"id": "d-2", "affectedApps": ["/api"]}]
+    assert tracker.refresh()
+    assert not tracker.is_deploying("/web")
+    assert [app for app, _ in tracker.completed] == ["web"]
+    assert 30 <= tracker.completed[0][1] < 40
+
+
+def test_keeps_tracked_deployments_when_marathon_fails():
+    client = FakeMarathonClient()
+    tracker = DeploymentTracker(client)
+    tracker.track(*scaled("/web", "d-1", time.time()))
+    client.deployments = ValueError("connection reset")
+    assert not tracker.refresh()
+    assert tracker.is_deploying("/web")
+    client.deployments = None
+    assert not tracker.refresh()
+    assert tracker.is_deploying("/web")
+
+
+def test_untracked_outcomes():
+    tracker = DeploymentTracker(FakeMarathonClient())
+    action, outcome = scaled("/web", None, time.time())
+    assert tracker.track(action, outcome._replace(response=None)) is None
+    assert tracker.track(action, outcome) is None
+    assert not tracker.is_deploying("/web")
@@ -0,0 +1,55 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from flap_detector import FlapDetector, parse_flap_signatures
+
+
+def observe_all(detector, decisions, app="test-service", seconds_apart=5):
+    started = datetime.now()
+    return [detector.observe(app, decision, started + timedelta(seconds=seconds_apart * index))
+            for index, decision in enumerate(decisions)]
+
+
+def test_signature_reported_once_when_completed():
+    matches = observe_all(FlapDetector(), [1, -1, 1, -1])
+    assert matches == [[], [], [], [(1, -1, 1, -1)]]
+
+
+def test_overlapping_signatures():
+    matches = observe_all(FlapDetector(), [0, 1, -1, 1, -1, 1])
+    assert matches[4] == [(1, -1, 1, -1)]
+    assert matches[5] == [(-1, 1, -1, 1)]
+
+
+def test_idle_separated_signature():
+    matches = observe_all(FlapDetector(), [1, 0, -1, 0, 1, 0, -1])
+    assert matches[-1] == [(1, 0, -1, 0, 1, 0, -1)]
+    assert not any(matches[:-1])
+
+
+def test_applications_are_independent():
+    detector = FlapDetector()
+    for decision in (1, -1, 1):
+        detector.observe("test-service", decision)
+        detector.observe("other-service", -decision)
+    assert detector.observe("test-service", -1) == [(1, -1, 1, -1)]
+    assert detector.observe("other-service", -1) == []
+
+
+def test_custom_signatures():
+    detector = FlapDetector(parse_flap_signatures("1,-1;-1,1,-1"))
+    assert observe_all(detector, [-1, 1, -1]) == [[], [], [(-1, 1, -1), (1, -1)]]
+
+
+def test_time_window():
+    assert observe_all(FlapDetector(time_window=timedelta(seconds=60)), [1, -1, 1, -1],
+                       seconds_apart=10)[-1] == [(1, -1, 1, -1)]
+    assert observe_all(FlapDetector(time_window=timedelta(seconds=60)), [1, -1, 1, -1],
+                       seconds_apart=30)[-1] == []
+
+
+def test_unknown_decision_resets_state():
+    detector = FlapDetector()
+    assert observe_all(detector, [1, -1, 1, 5, -1])[-1] == []
@@ -0,0 +1,89 @@
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from application_definition import ApplicationDefinition
+from forecasting import Forecaster
+from rules_manager import compile_rules
+from scaler import AutoScaler
+import settings
+
+
+@pytest.fixture(scope="module")
+def testsettings():
+    settings.rules_prefix = "mas_rule"
+    settings.enforce_version_match = False
+
+
+def test_forecasts_trend():
+    forecaster = Forecaster(timedelta(seconds=60))
+    forecasts = [forecaster.observe("app", dict(cpu=10 + 0.5 * second), timestamp=second)["cpu"]
+                 for second in range(0, 300, 5)]
+    assert forecasts[:2] == [None, None]
+    # a ramp of 0.5 per second is forecast 60 seconds ahead
+    assert forecasts[-1] == pytest.approx(10 + 0.5 * (295 + 60), rel=0.01)
+    accuracy = forecaster.accuracy()
+    assert accuracy["scored"] > 40 and accuracy["series"] == 1
+    assert accuracy["error"] < 1.0
+    assert forecaster.series_errors()[("app", "cpu")] == pytest.approx(accuracy["error"])
+
+
+def test_missing_observations_and_retain():
+    forecaster = Forecaster(timedelta(seconds=60))
+    for second in range(0, 30, 5):
+        forecaster.observe("app", dict(cpu=50.0, mem=None), timestamp=second)
+        forecaster.observe("gone", dict(cpu=50.0), timestamp=second)
+    forecasts = forecaster.observe("app", dict(cpu=50.0, mem=None), timestamp=30)
+    assert forecasts["cpu"] == pytest.approx(50.0) and forecasts["mem"] is None
+    forecaster.retain({"app"})
+    assert sorted(forecaster.models) == [("app", "cpu"), ("app", "mem")]
+
+
+def test_metric_that_stops_reporting_keeps_no_forecasts():
+    forecaster = Forecaster(timedelta(seconds=60))
+    for second in range(0, 30, 5):
+        forecaster.observe("app", dict(cpu=50.0), timestamp=second)
+    for second in range(30, 3000, 5):
+        forecaster.observe("app", dict(cpu=None), timestamp=second)
+    assert len(forecaster.models[("app", "cpu")].pending) == 0
+
+
+def test_seasonality_improves_forecasts():
+    def office_hours(minute):
+        return 80.0 if 9 * 60 <= minute % (24 * 60) < 17 * 60 else 20.0
+
+    def mean_error_of_last_day(forecaster):
+        forecasts, errors = {}, []
+        for minute in range(0, 8 * 24 * 60, 5):
+            if minute in forecasts and minute >= 7 * 24 * 60:
+                errors.append(abs(office_hours(minute) - forecasts[minute]))
+            forecast = forecaster.observe("app", dict(cpu=office_hours(minute)), timestamp=minute * 60)["cpu"]
+            if forecast is not None:
+                forecasts[minute + 30] = forecast
+        return sum(errors) / len(errors)
+
+    seasonal = Forecaster(timedelta(minutes=30), alpha=0.02, beta=0.0, gamma=0.5, season=timedelta(days=1),
+                          season_buckets=48)
+    assert mean_error_of_last_day(seasonal) < mean_error_of_last_day(Forecaster(timedelta(minutes=30))) / 2
+
+
+def test_rules_use_forecasts(testsettings):
+    labels = dict(use_marathon_autoscaler="True", min_instances="1", max_instances="5",
+                  mas_rule_scaleahead="cpu_forecast | >80 | PT1M | 1 | PT1M")
+    compiled = compile_rules(ApplicationDefinition(id="/app", version="1", labels=labels))
+    assert compiled.metrics == frozenset(["cpu_forecast"])
+
+    auto_scaler = AutoScaler(None)
+    app_def = dict(id="/app", version="1", instances=2, tasksRunning=2, labels=labels)
+    other_def = dict(app_def, id="/other", labels=dict(labels, mas_rule_scaleahead="cpu | >80 | PT1M | 1 | PT1M"))
+    for _ in range(3):
+        auto_scaler.decide({"app": dict(application_definition=app_def, cpu_avg_usage=50.0),
+                            "other": dict(application_definition=other_def, cpu_avg_usage=50.0)})
+    assert sorted(auto_scaler.forecaster.models) == [("app", "cpu")]
+    assert auto_scaler.forecaster.models[("app", "cpu")].observations == 3
+    auto_scaler.decide({"other": dict(application_definition=other_def, cpu_avg_usage=50.0)})
+    assert auto_scaler.forecaster.models == {}
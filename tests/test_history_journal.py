@@ -0,0 +1,64 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from history_journal import HistoryJournal
+from history_manager import HistoryManager
+
+started = datetime(2017, 1, 1, 12, 0, 0)
+
+
+def record_cycles(history_mgr, cycles, first_cycle=0, apps=("test-service", "other-service")):
+    for cycle in range(first_cycle, first_cycle + cycles):
+        recommendations = {}
+        for app in apps:
+            history_mgr.set_retention(app, timedelta(seconds=60))
+            recommendations[app] = dict(vote=1, checksum="2017-01-01T00:00:00.000Z",
+                                        timestamp=started + timedelta(seconds=5 * cycle))
+            if cycle % 3 == 0:
+                recommendations[app]["decision"] = 1
+        history_mgr.add_to_perf_tail(recommendations)
+
+
+def test_history_is_recovered(tmpdir):
+    path = str(tmpdir.join("history.journal"))
+    history_mgr = HistoryManager(journal=HistoryJournal(path))
+    record_cycles(history_mgr, 30)
+    history_mgr.journal.close()
+
+    recovered = HistoryManager(journal=HistoryJournal(path))
+    for app in ("test-service", "other-service"):
+        assert recovered.app_histories[app].retention == timedelta(seconds=60)
+        assert recovered.app_histories[app].tail(100) == history_mgr.app_histories[app].tail(100)
+    record_cycles(recovered, 1, first_cycle=30)
+    assert len(recovered.app_histories["test-service"]) == len(history_mgr.app_histories["test-service"])
+
+
+def test_torn_record_is_discarded(tmpdir):
+    path = str(tmpdir.join("history.journal"))
+    history_mgr = HistoryManager(journal=HistoryJournal(path))
+    record_cycles(history_mgr, 5)
+    history_mgr.journal.close()
+    with open(path, "ab") as f:
+        f.write(b"\x02\x12\x00torn")
+    intact_size = os.path.getsize(path) - len(b"\x02\x12\x00torn")
+
+    recovered = HistoryManager(journal=HistoryJournal(path))
+    assert len(recovered.app_histories["test-service"]) == 5
+    assert os.path.getsize(path) == intact_size
+    record_cycles(recovered, 1, first_cycle=5)
+    recovered.journal.close()
+    assert len(HistoryManager(journal=HistoryJournal(path)).app_histories["test-service"]) == 6
+
+
+def test_journal_is_compacted(tmpdir):
+    path = str(tmpdir.join("history.journal"))
+    history_mgr = HistoryManager(journal=HistoryJournal(path, max_bytes=2048))
+    record_cycles(history_mgr, 200)
+    history_mgr.journal.close()
+    # 13 retained events of 2 applications, 25 bytes each, plus strings and retention records
+    assert os.path.getsize(path) < 4 * 2048
+
+    recovered = HistoryManager(journal=HistoryJournal(path))
+    assert recovered.app_histories["test-service"].tail(100) == history_mgr.app_histories["test-service"].tail(100)
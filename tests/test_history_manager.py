@@ -1,7 +1,6 @@
 import os
 import sys
 import json
-import dateutil.parser
 from datetime import timedelta, datetime
 import pytest
 import logging
@@ -9,7 +8,7 @@ import logging
 logging.basicConfig(level=logging.DEBUG)
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
-from history_manager import HistoryManager
+from history_manager import AppHistory, HistoryManager, to_seconds
 import settings
 
 rightnow = datetime.now()
@@ -54,8 +53,8 @@ _counter = 1
 
 
 def _decrement_time(date_time, time_span):
-    new_date_time = date_time - timedelta(seconds=time_span * _counter)
     global _counter
+    new_date_time = date_time - timedelta(seconds=time_span * _counter)
     _counter += 1
     return new_date_time
 
@@ -72,19 +71,26 @@ def app_recommendations():
 
 
 def test_add_to_perf_tail(history_mgr, app_recommendations):
+    # 6 seconds apart, the latest 6 seconds ago
+    right_now = datetime.now()
+    [event.update({"timestamp": _decrement_time(right_now, 6)})
+     for recommendation in reversed(app_recommendations)
+     for app, event in recommendation.items()]
+
     for recommendation in app_recommendations:
         history_mgr.add_to_perf_tail(recommendation)
-    assert len(history_mgr.app_performance_tail) > 1
+    assert len(history_mgr.app_histories["test-service"]) == len(app_recommendations)
 
 
 def test_tolerance_reached(history_mgr):
-    [event.update({"timestamp": _decrement_time(event.get("timestamp"), 6)})
-     for recommendation in history_mgr.app_performance_tail
-     for app, event in recommendation.items()]
-
     assert history_mgr.tolerance_reached("test-service", "PT10S", 1)
 
 
+def test_app_names_match_exactly(history_mgr):
+    assert history_mgr.get_performance_tail_slice("test", rightnow - timedelta(minutes=5)) == []
+    assert not history_mgr.is_time_window_filled("test-service-2", rightnow)
+
+
 def test_within_backoff(history_mgr):
     assert not history_mgr.within_backoff("test-service", "PT2M", 1)
 
@@ -97,3 +103,86 @@ def test_is_time_window_filled(history_mgr):
 def test_get_timedelta(history_mgr):
     timespan_obj = history_mgr.get_timedelta("PT3M34S")
     assert timespan_obj.seconds == 214
+
+
+def test_app_history_keeps_timestamp_order():
+    app_history = AppHistory(capacity=3)
+    for seconds in (1, 2, 5, 4, 3):
+        app_history.append(dict(timestamp=rightnow + timedelta(seconds=seconds), vote=seconds))
+    assert len(app_history) == 3
+    assert [event["vote"] for event in app_history.tail(3)] == [3, 4, 5]
+    assert [event["vote"] for event in app_history.after(rightnow + timedelta(seconds=3))] == [4, 5]
+    assert [event["vote"] for event in app_history.before(rightnow + timedelta(seconds=5))] == [3, 4]
+    assert app_history.oldest_timestamp() == to_seconds(rightnow + timedelta(seconds=3))
+
+
+def test_app_history_ring_buffer():
+    app_history = AppHistory(capacity=10)
+    for seconds in range(100):
+        app_history.append(dict(timestamp=rightnow + timedelta(seconds=seconds), vote=seconds))
+    assert len(app_history) == 10
+    assert len(app_history.timestamps) < 20
+    assert [event["vote"] for event in app_history.tail(2)] == [98, 99]
+    assert app_history.after(rightnow + timedelta(seconds=97))[0]["vote"] == 98
+
+
+def test_flapping_detected():
+    class FakeDatadogClient(object):
+        def __init__(self):
+            self.events = []
+
+        def send_counter_event(self, app, metric_name):
+            self.events.append((app, metric_name))
+
+    dd_client = FakeDatadogClient()
+    history_mgr = HistoryManager(dd_client=dd_client)
+    for seconds, decision in enumerate([1, -1, 1, -1]):
+        history_mgr.add_to_perf_tail({"flappy-service": dict(vote=decision, decision=decision, checksum="1",
+                                                             timestamp=rightnow + timedelta(seconds=seconds))})
+    history_mgr.add_to_perf_tail({"flappy-service": dict(vote=0, checksum="1", timestamp=rightnow + timedelta(seconds=5))})
+    assert dd_client.events == [("flappy-service", "marathon_autoscaler.events.flapping_detected")]
+
+
+def test_retention_period_overrides_capacity():
+    app_history = AppHistory(capacity=10, retention=timedelta(minutes=30))
+    for seconds in range(0, 3600, 5):
+        app_history.append(dict(timestamp=rightnow + timedelta(seconds=seconds), vote=0))
+    # the last 30 minutes, and the latest event before them to show the window is filled
+    assert len(app_history) == 30 * 12 + 2
+    assert app_history.oldest_timestamp() < app_history.latest_timestamp() - 30 * 60
+
+
+def test_histories_follow_participation_and_global_cap():
+    history_mgr = HistoryManager(max_events=50)
+    for seconds in range(0, 120, 5):
+        recommendations = {"app-{0}".format(index): dict(vote=0, checksum="1",
+                                                         timestamp=rightnow + timedelta(seconds=seconds))
+                           for index in range(4 if seconds < 60 else 2)}
+        for app in recommendations:
+            history_mgr.set_retention(app, timedelta(seconds=30))
+        history_mgr.add_to_perf_tail(recommendations)
+    usage = history_mgr.memory_usage()
+    assert sorted(history_mgr.app_histories.keys()) == ["app-0", "app-1"]
+    assert usage["apps"] == 2
+    assert usage["events"] == 2 * 8
+    assert usage["bytes"] > 0
+
+    history_mgr.max_events = 10
+    history_mgr.add_to_perf_tail({"app-0": dict(vote=0, checksum="1", timestamp=rightnow + timedelta(seconds=120))})
+    assert history_mgr.memory_usage()["events"] <= 10
+
+
+def test_app_history_columns():
+    app_history = AppHistory()
+    started = rightnow.replace(microsecond=0)
+    for seconds, (vote, decision, checksum) in enumerate([(1, None, "v1"), (1, 1, "v1"), (-1, None, "v2")]):
+        app_history.append(dict(timestamp=started + timedelta(seconds=seconds), vote=vote, checksum=checksum,
+                                **({"decision": decision} if decision is not None else {})))
+    votes, checksums = app_history.votes_after(to_seconds(started))
+    assert list(votes) == [1, -1]
+    assert checksums == {"v1", "v2"}
+    assert list(app_history.decisions_after(to_seconds(started))).count(1) == 1
+    assert app_history.tail(2) == [dict(timestamp=started + timedelta(seconds=1), vote=1, checksum="v1", decision=1),
+                                   dict(timestamp=started + timedelta(seconds=2), vote=-1, checksum="v2")]
+    app_history.truncate(1)
+    assert len(app_history) == 1
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+import json_decoding
+from aggregation import STATISTICS_COUNTERS
+
+
+def test_loads_bytes_and_str():
+    assert json_decoding.loads(b'{"apps": [{"id": "/test-service"}]}') == {"apps": [{"id": "/test-service"}]}
+    assert json_decoding.loads(u'[1, 2.5, "\u00e9"]') == [1, 2.5, u"\u00e9"]
+
+
+@pytest.mark.parametrize("content", [b"", b"<html></html>", b'{"apps": '])
+def test_invalid_content_raises_value_error(content):
+    with pytest.raises(ValueError):
+        json_decoding.loads(content)
+
+
+def test_project_executor_statistics():
+    executors = [{"executor_id": "test-service.1",
+                  "framework_id": "framework",
+                  "statistics": {"cpus_user_time_secs": 1.5,
+                                 "cpus_system_time_secs": 0.5,
+                                 "cpus_nr_periods": 1000,
+                                 "timestamp": 1000.0,
+                                 "mem_limit_bytes": 1024,
+                                 "mem_rss_bytes": 512}},
+                 {"executor_id": "test-service.2", "statistics": {"timestamp": 1000.0}}]
+    projected = json_decoding.project_executor_statistics(executors, STATISTICS_COUNTERS)
+    assert projected == [{"executor_id": "test-service.1",
+                          "statistics": {"cpus_user_time_secs": 1.5,
+                                         "cpus_system_time_secs": 0.5,
+                                         "timestamp": 1000.0,
+                                         "mem_limit_bytes": 1024,
+                                         "mem_rss_bytes": 512}},
+                         {"executor_id": "test-service.2", "statistics": {"timestamp": 1000.0}}]
+    assert json_decoding.project_executor_statistics({"message": "error"}, STATISTICS_COUNTERS) == \
+        {"message": "error"}
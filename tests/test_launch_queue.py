@@ -0,0 +1,92 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from launch_queue import LaunchQueue
+from scaler import AutoScaler
+import settings
+
+
+def queue_item(app_id, count, time_left=0, overdue=False):
+    return {"app": {"id": app_id, "instances": 4}, "count": count, "since": "2017-01-01T00:00:00.000Z",
+            "delay": {"timeLeftSeconds": time_left, "overdue": overdue}}
+
+
+class QueueMarathonClient(object):
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else []
+        self.queue_requests = 0
+        self.scaled = []
+
+    def get_queue(self):
+        self.queue_requests += 1
+        if isinstance(self.queue, Exception):
+            raise self.queue
+        return {"queue": self.queue}
+
+    def scale_app(self, app_id, instances, with_status=False):
+        self.scaled.append((app_id, instances))
+        return 200, {}
+
+
+def test_backlog_over_the_limits():
+    marathon_client = QueueMarathonClient([queue_item("/deep", 5), queue_item("/delayed", 1, time_left=120),
+                                           queue_item("/shallow", 2, time_left=10, overdue=True)])
+    launch_queue = LaunchQueue(marathon_client, max_count=3, max_delay=60)
+    assert launch_queue.refresh()
+    assert sorted(launch_queue.queued) == ["/deep", "/delayed", "/shallow"]
+    assert launch_queue.backlog("/deep").count == 5
+    assert launch_queue.backlog("/delayed").delay == 120
+    assert launch_queue.backlog("/shallow") is None
+    assert launch_queue.backlog("/idle") is None
+    assert launch_queue.depths() == {"deep": 5, "delayed": 1, "shallow": 2}
+    # without limits nothing is held back
+    assert LaunchQueue(marathon_client).backlog("/deep") is None
+
+
+def test_previous_view_kept_when_unavailable():
+    marathon_client = QueueMarathonClient([queue_item("/deep", 5)])
+    launch_queue = LaunchQueue(marathon_client, max_count=0)
+    launch_queue.refresh()
+    marathon_client.queue = IOError("connection refused")
+    assert not launch_queue.refresh()
+    assert launch_queue.backlog("/deep") is not None
+    marathon_client.queue = []
+    assert launch_queue.refresh()
+    assert launch_queue.queued == {}
+
+
+def test_scale_ups_held_back_by_the_backlog():
+    settings.rules_prefix = "mas_rule"
+    settings.enforce_version_match = False
+    marathon_client = QueueMarathonClient([queue_item("/backlogged", 2), queue_item("/busy", 2)])
+    auto_scaler = AutoScaler(marathon_client)
+    auto_scaler.launch_queue.max_count = 1
+    auto_scaler.launch_queue.refresh()
+
+    summary = {}
+    for app, rule in (("backlogged", "cpu | >50 | PT10S | 1 | PT1M"), ("busy", "cpu | <50 | PT10S | -1 | PT1M"),
+                      ("free", "cpu | >50 | PT10S | 1 | PT1M")):
+        labels = dict(use_marathon_autoscaler="True", min_instances="1", max_instances="10", mas_rule_1=rule)
+        app_def = dict(id="/" + app, version="1", instances=4, tasksRunning=4, labels=labels)
+        summary[app] = dict(application_definition=app_def, cpu_avg_usage=90.0 if app != "busy" else 10.0)
+    started = datetime.now() - timedelta(seconds=30)
+    for cycle in range(6):
+        auto_scaler.hm.add_to_perf_tail(dict((app, dict(vote=1 if app != "busy" else -1, checksum="1", rule=None,
+                                                        timestamp=started + timedelta(seconds=cycle * 5)))
+                                             for app in summary))
+
+    # scale-downs go through; the held back scale-up is not a decision, so it is retried once the backlog drains
+    auto_scaler.decide(summary)
+    assert sorted(marathon_client.scaled) == [("/busy", 3), ("/free", 5)]
+    assert auto_scaler.launch_queue.suppressed == ["backlogged"]
+    assert list(auto_scaler.hm.app_histories["backlogged"].decisions_after(0))[-1] != 1
+
+    marathon_client.queue = [queue_item("/backlogged", 1)]
+    auto_scaler.launch_queue.refresh()
+    auto_scaler.decide(summary)
+    assert ("/backlogged", 5) in marathon_client.scaled
+    assert auto_scaler.launch_queue.suppressed == []
+    assert marathon_client.queue_requests == 2
@@ -0,0 +1,159 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from marathon import Marathon
+from marathon_events import MarathonAppCache
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from Queue import Queue, Empty
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from queue import Queue, Empty
+
+
+class FakeMarathon(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeMarathonHandler)
+        self.apps = {"/test-service": {"id": "/test-service", "instances": 3},
+                     "/team/api": {"id": "/team/api", "instances": 1}}
+        self.requests = []
+        self.events = Queue()
+        self.subscribed = threading.Event()
+        self.closing = threading.Event()
+
+    def emit(self, event_type, data):
+        data["eventType"] = event_type
+        self.events.put("event: {0}\ndata: {1}\n\n".format(event_type, json.dumps(data)))
+
+
+class FakeMarathonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.server.requests.append(path)
+        if path == "/v2/events":
+            return self.stream_events()
+        if path == "/v2/apps":
+            return self.send_json(200, {"apps": list(self.server.apps.values())})
+        app_id = path[len("/v2/apps"):]
+        if app_id in self.server.apps:
+            return self.send_json(200, {"app": self.server.apps[app_id]})
+        return self.send_json(404, {"message": "App '{0}' does not exist".format(app_id)})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.server.subscribed.set()
+        while not self.server.closing.is_set():
+            try:
+                chunk = self.server.events.get(timeout=0.1).encode("utf-8")
+            except Empty:
+                continue
+            try:
+                self.wfile.write("{0:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+                self.wfile.flush()
+            except Exception:
+                return
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_marathon():
+    server = FakeMarathon()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.closing.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app_cache(fake_marathon):
+    cache = MarathonAppCache(Marathon("http://127.0.0.1:{0}".format(fake_marathon.server_address[1])),
+                             resync_interval=3600).start()
+    assert fake_marathon.subscribed.wait(5)
+    for _ in range(50):
+        if cache.connected:
+            break
+        time.sleep(0.1)
+    yield cache
+    cache.stop()
+
+
+def wait_for(condition):
+    for _ in range(50):
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def app_ids(apps):
+    return sorted(app["id"] for app in apps.get("apps"))
+
+
+def test_events_refresh_only_changed_apps(fake_marathon, app_cache):
+    assert app_ids(app_cache.get_all_apps()) == ["/team/api", "/test-service"]
+    assert fake_marathon.requests.count("/v2/apps") == 1
+
+    fake_marathon.apps["/test-service"]["instances"] = 5
+    fake_marathon.emit("deployment_success", {"plan": {"steps": [{"actions": [{"action": "ScaleApplication",
+                                                                               "app": "/test-service"}]}]}})
+    assert wait_for(lambda: "/test-service" in app_cache._dirty_apps)
+
+    apps = dict((app["id"], app) for app in app_cache.get_all_apps().get("apps"))
+    assert apps["/test-service"]["instances"] == 5
+    assert fake_marathon.requests.count("/v2/apps") == 1
+    assert fake_marathon.requests.count("/v2/apps/test-service") == 1
+
+
+def test_removed_and_created_apps(fake_marathon, app_cache):
+    app_cache.get_all_apps()
+    del fake_marathon.apps["/team/api"]
+    fake_marathon.apps["/team/worker"] = {"id": "/team/worker", "instances": 2}
+    fake_marathon.emit("app_terminated_event", {"appId": "/team/api"})
+    fake_marathon.emit("api_post_event", {"appDefinition": {"id": "/team/worker"}})
+    assert wait_for(lambda: len(app_cache._dirty_apps) == 2)
+
+    assert app_ids(app_cache.get_all_apps()) == ["/team/worker", "/test-service"]
+    assert fake_marathon.requests.count("/v2/apps") == 1
+
+
+def test_periodic_resync(fake_marathon, app_cache):
+    app_cache.get_all_apps()
+    app_cache.resync_interval = 0
+    app_cache.get_all_apps()
+    assert fake_marathon.requests.count("/v2/apps") == 2
+
+
+def test_full_fetch_without_event_stream(fake_marathon):
+    cache = MarathonAppCache(Marathon("http://127.0.0.1:{0}".format(fake_marathon.server_address[1])))
+    cache.get_all_apps()
+    cache.get_all_apps()
+    assert fake_marathon.requests.count("/v2/apps") == 2
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from mesosmaster import MesosMaster
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class FakeMesosMaster(HTTPServer):
+    def __init__(self, cluster):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeMesosMasterHandler)
+        self.cluster = cluster
+        self.requests = []
+        self.address = "127.0.0.1:{0}".format(self.server_address[1])
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeMesosMasterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        leader = self.server.cluster.leader
+        if self.path == "/master/redirect":
+            return self.redirect("//{0}".format(leader.address))
+        if self.path == "/":
+            return self.respond(200, "text/html", b"<html></html>")
+        if self.server is not leader:
+            return self.redirect("//{0}{1}".format(leader.address, self.path))
+        return self.respond(200, "application/json", json.dumps({"slaves": []}).encode("utf-8"))
+
+    def redirect(self, location):
+        self.send_response(307)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def respond(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMesosCluster(object):
+    def __init__(self, size=2):
+        self.leader = None
+        self.masters = [FakeMesosMaster(self) for _ in range(size)]
+        self.leader = self.masters[-1]
+
+    def redirects(self):
+        return sum(master.requests.count("/master/redirect") for master in self.masters)
+
+    def stop(self):
+        for master in self.masters:
+            master.stop()
+
+
+@pytest.fixture
+def cluster():
+    fake_cluster = FakeMesosCluster()
+    yield fake_cluster
+    fake_cluster.stop()
+
+
+def test_leader_is_resolved_once(cluster):
+    mesos = MesosMaster("http://{0}".format(cluster.masters[0].address))
+    for _ in range(3):
+        assert mesos.get_slaves() == {"slaves": []}
+    assert cluster.redirects() == 1
+    assert cluster.leader.requests.count("/master/slaves") == 3
+    assert mesos.uri == "http://{0}".format(cluster.leader.address)
+
+
+def test_zero_ttl_resolves_every_call(cluster):
+    mesos = MesosMaster("http://{0}".format(cluster.masters[0].address), leader_ttl=0)
+    mesos.get_slaves()
+    mesos.get_slaves()
+    assert cluster.redirects() == 2
+
+
+def test_leader_change_invalidates_cache(cluster):
+    mesos = MesosMaster("http://{0}".format(cluster.masters[0].address))
+    mesos.get_slaves()
+    cluster.leader = cluster.masters[0]
+
+    # the former leader redirects the call; the answer still comes from the new leader
+    assert mesos.get_slaves() == {"slaves": []}
+    assert mesos.leader_uri is None
+    mesos.get_slaves()
+    assert cluster.redirects() == 2
+    assert mesos.uri == "http://{0}".format(cluster.masters[0].address)
+
+
+def test_unreachable_leader_invalidates_cache(cluster):
+    mesos = MesosMaster("http://{0}".format(cluster.masters[0].address))
+    mesos.get_slaves()
+    former_leader = cluster.leader
+    cluster.leader = cluster.masters[0]
+    former_leader.stop()
+    cluster.masters.remove(former_leader)
+
+    assert mesos.get_slaves() is None
+    assert mesos.leader_uri is None
+    assert mesos.get_slaves() == {"slaves": []}
@@ -0,0 +1,172 @@
+import os
+import sys
+from argparse import Namespace
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+from poller import Poller
+import settings
+
+
+@pytest.fixture(scope="session")
+def testsettings():
+    fake_settings = dict(sleep_interval=5,
+                         mesos_uri="http://localhost:5050",
+                         mesos_leader_ttl=60,
+                         agent_port=5051,
+                         marathon_uri="http://localhost:8080",
+                         marathon_user=None,
+                         marathon_pass=None,
+                         marathon_events=False,
+                         marathon_resync_interval=300,
+                         cpu_fan_out=None,
+                         agent_timeout=5.0,
+                         single_scrape=True,
+                         numpy_aggregation=False,
+                         target_participating_agents=False,
+                         http_pool_size=10,
+                         http_connect_timeout=3.05,
+                         http_read_timeout=30,
+                         http_retries=2,
+                         http_retry_backoff=0.5,
+                         datadog_api_key=None,
+                         datadog_app_key=None,
+                         datadog_env=None,
+                         log_config="/app/logging_config.json",
+                         enforce_version_match=False,
+                         history_max_events=5000000,
+                         history_journal=None,
+                         history_journal_max_bytes=67108864,
+                         flap_signatures=None,
+                         flap_window=None,
+                         rules_cache_size=10000,
+                         numpy_rules=False,
+                         target_max_step=10,
+                         forecast_horizon="PT2M",
+                         forecast_alpha=0.5,
+                         forecast_beta=0.1,
+                         forecast_gamma=0.1,
+                         forecast_season=None,
+                         capacity_admission=False,
+                         queue_max_count=None,
+                         queue_max_delay=None,
+                         scale_concurrency=8,
+                         scale_rate=10,
+                         scale_burst=20,
+                         rules_prefix="mas_rule"
+                         )
+    for name, value in fake_settings.items():
+        setattr(settings, name, value)
+    return Namespace(**fake_settings)
+
+
+class fake_marathon_client():
+    def __init__(self):
+        self.embed = None
+
+    def get_all_apps(self, embed=None):
+        self.embed = embed
+        apps = [{"id": "/test-service", "instances": 2, "labels": {"use_marathon_autoscaler": "true"}},
+                {"id": "/other-service", "instances": 1, "labels": {}}]
+        if embed:
+            apps[0]["tasks"] = [{"id": "test-service.a", "host": "10.0.0.10"}]
+            apps[1]["tasks"] = [{"id": "other-service.a", "host": "10.0.0.11"}]
+        return {"apps": apps}
+
+
+class fake_mesos_client():
+    def get_slaves(self):
+        return {"slaves": [{"hostname": "10.0.0.10"}, {"hostname": "10.0.0.11"}]}
+
+
+class fake_collector():
+    def __init__(self, scrapes):
+        self.scrapes = list(scrapes)
+        self.agent_hosts = []
+
+    def collect(self, agent_hosts):
+        self.agent_hosts.append(agent_hosts)
+        return self.scrapes.pop(0)
+
+
+def executor(executor_id, cpu_secs, timestamp, rss=512):
+    return {"executor_id": executor_id,
+            "statistics": {"cpus_user_time_secs": cpu_secs,
+                           "cpus_system_time_secs": 0.0,
+                           "timestamp": timestamp,
+                           "mem_limit_bytes": 1024,
+                           "mem_rss_bytes": rss}}
+
+
+@pytest.fixture
+def poller(testsettings):
+    return Poller(testsettings)
+
+
+def test_single_scrape_rolling_differentials(poller):
+    poller.collector = fake_collector([
+        {"10.0.0.10": [executor("test-service.a", 10.0, 100.0)],
+         "10.0.0.11": [executor("test-service.b", 20.0, 100.0)]},
+        {"10.0.0.10": [executor("test-service.a", 15.0, 110.0)],
+         "10.0.0.11": [executor("test-service.b", 21.0, 110.0, rss=256)]},
+    ])
+    assert poller.poll(fake_mesos_client(), fake_marathon_client()) == {}
+
+    summary = poller.poll(fake_mesos_client(), fake_marathon_client())["test-service"]
+    assert summary["cpu_avg_usage"] == pytest.approx(30.0)
+    assert summary["max_cpu"] == (pytest.approx(50.0), "test-service.a", "10.0.0.10")
+    assert summary["memory_avg_usage"] == pytest.approx(37.5)
+    assert summary["application_definition"]["id"] == "/test-service"
+
+
+def test_single_scrape_executor_churn(poller):
+    poller.collector = fake_collector([
+        {"10.0.0.10": [executor("test-service.a", 10.0, 100.0),
+                       executor("test-service.gone", 10.0, 100.0)]},
+        {"10.0.0.10": [executor("test-service.a", 2.0, 110.0),
+                       executor("test-service.new", 5.0, 110.0)]},
+        {"10.0.0.10": [executor("test-service.a", 3.0, 120.0),
+                       executor("test-service.new", 6.0, 120.0)]},
+    ])
+    poller.poll(fake_mesos_client(), fake_marathon_client())
+    # "a" restarted and reset its counters, "new" has no baseline yet and "gone" disappeared
+    assert poller.poll(fake_mesos_client(), fake_marathon_client()) == {}
+    assert "test-service.gone" not in poller.executor_snapshot
+
+    metrics = poller.poll(fake_mesos_client(), fake_marathon_client())["test-service"]["executor_metrics"]
+    assert sorted(metric["executor_id"] for metric in metrics) == ["test-service.a", "test-service.new"]
+    assert all(metric["cpu_total_usage"] == pytest.approx(10.0) for metric in metrics)
+
+
+def test_target_participating_agents(poller):
+    poller.target_participating_agents = True
+    poller.collector = fake_collector([{"10.0.0.10": [executor("test-service.a", 10.0, 100.0)]}])
+    marathon_client = fake_marathon_client()
+    poller.poll(fake_mesos_client(), marathon_client)
+    assert marathon_client.embed == "apps.tasks"
+    assert poller.collector.agent_hosts == [["10.0.0.10"]]
+
+
+def test_no_targeting_while_exporting_metrics(poller):
+    poller.target_participating_agents = True
+    poller.datadog_client.enabled = True
+    poller.collector = fake_collector([{}])
+    marathon_client = fake_marathon_client()
+    poller.poll(fake_mesos_client(), marathon_client)
+    assert marathon_client.embed is None
+    assert poller.collector.agent_hosts == [["10.0.0.10", "10.0.0.11"]]
+
+
+def test_malformed_capacity_does_not_abort_the_poll(poller):
+    class malformed_mesos_client(fake_mesos_client):
+        def get_slaves(self):
+            return {"slaves": [{"hostname": "10.0.0.10", "resources": "cpus:4;mem:4096"}]}
+
+    poller.auto_scaler.capacity_admission = True
+    poller.auto_scaler.capacity.update([{"hostname": "10.0.0.11", "resources": {"cpus": 4, "mem": 4096}}])
+    poller.collector = fake_collector([{"10.0.0.10": [executor("test-service.a", 10.0, 100.0)]}])
+    assert poller.poll(malformed_mesos_client(), fake_marathon_client()) == {}
+    assert poller.collector.agent_hosts == [["10.0.0.10"]]
+    # scale-ups are not admitted against a model that could not be brought up to date
+    assert not poller.auto_scaler.capacity.known
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from application_definition import ApplicationDefinition
+from rule_metrics import required_counters, rule_metrics, RULE_METRICS
+from rules_manager import RulesManager
+from scaler import AutoScaler
+import settings
+
+
+@pytest.fixture(scope="module")
+def testsettings():
+    settings.rules_prefix = "mas_rule"
+    settings.enforce_version_match = False
+
+
+@pytest.fixture
+def metrics_summary():
+    return dict(cpu_avg_usage=50.0,
+                max_cpu=(90.0, "app.1", "h1"),
+                memory_avg_usage=40.0,
+                max_memory=(60.0, "app.2", "h2"),
+                executor_metrics=[dict(executor_id="app.1", timestamp=10.0, cpu_total_usage=90.0,
+                                       memory_total_usage=20.0, cpus_throttled_time_secs=5.0, net_rx_bytes=1000),
+                                  dict(executor_id="app.2", timestamp=5.0, cpu_total_usage=10.0,
+                                       memory_total_usage=60.0, cpus_throttled_time_secs=0.0, net_rx_bytes=1000)])
+
+
+def test_rule_metrics(metrics_summary):
+    app_def = ApplicationDefinition(tasksRunning=2)
+    metrics = rule_metrics(metrics_summary, app_def, RULE_METRICS.keys())
+    assert metrics["cpu"] == 50.0 and metrics["mem"] == 40.0
+    assert metrics["cpu_max"] == 90.0 and metrics["mem_max"] == 60.0
+    assert metrics["cpu_p95"] == pytest.approx(86.0)
+    assert metrics["mem_p95"] == pytest.approx(58.0)
+    assert metrics["cpu_throttled"] == pytest.approx(25.0)
+    assert metrics["net_rx_rate"] == pytest.approx(300.0)
+    assert metrics["instances_running"] == 2
+
+
+def test_rule_metrics_are_computed_on_demand(metrics_summary):
+    app_def = ApplicationDefinition(tasksRunning=2)
+    assert rule_metrics(metrics_summary, app_def, ["cpu", "unknown"]) == dict(cpu=50.0)
+    for executor in metrics_summary["executor_metrics"]:
+        del executor["net_rx_bytes"]
+    assert rule_metrics(metrics_summary, app_def, ["net_rx_rate"]) == dict(net_rx_rate=None)
+    assert required_counters(["cpu", "cpu_throttled", "net_rx_rate"]) == ("cpus_throttled_time_secs", "net_rx_bytes")
+    assert required_counters(["cpu", "mem_p95"]) == ()
+
+
+def test_rules_reference_extended_metrics(testsettings):
+    labels = dict(use_marathon_autoscaler="True", min_instances="1", max_instances="5",
+                  mas_rule_throttled_1="cpu_throttled | >20 | PT1M | 1 | PT1M",
+                  mas_rule_throttled_2="instances_running | <5 | PT1M | 1 | PT1M",
+                  mas_rule_unknown_1="cpu_steal | >20 | PT1M | 1 | PT1M")
+    app_def = dict(id="/app", version="1", instances=2, tasksRunning=2, labels=labels)
+    rm = RulesManager(ApplicationDefinition(app_def))
+    assert sorted(rm.rules) == ["throttled"]
+    assert rm.compiled.metrics == frozenset(["cpu_throttled", "instances_running"])
+
+    auto_scaler = AutoScaler(None)
+    assert auto_scaler.required_counters() == ()
+    auto_scaler.decide({"app": dict(application_definition=app_def, cpu_avg_usage=50.0, memory_avg_usage=40.0,
+                                    executor_metrics=[dict(timestamp=10.0, cpus_throttled_time_secs=5.0)])})
+    assert auto_scaler.required_counters() == ("cpus_throttled_time_secs",)
+    assert auto_scaler.hm.app_histories["app"].votes[-1] == 1
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+from datetime import timedelta
 
 import pytest
 
@@ -8,7 +9,7 @@ import pytest
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
 
 from application_definition import ApplicationDefinition
-from rules_manager import RulesManager
+from rules_manager import compile_rules, RulesCache, RulesManager, track_targets
 import settings
 
 
@@ -81,3 +82,95 @@ def test_triggering_fastscaleup_rules(rules_mgr):
     triggered_rules = rules_mgr.trigger_rules(fake_metrics)
     for rule in triggered_rules:
         assert ("fastscaleup" in rule.get("ruleInfo").get("ruleName"))
+
+
+def test_triggering_rules_by_provided_metric_names(rules_mgr):
+    triggered_rules = rules_mgr.trigger_rules(dict(cpu=97, mem=89))
+    assert len(triggered_rules) == 2
+    for rule in triggered_rules:
+        assert ("fastscaleup" in rule.get("ruleInfo").get("ruleName"))
+
+
+def test_compiled_rule_parts(rules_mgr):
+    rule_part = next(rule_part for rule_part in rules_mgr.rules["fastscaleup"] if rule_part.metric == "cpu")
+    assert rule_part.threshold == 90.0
+    assert rule_part.operator(91, rule_part.threshold) and not rule_part.operator(90, rule_part.threshold)
+    assert rule_part.tolerance == timedelta(minutes=2)
+    assert rule_part.backoff == timedelta(seconds=90)
+    assert rule_part.scale_factor == 3
+    assert rules_mgr.compiled.retention == timedelta(minutes=2)
+
+    rules_mgr.trigger_rules(dict(cpu=97, mem=89))
+    assert rules_mgr.last_triggered_criteria == dict(scale_factor=3,
+                                                     tolerance=timedelta(minutes=2),
+                                                     backoff=timedelta(seconds=90))
+
+
+def test_rules_cache(testsettings, app_def):
+    cache = RulesCache(size=2)
+    compiled = RulesManager(ApplicationDefinition(app_def), rules_cache=cache).compiled
+    assert RulesManager(ApplicationDefinition(app_def), rules_cache=cache).compiled is compiled
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    redeployed = dict(app_def, version="2017-02-01T00:00:00.000Z")
+    assert RulesManager(ApplicationDefinition(redeployed), rules_cache=cache).compiled is not compiled
+    RulesManager(ApplicationDefinition(dict(app_def, id="/other-service")), rules_cache=cache)
+    assert len(cache) == 2
+    assert (app_def["id"], app_def["version"]) not in cache.entries
+
+
+def test_malformed_rules_are_disregarded(testsettings, app_def):
+    labels = dict(app_def["labels"], mas_rule_broken_1="cpu | =>90 | PT2M | 3 | PT1M30S",
+                  mas_rule_unparseable_1="cpu | >90 | two minutes | 3 | PT1M30S")
+    rules_mgr = RulesManager(ApplicationDefinition(dict(app_def, labels=labels)))
+    assert sorted(rules_mgr.rules) == ["fastscaleup", "slowscaledown"]
+
+
+def test_triggering_rules_by_weight(testsettings, app_def):
+    labels = dict(app_def["labels"], mas_rule_heavyscaleup_1="cpu | >95 | PT2M | 2 | PT1M30S | 5",
+                  mas_rule_heavyscaleup_2="memory | >85 | PT2M | 2 | PT1M30S | 5")
+    rules_mgr = RulesManager(ApplicationDefinition(dict(app_def, labels=labels)))
+    triggered_rules = rules_mgr.trigger_rules(dict(cpu=97, mem=89))
+    assert set(rule.get("ruleInfo").get("ruleName") for rule in triggered_rules) == {"heavyscaleup"}
+    assert rules_mgr.last_triggered_criteria.get("scale_factor") == 2
+
+
+def test_compiled_target_rules(testsettings):
+    labels = dict(min_instances="2", max_instances="20",
+                  mas_rule_cputarget="cpu | target=60 | PT2M | 3 | PT5M",
+                  mas_rule_memtarget="memory | target=75.5",
+                  mas_rule_broken="cpu | target=0",
+                  mas_rule_cpuhigh="cpu | >90 | PT1M | 1 | PT1M")
+    compiled = compile_rules(ApplicationDefinition(id="/app", version="1", labels=labels))
+    assert sorted(compiled.rules) == ["cpuhigh"]
+    cpu_target, mem_target = compiled.targets
+    assert (cpu_target.metric, cpu_target.target, cpu_target.max_step) == ("cpu", 60.0, 3)
+    assert (cpu_target.tolerance, cpu_target.backoff) == (timedelta(minutes=2), timedelta(minutes=5))
+    assert (mem_target.metric, mem_target.target, mem_target.max_step) == ("mem", 75.5, None)
+    assert (mem_target.tolerance, mem_target.backoff) == (timedelta(minutes=1), timedelta(minutes=1))
+    assert compiled.metrics == frozenset(["cpu", "mem"])
+    assert compiled.retention == timedelta(minutes=5)
+
+
+def test_track_targets(testsettings):
+    labels = dict(min_instances="2", max_instances="20", mas_rule_cputarget="cpu | target=50")
+    compiled = compile_rules(ApplicationDefinition(id="/app", version="1", labels=labels))
+
+    def scale_factor(metrics, instances, max_step=None):
+        rule = track_targets(compiled, metrics, instances, max_step)
+        return rule[0].scale_factor if rule is not None else 0
+
+    assert scale_factor(dict(cpu=100.0), 4) == 4
+    assert scale_factor(dict(cpu=51.0), 10) == 0
+    assert scale_factor(dict(cpu=56.0), 10) == 2
+    assert scale_factor(dict(cpu=20.0), 10) == -6
+    assert scale_factor(dict(cpu=1.0), 10) == -8
+    assert scale_factor(dict(cpu=100.0), 15) == 5
+    assert scale_factor(dict(cpu=100.0), 4, max_step=2) == 2
+    assert scale_factor(dict(cpu=None), 4) == 0
+
+    labels["mas_rule_memtarget"] = "mem | target=50 | PT1M | 1"
+    compiled = compile_rules(ApplicationDefinition(id="/app", version="1", labels=labels))
+    assert scale_factor(dict(cpu=20.0, mem=50.0), 10) == 0
+    assert scale_factor(dict(cpu=20.0, mem=10.0), 10) == -1
+    assert scale_factor(dict(cpu=100.0, mem=10.0), 4) == 4
@@ -0,0 +1,68 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from application_definition import ApplicationDefinition
+from rules_evaluator import RulesEvaluator, np
+from rules_manager import compile_rules, RulesManager
+import settings
+
+OPERATORS = (">", ">=", "<", "<=", "=", "==")
+
+
+@pytest.fixture(scope="module")
+def testsettings():
+    settings.rules_prefix = "mas_rule"
+
+
+def random_app(rnd, index):
+    labels = dict(min_instances="1", max_instances="10")
+    for rule in range(rnd.randint(0, 4)):
+        weight = rnd.choice(["", " | 1", " | 2.5"])
+        for part in range(rnd.randint(1, 3)):
+            labels["mas_rule_rule{0}_{1}".format(rule, part)] = "{0} | {1}{2} | PT1M | {3} | PT2M{4}".format(
+                rnd.choice(["cpu", "mem", "memory"]), rnd.choice(OPERATORS), rnd.choice([20, 50, 80]),
+                rnd.choice([-2, -1, 1, 2]), weight)
+    return ApplicationDefinition(id="/app-{0}".format(index), version="1", labels=labels)
+
+
+def random_metrics(rnd):
+    return dict(cpu=rnd.choice([None, 20.0, 50.0, 80.0, rnd.uniform(0, 100)]),
+                mem=rnd.choice([20.0, 50.0, 80.0, rnd.uniform(0, 100)]))
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_evaluator_matches_rules_manager(testsettings, use_numpy):
+    if use_numpy and np is None:
+        pytest.skip("NumPy is not installed")
+    rnd = random.Random(7)
+    evaluator = RulesEvaluator(use_numpy=use_numpy)
+    for cycle in range(3):
+        app_defs = [random_app(rnd, index) for index in range(200)]
+        metrics = [random_metrics(rnd) for _ in app_defs]
+        rules_managers = [RulesManager(app_def) for app_def in app_defs]
+        matched = evaluator.evaluate([rm.compiled for rm in rules_managers], metrics)
+        for rm, app_metrics, matched_rule in zip(rules_managers, metrics, matched):
+            rm.trigger_rules(app_metrics)
+            assert rm.last_triggered_rule == (None if matched_rule is None else
+                                              [rule_part.definition for rule_part in matched_rule])
+        assert any(matched) and not all(matched)
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_evaluator_precedence(testsettings, use_numpy):
+    if use_numpy and np is None:
+        pytest.skip("NumPy is not installed")
+    labels = dict(mas_rule_light_1="cpu | >50 | PT1M | 1 | PT1M",
+                  mas_rule_heavy_1="cpu | >50 | PT1M | 1 | PT1M | 3",
+                  mas_rule_both_1="cpu | >80 | PT1M | 1 | PT1M",
+                  mas_rule_both_2="mem | >80 | PT1M | 1 | PT1M")
+    compiled = compile_rules(ApplicationDefinition(id="/app", version="1", labels=labels))
+    matched = RulesEvaluator(use_numpy=use_numpy).evaluate(
+        [compiled] * 3, [dict(cpu=90, mem=90), dict(cpu=90, mem=10), dict(cpu=10, mem=90)])
+    assert [rule[0].rule_name if rule else None for rule in matched] == ["both", "heavy", None]
+    assert RulesEvaluator(use_numpy=use_numpy).evaluate([], []) == []
@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "marathon_autoscaler"))
+
+from scale_dispatcher import ScaleAction, ScaleDispatcher, TokenBucket, is_scaled
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class SlowMarathonClient(object):
+    def __init__(self, delay=0.05, statuses=None):
+        self.delay = delay
+        self.statuses = statuses or {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.scaled = []
+
+    def scale_app(self, app_id, instances, with_status=False):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+            self.scaled.append((app_id, instances))
+        if app_id == "/broken":
+            raise ValueError("connection reset")
+        return self.statuses.get(app_id, 200), {"deploymentId": app_id}
+
+
+def actions(count):
+    return [ScaleAction("/app-{0}".format(index), "app-{0}".format(index), index, 0)
+            for index in range(count)]
+
+
+def test_token_bucket_bursts_then_limits_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock.time, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    clock.now += 10
+    # idle time refills the bucket up to the burst only
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_dispatch_is_concurrent_and_bounded():
+    client = SlowMarathonClient(delay=0.05)
+    dispatcher = ScaleDispatcher(client, concurrency=4, rate=0)
+    try:
+        started = time.time()
+        outcomes = dispatcher.dispatch(actions(12))
+        elapsed = time.time() - started
+    finally:
+        dispatcher.close()
+    assert client.max_in_flight == 4
+    assert elapsed < 12 * 0.05
+    assert [(outcome.app_id, outcome.instances) for outcome in outcomes] == \
+        [(action.app_id, action.instances) for action in actions(12)]
+    assert all(is_scaled(outcome) and outcome.latency >= 0.04 for outcome in outcomes)
+
+
+def test_dispatch_is_rate_limited():
+    client = SlowMarathonClient(delay=0)
+    dispatcher = ScaleDispatcher(client, concurrency=4, rate=50, burst=2)
+    try:
+        started = time.time()
+        outcomes = dispatcher.dispatch(actions(7))
+        elapsed = time.time() - started
+    finally:
+        dispatcher.close()
+    # two requests go out at once, the other five wait for the rate of 50 per second
+    assert elapsed >= 5 / 50.0 * 0.9
+    assert sum(outcome.throttled > 0 for outcome in outcomes) >= 5
+
+
+def test_dispatch_reports_failures():
+    client = SlowMarathonClient(delay=0, statuses={"/conflict": 409})
+    dispatcher = ScaleDispatcher(client, rate=0)
+    try:
+        outcomes = dispatcher.dispatch([ScaleAction("/ok", "ok", 2, 0),
+                                        ScaleAction("/conflict", "conflict", 3, 0),
+                                        ScaleAction("/broken", "broken", 4, 0)])
+    finally:
+        dispatcher.close()
+    assert [(outcome.app_name, outcome.status, is_scaled(outcome)) for outcome in outcomes] == \
+        [("ok", 200, True), ("conflict", 409, False), ("broken", None, False)]
+    assert dispatcher.dispatch([]) == []